@@ -0,0 +1,58 @@
+import mysql.connector
+from mysql.connector import Error
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+def add_device_columns():
+    """Add device_id/seq columns and the deduplication index to soil_data"""
+    connection = None
+    try:
+        # Database connection using environment variables
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            database=os.getenv('DB_NAME', 'soil_db'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', 'your_password')
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            cursor.execute("SHOW COLUMNS FROM soil_data LIKE 'device_id'")
+            if cursor.fetchone():
+                print("✅ device_id column already exists")
+            else:
+                cursor.execute("ALTER TABLE soil_data ADD COLUMN device_id VARCHAR(64) NULL")
+                print("✅ Added device_id column")
+
+            cursor.execute("SHOW COLUMNS FROM soil_data LIKE 'seq'")
+            if cursor.fetchone():
+                print("✅ seq column already exists")
+            else:
+                cursor.execute("ALTER TABLE soil_data ADD COLUMN seq BIGINT UNSIGNED NULL")
+                print("✅ Added seq column")
+
+            # Existing rows have NULL device_id/seq, which a UNIQUE index allows
+            cursor.execute("SHOW INDEX FROM soil_data WHERE Key_name = 'uq_device_seq'")
+            if cursor.fetchall():
+                print("✅ uq_device_seq index already exists")
+            else:
+                cursor.execute("ALTER TABLE soil_data ADD UNIQUE KEY uq_device_seq (device_id, seq)")
+                print("✅ Added uq_device_seq unique index")
+
+            connection.commit()
+
+    except Error as e:
+        print(f"❌ Error: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("🔌 MySQL connection closed")
+
+if __name__ == "__main__":
+    print("🔧 Adding deduplication columns to soil_data table...")
+    add_device_columns()
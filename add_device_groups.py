@@ -0,0 +1,84 @@
+import mysql.connector
+from mysql.connector import Error
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Same definitions as database_setup.sql
+TABLES = {
+    "device_groups": """
+        CREATE TABLE device_groups (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            name VARCHAR(64) NOT NULL,
+            kind VARCHAR(5) NOT NULL,
+            parent_id INT NULL,
+            INDEX idx_group_parent (parent_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    "devices": """
+        CREATE TABLE devices (
+            device_id VARCHAR(64) NOT NULL PRIMARY KEY,
+            group_id INT NULL,
+            name VARCHAR(64) NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+    "group_rollup_hourly": """
+        CREATE TABLE group_rollup_hourly (
+            group_id INT NOT NULL,
+            bucket DATETIME NOT NULL,
+            samples INT NOT NULL,
+            relay_on INT NOT NULL,
+            {aggregates},
+            PRIMARY KEY (group_id, bucket)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4""",
+}
+SENSOR_FIELDS = ("nitrogen", "phosphorus", "potassium", "ph", "ec", "humidity", "temperature")
+AGGREGATES = ", ".join(
+    [f"{field}_{agg} DOUBLE" for field in SENSOR_FIELDS for agg in ("sum", "sumsq", "min", "max")]
+    + [f"{field}_count INT NOT NULL DEFAULT 0" for field in SENSOR_FIELDS]
+)
+
+def add_device_groups():
+    """Create the device group tables and add group_id to relay_events"""
+    connection = None
+    try:
+        # Database connection using environment variables
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            database=os.getenv('DB_NAME', 'soil_db'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', 'your_password')
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            for table, statement in TABLES.items():
+                cursor.execute("SHOW TABLES LIKE %s", (table,))
+                if cursor.fetchone():
+                    print(f"✅ {table} table already exists")
+                else:
+                    cursor.execute(statement.format(aggregates=AGGREGATES))
+                    print(f"✅ Created {table} table")
+
+            cursor.execute("SHOW COLUMNS FROM relay_events LIKE 'group_id'")
+            if cursor.fetchone():
+                print("✅ relay_events.group_id column already exists")
+            else:
+                cursor.execute("ALTER TABLE relay_events ADD COLUMN group_id INT NULL, "
+                               "ADD INDEX idx_relay_event_group (group_id)")
+                print("✅ Added relay_events.group_id column")
+
+            connection.commit()
+
+    except Error as e:
+        print(f"❌ Error: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("🔌 MySQL connection closed")
+
+if __name__ == "__main__":
+    print("🔧 Adding device group tables...")
+    add_device_groups()
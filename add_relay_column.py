@@ -27,7 +27,7 @@ def add_relay_column():
                 return
             
             # Add relay column
-            alter_query = "ALTER TABLE soil_data ADD COLUMN relay VARCHAR(10) DEFAULT 'OFF'"
+            alter_query = "ALTER TABLE soil_data ADD COLUMN relay ENUM('OFF', 'ON') NOT NULL DEFAULT 'OFF'"
             cursor.execute(alter_query)
             connection.commit()
             
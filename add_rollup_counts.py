@@ -0,0 +1,47 @@
+# add_rollup_counts.py
+"""
+One-shot migration adding per-field value counts to the rollup tables.
+
+Rollup means now divide each field's sum by its own count instead of the
+bucket's sample count, so hours that mix first-generation readings (no pH
+or EC) with full ones keep correct pH and EC means. This adds
+`<field>_count` to soil_rollup_hourly and group_rollup_hourly and fills it
+from the existing rows: `samples` wherever the field has a sum, else 0.
+That is exact for device rollups, which never mix readings with and
+without a field. Group hours already merged into NULL by a legacy member
+before this fix stay NULL for that field. Safe to rerun.
+
+Usage: python add_rollup_counts.py
+"""
+from sqlalchemy import inspect, text
+
+from models import SENSOR_FIELDS
+from rollups import group_rollup_hourly, soil_rollup_hourly
+from server import engine
+
+
+def add_counts(table):
+    existing = {column["name"] for column in inspect(engine).get_columns(table.name)}
+    pending = [field for field in SENSOR_FIELDS if f"{field}_count" not in existing]
+    if not pending:
+        print(f"✅ {table.name} already has per-field counts")
+        return
+    with engine.begin() as conn:
+        # One column per statement: SQLite's ALTER TABLE adds a single column
+        for field in pending:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {field}_count INT NOT NULL DEFAULT 0"))
+        assignments = ", ".join(
+            f"{field}_count = CASE WHEN {field}_sum IS NULL THEN 0 ELSE samples END" for field in pending
+        )
+        conn.execute(text(f"UPDATE {table.name} SET {assignments}"))
+    print(f"✅ Added {', '.join(f'{field}_count' for field in pending)} to {table.name}")
+
+
+if __name__ == "__main__":
+    print("🚀 Adding per-field counts to the rollup tables...")
+    for table in (soil_rollup_hourly, group_rollup_hourly):
+        if inspect(engine).has_table(table.name):
+            add_counts(table)
+        else:
+            print(f"ℹ️ {table.name} does not exist yet; it is created with the counts")
+    print("🎉 Done")
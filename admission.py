@@ -0,0 +1,179 @@
+# admission.py
+"""
+Admission control for the shared water supply.
+
+Without it every node switches its pump on by itself as soon as its soil
+is drier than HUMIDITY_THRESHOLD, and scheduled runs start every pump of
+a group together. With a budget configured (ADMISSION_MAX_PUMPS and/or
+ADMISSION_LITRES_PER_HOUR, the latter divided by the pump flow), the
+server decides instead, at each device's `/relay-status` poll:
+
+- A device asks for water when a scheduled run for it is ON, or when it
+  is in auto mode and its latest reading is below HUMIDITY_THRESHOLD. A
+  device already watering keeps asking until it reaches the threshold
+  plus HUMIDITY_HYSTERESIS, the same band the sketch uses.
+- Requests wait in a priority queue (driest soil first, then the oldest
+  request). The device is told "manual off" while it waits and "manual
+  on" once it is granted one of the pump slots.
+- When a device stops asking, its slot goes to the head of the queue.
+  It then gets its usual command back, and "auto off" switches the pump
+  off.
+- A manual command bypasses the budget.
+
+Each decision is a dictionary lookup plus at most a heap push or pop.
+Grants are leases renewed by every poll: a device that stops polling
+loses its slot after ADMISSION_LEASE_SECONDS, and queued devices that
+have gone quiet are skipped when their turn comes.
+"""
+import heapq
+import itertools
+import os
+import threading
+
+from metrics import metrics
+from relay import PUMP_FLOW_LITRES_PER_MINUTE
+
+HUMIDITY_THRESHOLD = float(os.getenv("HUMIDITY_THRESHOLD", "25.0"))  # same as the sketch
+HUMIDITY_HYSTERESIS = 10.0
+ADMISSION_MAX_PUMPS = int(os.getenv("ADMISSION_MAX_PUMPS", "0"))  # 0: no limit
+ADMISSION_LITRES_PER_HOUR = float(os.getenv("ADMISSION_LITRES_PER_HOUR", "0"))  # 0: no limit
+ADMISSION_LEASE_SECONDS = float(os.getenv("ADMISSION_LEASE_SECONDS", "120"))
+
+GRANTED = {"id": None, "command": "ON", "mode": "manual"}
+HELD = {"id": None, "command": "OFF", "mode": "manual"}
+
+
+def pump_slots(max_pumps=ADMISSION_MAX_PUMPS, litres_per_hour=ADMISSION_LITRES_PER_HOUR,
+               flow_lpm=PUMP_FLOW_LITRES_PER_MINUTE):
+    """Pumps that may run at once under both budgets (None: no limit)"""
+    limits = []
+    if max_pumps > 0:
+        limits.append(max_pumps)
+    if litres_per_hour > 0:
+        pumps = int(litres_per_hour // (flow_lpm * 60))
+        if pumps < 1:
+            # Every request would wait forever; refuse to start instead
+            raise ValueError(
+                f"ADMISSION_LITRES_PER_HOUR={litres_per_hour:g} is less than one pump's "
+                f"{flow_lpm * 60:g} L/h (PUMP_FLOW_LITRES_PER_MINUTE={flow_lpm:g}); "
+                "raise it or set it to 0 for no limit"
+            )
+        limits.append(pumps)
+    return min(limits) if limits else None
+
+
+class AdmissionController:
+    """Pump slots granted in priority order, decided per relay poll"""
+
+    def __init__(self, slots=None, lease_seconds=ADMISSION_LEASE_SECONDS):
+        self.slots = pump_slots() if slots is None else slots
+        if self.slots is not None and self.slots < 1:
+            raise ValueError("An admission budget needs at least one pump slot")
+        self.lease = lease_seconds
+        self._lock = threading.Lock()
+        self._humidity = {}  # device_id -> (timestamp, humidity) of the latest reading
+        self._queue = []     # (humidity, requested_at, tie-breaker, device_id)
+        self._queued = {}    # device_id -> (tie-breaker, source, requested_at) of its live queue entry
+        self._granted = {}   # device_id -> {"source", "since", "expires"}
+        self._leases = []    # (expires, device_id); stale once the grant is renewed or released
+        self._last_poll = {}
+        self._order = itertools.count()
+
+    @property
+    def enabled(self):
+        return self.slots is not None
+
+    def observe(self, device_id, rows):
+        """Ingest listener: keep each device's latest humidity"""
+        newest = max(rows, key=lambda row: row["timestamp"])
+        if newest.get("humidity") is None:
+            return
+        with self._lock:
+            current = self._humidity.get(device_id)
+            if current is None or current[0] <= newest["timestamp"]:
+                self._humidity[device_id] = (newest["timestamp"], newest["humidity"])
+
+    def _source(self, device_id, command):
+        """Why a device wants water under its current command, or None"""
+        if command["mode"] == "schedule" and command["command"] == "ON":
+            return "schedule"
+        reading = self._humidity.get(device_id)
+        if reading is None:
+            return None
+        limit = HUMIDITY_THRESHOLD + HUMIDITY_HYSTERESIS if device_id in self._granted else HUMIDITY_THRESHOLD
+        return "threshold" if reading[1] < limit else None
+
+    def decide(self, device_id, command, now):
+        """The command to send a polling device whose own command is `command`"""
+        if not self.enabled:
+            return command
+        with self._lock:
+            self._last_poll[device_id] = now
+            self._expire(now)
+            source = None if command["mode"] == "manual" else self._source(device_id, command)
+            if source is None:
+                self._release(device_id, now)
+                return command
+            grant = self._granted.get(device_id)
+            if grant is not None:
+                grant["expires"] = now.timestamp() + self.lease
+                heapq.heappush(self._leases, (grant["expires"], device_id))
+                return GRANTED
+            if device_id not in self._queued:
+                humidity = self._humidity.get(device_id, (None, 0.0))[1]
+                tie = next(self._order)
+                self._queued[device_id] = (tie, source, now)
+                heapq.heappush(self._queue, (humidity, now, tie, device_id))
+                metrics.inc("admission_queued", source=source)
+            self._fill(now)
+            return GRANTED if device_id in self._granted else HELD
+
+    def _release(self, device_id, now):
+        self._queued.pop(device_id, None)  # its heap entry is skipped when popped
+        if self._granted.pop(device_id, None) is not None:
+            metrics.inc("admission_released")
+            self._fill(now)
+
+    def _expire(self, now):
+        """Take back the slots of granted devices that stopped polling"""
+        expired = False
+        while self._leases and self._leases[0][0] <= now.timestamp():
+            expires, device_id = heapq.heappop(self._leases)
+            grant = self._granted.get(device_id)
+            if grant is not None and grant["expires"] == expires:
+                del self._granted[device_id]
+                metrics.inc("admission_expired")
+                expired = True
+        if expired:
+            self._fill(now)
+
+    def _fill(self, now):
+        """Grant free slots to the head of the queue"""
+        while len(self._granted) < self.slots and self._queue:
+            _, requested_at, tie, device_id = heapq.heappop(self._queue)
+            entry = self._queued.get(device_id)
+            if entry is None or entry[0] != tie:
+                continue
+            del self._queued[device_id]
+            if (now - self._last_poll[device_id]).total_seconds() > self.lease:
+                metrics.inc("admission_abandoned")
+                continue
+            expires = now.timestamp() + self.lease
+            self._granted[device_id] = {"source": entry[1], "since": now, "expires": expires}
+            heapq.heappush(self._leases, (expires, device_id))
+            metrics.inc("admission_granted", source=entry[1])
+            metrics.observe("admission_wait_seconds", (now - requested_at).total_seconds())
+
+    def status(self):
+        """Budget, granted devices and queue length"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slots": self.slots,
+                "in_use": len(self._granted),
+                "queued": len(self._queued),
+                "granted": [
+                    {"device_id": device_id, "source": grant["source"], "since": grant["since"]}
+                    for device_id, grant in sorted(self._granted.items())
+                ],
+            }
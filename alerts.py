@@ -0,0 +1,183 @@
+# alerts.py
+"""
+Threshold alert rules evaluated on ingest.
+
+Rules are stored in the `alert_rules` table and kept in memory in an index
+keyed by device and then parameter, so a reading only visits the rules
+that apply to its own device (plus fleet-wide rules). The cost per reading
+does not grow with the number of rules defined for other devices.
+
+Noisy sensors are handled with two knobs per rule:
+
+- debounce: the value has to breach the threshold on N consecutive
+  readings before the rule fires
+- hysteresis: once firing, the rule only resolves after the value is back
+  past the threshold by this margin (e.g. fire above 30 °C, clear below 29)
+"""
+import threading
+
+from models import SENSOR_FIELDS
+
+OPERATORS = (">", "<")
+CHANNELS = ("log", "webhook", "smtp")
+
+
+class Rule:
+    """In-memory copy of an alert_rules row"""
+
+    __slots__ = ("id", "device_id", "parameter", "operator", "threshold", "hysteresis",
+                 "debounce", "channel", "target")
+
+    def __init__(self, id, device_id, parameter, operator, threshold, hysteresis=0.0,
+                 debounce=1, channel="log", target=None):
+        if parameter not in SENSOR_FIELDS:
+            raise ValueError(f"Unknown parameter '{parameter}'")
+        if operator not in OPERATORS:
+            raise ValueError("Operator must be '>' or '<'")
+        if channel not in CHANNELS:
+            raise ValueError(f"Channel must be one of {', '.join(CHANNELS)}")
+        self.id = id
+        self.device_id = device_id
+        self.parameter = parameter
+        self.operator = operator
+        self.threshold = threshold
+        self.hysteresis = hysteresis or 0.0
+        self.debounce = max(1, debounce or 1)
+        self.channel = channel
+        self.target = target
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(row.id, row.device_id, row.parameter, row.operator, row.threshold,
+                   row.hysteresis, row.debounce, row.channel, row.target)
+
+    def breached(self, value):
+        return value > self.threshold if self.operator == ">" else value < self.threshold
+
+    def cleared(self, value):
+        if self.operator == ">":
+            return value <= self.threshold - self.hysteresis
+        return value >= self.threshold + self.hysteresis
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class RuleEngine:
+    """Index of rules by device and parameter, with debounce/hysteresis state"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = {}    # device_id (None = all devices) -> {parameter: [Rule]}
+        self._rules = {}    # rule id -> Rule
+        self._state = {}    # (rule id, device_id) -> [consecutive breaches, firing]
+
+    def load(self, rules):
+        with self._lock:
+            self._index.clear()
+            self._rules.clear()
+            self._state.clear()
+            for rule in rules:
+                self._insert(rule)
+
+    def add(self, rule):
+        with self._lock:
+            self._insert(rule)
+
+    def _insert(self, rule):
+        self._rules[rule.id] = rule
+        self._index.setdefault(rule.device_id, {}).setdefault(rule.parameter, []).append(rule)
+
+    def matching(self, device_id, parameter, operator):
+        """Ids of the rules for exactly this device (None = all devices), parameter and operator"""
+        with self._lock:
+            return [rule.id for rule in self._index.get(device_id, {}).get(parameter, ()) if rule.operator == operator]
+
+    def replace(self, rule, stale=()):
+        """Swap in a changed rule under its id, keeping its firing state; drop the `stale` ids"""
+        with self._lock:
+            old = self._rules.get(rule.id)
+            if old is not None:
+                self._index[old.device_id][old.parameter].remove(old)
+            self._insert(rule)
+        for rule_id in stale:
+            self.remove(rule_id)
+
+    def remove(self, rule_id):
+        with self._lock:
+            rule = self._rules.pop(rule_id, None)
+            if rule is None:
+                return False
+            by_parameter = self._index[rule.device_id]
+            by_parameter[rule.parameter].remove(rule)
+            if not by_parameter[rule.parameter]:
+                del by_parameter[rule.parameter]
+            if not by_parameter:
+                del self._index[rule.device_id]
+            for key in [key for key in self._state if key[0] == rule_id]:
+                del self._state[key]
+            return True
+
+    def rules(self):
+        with self._lock:
+            return list(self._rules.values())
+
+    def firing(self):
+        """(rule id, device_id) pairs currently firing"""
+        with self._lock:
+            return [key for key, (_, firing) in self._state.items() if firing]
+
+    def evaluate(self, device_id, reading):
+        """Check one reading; return alert events for rules that fired or resolved"""
+        events = []
+        with self._lock:
+            for scope in (device_id, None):
+                by_parameter = self._index.get(scope)
+                if not by_parameter:
+                    continue
+                for parameter, rules in by_parameter.items():
+                    value = reading[parameter]
+                    if value is None:
+                        continue  # the node has no such sensor
+                    for rule in rules:
+                        event = self._step(rule, device_id, value)
+                        if event is not None:
+                            event["timestamp"] = reading.get("timestamp")
+                            events.append(event)
+        return events
+
+    def _step(self, rule, device_id, value):
+        key = (rule.id, device_id)
+        state = self._state.get(key)
+        if state is None:
+            if not rule.breached(value):
+                return None
+            state = self._state[key] = [0, False]
+
+        if state[1]:
+            if rule.cleared(value):
+                del self._state[key]
+                return self._event(rule, device_id, value, "resolved")
+            return None
+
+        if rule.breached(value):
+            state[0] += 1
+            if state[0] >= rule.debounce:
+                state[1] = True
+                return self._event(rule, device_id, value, "firing")
+        else:
+            del self._state[key]
+        return None
+
+    def _event(self, rule, device_id, value, state):
+        return {
+            "rule_id": rule.id,
+            "device_id": device_id,
+            "parameter": rule.parameter,
+            "operator": rule.operator,
+            "threshold": rule.threshold,
+            "value": value,
+            "state": state,
+            "channel": rule.channel,
+            "target": rule.target,
+        }
@@ -0,0 +1,58 @@
+import mysql.connector
+from mysql.connector import Error
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# First-generation nodes send no pH, EC or relay state; their readings store NULL
+NULLABLE_COLUMNS = ("ph", "ec", "relay")
+
+def allow_legacy_readings():
+    """Make the soil_data columns first-generation payloads leave empty NULL-able"""
+    connection = None
+    try:
+        # Database connection using environment variables
+        connection = mysql.connector.connect(
+            host=os.getenv('DB_HOST', 'localhost'),
+            database=os.getenv('DB_NAME', 'soil_db'),
+            user=os.getenv('DB_USER', 'root'),
+            password=os.getenv('DB_PASSWORD', 'your_password')
+        )
+
+        if connection.is_connected():
+            cursor = connection.cursor()
+
+            for column in NULLABLE_COLUMNS:
+                # Keep the current type (FLOAT/INT, compact SMALLINT, VARCHAR or ENUM relay) and default
+                cursor.execute(
+                    "SELECT column_type, is_nullable, column_default FROM information_schema.columns "
+                    "WHERE table_schema = DATABASE() AND table_name = 'soil_data' AND column_name = %s",
+                    (column,)
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    print(f"❌ soil_data has no {column} column")
+                    continue
+                column_type, is_nullable, default = row
+                if is_nullable == 'YES':
+                    print(f"✅ {column} already allows NULL")
+                    continue
+                default_clause = f" DEFAULT '{default}'" if default is not None else ""
+                cursor.execute(f"ALTER TABLE soil_data MODIFY {column} {column_type} NULL{default_clause}")
+                print(f"✅ {column} now allows NULL")
+
+            connection.commit()
+
+    except Error as e:
+        print(f"❌ Error: {e}")
+    finally:
+        if connection is not None and connection.is_connected():
+            cursor.close()
+            connection.close()
+            print("🔌 MySQL connection closed")
+
+if __name__ == "__main__":
+    print("🔧 Allowing first-generation readings (no pH, EC or relay) in soil_data...")
+    allow_legacy_readings()
@@ -0,0 +1,212 @@
+# analytics.py
+"""
+Cross-parameter analytics over any time range.
+
+- Correlation: Pearson matrix over the sensor fields and the relay state,
+  pairwise-complete (a NaN drops only the pairs it belongs to).
+- Lagged cross-correlation: corr(x[t], y[t + lag]) for hourly lags, e.g.
+  relay ON fraction -> humidity, to see how soil responds to irrigation.
+- Distributions: exact mean/std/min/max plus a histogram and
+  approximate quantiles per parameter.
+
+At `hour` resolution everything is computed from the rollups merged into
+UTC hours (hourly means on a regular grid), so a year is 8,760 hours per
+device and answers in milliseconds. At `raw` resolution readings are read in
+ANALYTICS_CHUNK_DAYS chunks and folded into mergeable sufficient
+statistics (pairwise counts, sums and cross-products; histogram counts),
+so memory stays flat for any range. Histogram edges always come from the
+rollup min/max, so the raw path reads every reading once.
+"""
+import os
+from datetime import timedelta
+from operator import itemgetter
+
+import numpy as np
+
+from models import SENSOR_FIELDS
+from rollups import AGGREGATES, local_hours
+from timezones import zone
+
+ANALYTICS_FIELDS = (*SENSOR_FIELDS, "relay_on")
+ANALYTICS_CHUNK_DAYS = int(os.getenv("ANALYTICS_CHUNK_DAYS", "7"))
+ANALYTICS_MAX_LAG_HOURS = 168
+RESOLUTIONS = ("hour", "raw")
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class PairwiseMoments:
+    """Mergeable pairwise-complete sums for a correlation matrix"""
+
+    def __init__(self, width):
+        self.n = np.zeros((width, width))
+        self.sx = np.zeros((width, width))  # [i, j]: sum of x_i where x_i and x_j are both present
+        self.sxx = np.zeros((width, width))
+        self.sxy = np.zeros((width, width))
+
+    def update(self, values):
+        """Fold in an (n, width) matrix with NaN for missing values"""
+        present = (~np.isnan(values)).astype(float)
+        filled = np.where(present > 0, values, 0.0)
+        self.n += present.T @ present
+        self.sx += filled.T @ present
+        self.sxx += (filled * filled).T @ present
+        self.sxy += filled.T @ filled
+
+    def correlation(self):
+        """Pearson r per pair (NaN where a pair has fewer than 3 points or no variance)"""
+        n, sx, sy = self.n, self.sx, self.sx.T
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = n * self.sxy - sx * sy
+            var_x = n * self.sxx - sx * sx
+            var_y = n * self.sxx.T - sy * sy
+            r = cov / np.sqrt(var_x * var_y)
+        r[(n < 3) | (var_x <= 0) | (var_y <= 0)] = np.nan
+        return np.clip(r, -1.0, 1.0)
+
+
+def rollup_arrays(rows):
+    """Rollup rows as one float array per column (NULL aggregates -> NaN)"""
+    names = (["samples", "relay_on"] + [f"{field}_{agg}" for field in SENSOR_FIELDS for agg in AGGREGATES]
+             + [f"{field}_count" for field in SENSOR_FIELDS])
+    table = np.array(list(map(itemgetter(*names), rows)), dtype=float).reshape(len(rows), len(names))
+    arrays = dict(zip(names, table.T))
+    # Hour numbers rather than datetime64: converting datetimes one by one is the slow part
+    arrays["hour"] = np.array([row["bucket"].toordinal() * 24 + row["bucket"].hour for row in rows], dtype=np.int64)
+    return arrays
+
+
+def summary(arrays):
+    """Range totals as /report computes them (rollups.summarize of the merged rows), vectorized"""
+    samples = arrays["samples"].sum()
+    result = {"samples": int(samples), "relay_on_fraction": arrays["relay_on"].sum() / samples}
+    for field in SENSOR_FIELDS:
+        sums = arrays[f"{field}_sum"]
+        if np.isnan(sums).all():
+            result[field] = {"mean": None, "min": None, "max": None, "std": None}
+            continue
+        count = arrays[f"{field}_count"].sum()
+        mean = np.nansum(sums) / count
+        variance = max(np.nansum(arrays[f"{field}_sumsq"]) / count - mean * mean, 0.0)
+        result[field] = {
+            "mean": float(mean),
+            "min": float(np.nanmin(arrays[f"{field}_min"])),
+            "max": float(np.nanmax(arrays[f"{field}_max"])),
+            "std": float(variance ** 0.5),
+        }
+    return result
+
+
+def hourly_grid(arrays):
+    """(hours, fields) matrix of hourly means on a gap-free grid"""
+    hours = arrays["hour"]
+    if not len(hours):
+        return np.empty((0, len(ANALYTICS_FIELDS)))
+    index = hours - hours[0]
+    grid = np.full((index[-1] + 1, len(ANALYTICS_FIELDS)), np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):  # hours without the field stay NaN
+        for i, field in enumerate(SENSOR_FIELDS):
+            grid[index, i] = arrays[f"{field}_sum"] / arrays[f"{field}_count"]
+    grid[index, -1] = arrays["relay_on"] / arrays["samples"]
+    return grid
+
+
+def raw_chunks(store, device_id, start, end, chunk_days=ANALYTICS_CHUNK_DAYS):
+    """(n, fields) reading matrices for [start, end), one chunk of days at a time"""
+    step = timedelta(days=chunk_days)
+    while start < end:
+        columns = store.history(device_id, start, min(start + step, end))
+        if len(columns["timestamp"]):
+            yield np.column_stack([np.asarray(columns[field], dtype=float) for field in ANALYTICS_FIELDS])
+        start += step
+
+
+def lagged_correlation(x, y, max_lag):
+    """corr(x[t], y[t + lag]) for lag = 0..max_lag steps, pairwise-complete"""
+    lags = []
+    for lag in range(min(max_lag, len(x) - 1) + 1):
+        a, b = x[:len(x) - lag], y[lag:]
+        both = ~(np.isnan(a) | np.isnan(b))
+        a, b = a[both], b[both]
+        r = None
+        if len(a) >= 3 and a.std() > 0 and b.std() > 0:
+            r = float(np.corrcoef(a, b)[0, 1])
+        lags.append({"lag_hours": lag, "r": r, "pairs": int(len(a))})
+    return lags
+
+
+def _quantiles(edges, counts):
+    """Quantiles interpolated within histogram bins"""
+    total = counts.sum()
+    if not total:
+        return {}
+    cumulative = np.concatenate(([0], np.cumsum(counts)))
+    return {
+        f"p{round(q * 100)}": float(np.interp(q * total, cumulative, edges))
+        for q in QUANTILES
+    }
+
+
+class Histograms:
+    """Per-field histogram counts over fixed edges, mergeable across chunks"""
+
+    def __init__(self, totals, bins):
+        self.edges = {}
+        for field in ANALYTICS_FIELDS:
+            low, high = (0.0, 1.0) if field == "relay_on" else (totals[field]["min"], totals[field]["max"])
+            if low is not None:
+                self.edges[field] = np.linspace(low, high if high > low else low + 1.0, bins + 1)
+        self.counts = {field: np.zeros(bins, dtype=np.int64) for field in self.edges}
+
+    def update(self, values):
+        for i, field in enumerate(ANALYTICS_FIELDS):
+            if field in self.edges:
+                column = values[:, i]
+                self.counts[field] += np.histogram(column[~np.isnan(column)], self.edges[field])[0]
+
+    def distributions(self, totals):
+        """Exact moments from the rollup totals plus histogram and quantiles per field"""
+        result = {}
+        for field in ANALYTICS_FIELDS:
+            moments = {"mean": totals["relay_on_fraction"]} if field == "relay_on" else dict(totals[field])
+            if field in self.edges:
+                edges, counts = self.edges[field], self.counts[field]
+                moments["histogram"] = {"edges": edges.tolist(), "counts": counts.tolist()}
+                moments["quantiles"] = _quantiles(edges, counts)
+            result[field] = moments
+        return result
+
+
+def analyze(store, device_id, start, end, resolution="hour", x="relay_on", y="humidity", max_lag=24, bins=20):
+    """Correlation matrix, lagged x -> y cross-correlation and distributions for one device over [start, end)"""
+    rows = local_hours(store.rollups(device_id, start, end), zone("UTC"))
+    arrays = rollup_arrays(rows)
+    grid = hourly_grid(arrays)
+    totals = summary(arrays) if rows else None
+
+    # One pass over the data feeds both the correlation sums and the histograms
+    moments = PairwiseMoments(len(ANALYTICS_FIELDS))
+    histograms = Histograms(totals, bins) if totals else None
+    for values in raw_chunks(store, device_id, start, end) if resolution == "raw" else [grid]:
+        moments.update(values)
+        if histograms:
+            histograms.update(values)
+    matrix = moments.correlation()
+
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "samples": totals["samples"] if totals else 0,
+        "hours": len(rows),
+        "correlation": {
+            "fields": list(ANALYTICS_FIELDS),
+            "matrix": [[None if np.isnan(r) else float(r) for r in row] for row in matrix],
+        },
+        "cross_correlation": {
+            "x": x,
+            "y": y,
+            "lags": lagged_correlation(grid[:, ANALYTICS_FIELDS.index(x)], grid[:, ANALYTICS_FIELDS.index(y)], max_lag),
+        },
+        "distributions": histograms.distributions(totals) if histograms else {},
+    }
@@ -0,0 +1,182 @@
+# anomaly.py
+"""
+Streaming anomaly detection over incoming readings.
+
+For every device and parameter the detector keeps a small online model,
+updated in O(1) per reading:
+
+- EWMA mean and variance of the value -> "spike" when the z-score of a
+  new value exceeds ANOMALY_Z_THRESHOLD
+- EWMA mean per hour of day -> "seasonal" when a value is far from what
+  is normal for that hour (e.g. temperature at 03:00 vs 15:00)
+- EWMA mean and variance of the per-minute rate of change -> "rate" when a
+  parameter moves unusually fast (EC spike, moisture dropping)
+
+State lives in preallocated NumPy arrays indexed by a device slot, so
+memory is fixed at ANOMALY_MAX_DEVICES devices; when full, the device
+seen least recently is evicted.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from metrics import metrics
+from models import SENSOR_FIELDS
+
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.05"))           # EWMA weight of a new reading
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "4.0"))
+ANOMALY_WARMUP = int(os.getenv("ANOMALY_WARMUP", "30"))             # readings before alerting
+ANOMALY_MAX_DEVICES = int(os.getenv("ANOMALY_MAX_DEVICES", "10000"))
+ANOMALY_COOLDOWN_SECONDS = float(os.getenv("ANOMALY_COOLDOWN_SECONDS", "300"))
+ANOMALY_HISTORY = int(os.getenv("ANOMALY_HISTORY", "1000"))          # recent alerts kept in memory
+
+# Hour-of-day baselines need a few days of readings per hour before they are trusted
+SEASONAL_WARMUP = 10
+# Floor for the standard deviation so perfectly flat series do not alert on noise
+MIN_STD = np.array([1.0, 1.0, 1.0, 0.05, 5.0, 0.5, 0.2])
+KINDS = ("spike", "seasonal", "rate")
+
+
+class AnomalyDetector:
+    """Per-device, per-parameter online models with fixed memory"""
+
+    def __init__(self, max_devices=ANOMALY_MAX_DEVICES, alpha=ANOMALY_ALPHA,
+                 z_threshold=ANOMALY_Z_THRESHOLD, warmup=ANOMALY_WARMUP,
+                 cooldown=ANOMALY_COOLDOWN_SECONDS, history=ANOMALY_HISTORY):
+        self.max_devices = max_devices
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.warmup = warmup
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._owners = [None] * max_devices
+        self._free = list(range(max_devices - 1, -1, -1))
+        width = len(SENSOR_FIELDS)
+
+        self.count = np.zeros(max_devices, dtype=np.int64)
+        self.mean = np.zeros((max_devices, width))
+        self.var = np.zeros((max_devices, width))
+        self.seasonal = np.zeros((max_devices, 24, width))
+        self.seasonal_n = np.zeros((max_devices, 24), dtype=np.int64)
+        self.rate_mean = np.zeros((max_devices, width))
+        self.rate_var = np.zeros((max_devices, width))
+        self.last_value = np.zeros((max_devices, width))
+        self.last_ts = np.zeros(max_devices)
+        self.last_seen = np.zeros(max_devices)
+        self.last_alert = np.full((max_devices, len(KINDS), width), -np.inf)
+        self.alerts = deque(maxlen=history)
+
+    def _slot(self, device_id):
+        slot = self._slots.get(device_id)
+        if slot is not None:
+            return slot
+        if not self._free:
+            # Evict the device seen least recently
+            victim = int(np.argmin(self.last_seen))
+            del self._slots[self._owners[victim]]
+            metrics.inc("anomaly_devices_evicted")
+            self._free.append(victim)
+        slot = self._free.pop()
+        self.count[slot] = 0
+        self.seasonal_n[slot] = 0
+        self.last_alert[slot] = -np.inf
+        self._slots[device_id] = slot
+        self._owners[slot] = device_id
+        return slot
+
+    def update(self, device_id, reading):
+        """Feed one reading (dict with sensor fields and timestamp); return new alerts"""
+        values = np.array([reading[f] for f in SENSOR_FIELDS], dtype=float)
+        ts = reading["timestamp"]
+        epoch = ts.timestamp()
+        hour = ts.hour
+        a = self.alpha
+
+        with self._lock:
+            slot = self._slot(device_id)
+            n = self.count[slot]
+            self.last_seen[slot] = time.monotonic()
+            fired = []
+
+            if n == 0:
+                self.mean[slot] = values
+                self.var[slot] = 0.0
+                self.rate_mean[slot] = 0.0
+                self.rate_var[slot] = 0.0
+            else:
+                std = np.maximum(np.sqrt(self.var[slot]), MIN_STD)
+                z = (values - self.mean[slot]) / std
+
+                minutes = (epoch - self.last_ts[slot]) / 60.0
+                rate = (values - self.last_value[slot]) / minutes if minutes > 0 else np.zeros_like(values)
+                rate_std = np.maximum(np.sqrt(self.rate_var[slot]), MIN_STD)
+                rate_z = (rate - self.rate_mean[slot]) / rate_std
+
+                seasonal_ready = self.seasonal_n[slot, hour] >= SEASONAL_WARMUP
+                seasonal_z = (values - self.seasonal[slot, hour]) / std if seasonal_ready else None
+
+                if n >= self.warmup:
+                    fired = self._check(device_id, ts, values, z, rate_z, seasonal_z, slot, hour)
+
+                # Update after scoring so a spike does not hide itself
+                delta = values - self.mean[slot]
+                self.mean[slot] += a * delta
+                self.var[slot] = (1 - a) * (self.var[slot] + a * delta * delta)
+                if minutes > 0:
+                    rate_delta = rate - self.rate_mean[slot]
+                    self.rate_mean[slot] += a * rate_delta
+                    self.rate_var[slot] = (1 - a) * (self.rate_var[slot] + a * rate_delta * rate_delta)
+
+            if self.seasonal_n[slot, hour] == 0:
+                self.seasonal[slot, hour] = values
+            else:
+                self.seasonal[slot, hour] += a * (values - self.seasonal[slot, hour])
+            self.seasonal_n[slot, hour] += 1
+            self.last_value[slot] = values
+            self.last_ts[slot] = epoch
+            self.count[slot] = n + 1
+
+        metrics.inc("anomaly_readings_scored")
+        return fired
+
+    def _check(self, device_id, ts, values, z, rate_z, seasonal_z, slot, hour):
+        scores = {"spike": z, "rate": rate_z}
+        expected = {"spike": self.mean[slot], "rate": self.mean[slot]}
+        if seasonal_z is not None:
+            scores["seasonal"] = seasonal_z
+            expected["seasonal"] = self.seasonal[slot, hour]
+
+        fired = []
+        now = time.monotonic()
+        for kind, score in scores.items():
+            k = KINDS.index(kind)
+            for i in np.flatnonzero(np.abs(score) > self.z_threshold):
+                parameter = SENSOR_FIELDS[i]
+                if now - self.last_alert[slot, k, i] < self.cooldown:
+                    continue
+                self.last_alert[slot, k, i] = now
+                alert = {
+                    "device_id": device_id,
+                    "parameter": parameter,
+                    "kind": kind,
+                    "value": float(values[i]),
+                    "expected": float(expected[kind][i]),
+                    "score": round(float(score[i]), 2),
+                    "timestamp": ts,
+                }
+                self.alerts.append(alert)
+                fired.append(alert)
+                metrics.inc("anomaly_alerts", kind=kind)
+        return fired
+
+    def recent_alerts(self, device_id=None, limit=100):
+        with self._lock:
+            alerts = [a for a in self.alerts if device_id is None or a["device_id"] == device_id]
+        return alerts[-limit:]
+
+    def device_count(self):
+        return len(self._slots)
@@ -0,0 +1,67 @@
+# backfill_rollups.py
+"""
+One-shot backfill of soil_rollup_hourly from existing soil_data rows.
+
+New readings are rolled up on ingest; run this once after creating the
+rollup table on a database that already holds data. Rows are streamed in
+chunks, so memory stays flat regardless of table size. --rebuild empties
+the table first, e.g. to replace the hour buckets of earlier versions
+with quarter-hour ones.
+
+Usage: python backfill_rollups.py [--force | --rebuild]
+"""
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, func, select
+
+from models import SoilData, SENSOR_FIELDS, DEFAULT_DEVICE_ID
+from rollups import aggregate, merge_rollups, soil_rollup_hourly
+from server import engine
+
+CHUNK_SIZE = 10000
+
+
+def backfill(force=False, rebuild=False):
+    soil_rollup_hourly.create(bind=engine, checkfirst=True)
+    if rebuild:
+        with engine.begin() as conn:
+            conn.execute(delete(soil_rollup_hourly))
+
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(soil_rollup_hourly)).scalar()
+    if existing and not force:
+        print(f"❌ soil_rollup_hourly already has {existing} rows; rerun with --force to add to them")
+        return False
+
+    columns = [SoilData.id, SoilData.device_id, SoilData.relay, SoilData.timestamp] + \
+        [getattr(SoilData, field) for field in SENSOR_FIELDS]
+    last_id = 0
+    total = 0
+    with engine.connect() as conn:
+        while True:
+            rows = conn.execute(
+                select(*columns).where(SoilData.id > last_id).order_by(SoilData.id).limit(CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            by_device = defaultdict(list)
+            for row in rows:
+                if row["timestamp"] is not None and any(row[f] is not None for f in SENSOR_FIELDS):
+                    by_device[row["device_id"] or DEFAULT_DEVICE_ID].append(row)
+            for device_id, readings in by_device.items():
+                merge_rollups(conn, aggregate(device_id, readings))
+            conn.commit()
+
+            total += len(rows)
+            print(f"✅ Rolled up {total} rows...")
+
+    print(f"🎉 Backfill complete: {total} rows")
+    return True
+
+
+if __name__ == "__main__":
+    print("🚀 Backfilling rollups...")
+    backfill(force="--force" in sys.argv, rebuild="--rebuild" in sys.argv)
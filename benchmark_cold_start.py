@@ -0,0 +1,105 @@
+# benchmark_cold_start.py
+"""
+Cold-start benchmark for the two entry points, with a time budget each.
+
+Every run starts a fresh interpreter with `-X importtime`, so nothing is
+cached between runs:
+
+- server:     `import server` (modules, models, engine and routes; the
+              startup handlers run later, when uvicorn starts the app)
+- dashboard:  the module-level imports of dashboard.py, i.e. what a new
+              Streamlit process loads before it can draw the first element
+
+Reports the median over RUNS (minus the bare interpreter start-up) and
+the modules with the largest self time, then checks each entry point
+against its budget. The exit status is 1 if one is over budget, so the
+script can run in CI. Budgets are milliseconds and can be overridden,
+e.g. COLD_START_BUDGETS="server=1500,dashboard=1000".
+
+Usage: python benchmark_cold_start.py [runs]
+"""
+import ast
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BUDGETS_MS = {"server": 1500, "dashboard": 1200}
+TOP_MODULES = 8
+
+
+def budgets():
+    limits = dict(BUDGETS_MS)
+    for item in filter(None, os.getenv("COLD_START_BUDGETS", "").split(",")):
+        name, _, value = item.partition("=")
+        limits[name.strip()] = float(value)
+    return limits
+
+
+def module_imports(path):
+    """The import statements dashboard.py runs at module level, as source"""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    return "\n".join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+
+ENTRY_POINTS = {
+    "server": "import server",
+    "dashboard": module_imports(os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard.py")),
+}
+
+
+def run(code):
+    """Wall-clock seconds and `-X importtime` output of one fresh interpreter"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env={**os.environ, "LOG_LEVEL": "WARNING"},
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return elapsed, result.stderr
+
+
+def slowest_modules(importtime, top=TOP_MODULES):
+    """(self µs, cumulative µs, module) with the largest self time"""
+    modules = []
+    for line in importtime.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us), int(cumulative_us), name.strip()))
+    return sorted(modules, reverse=True)[:top]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    limits = budgets()
+    baseline = statistics.median(run("pass")[0] for _ in range(runs))
+
+    print(f"🚀 Cold start: median of {runs} fresh interpreters (interpreter start-up of "
+          f"{baseline * 1000:.0f} ms subtracted)")
+    over = []
+    for name, code in ENTRY_POINTS.items():
+        print("-" * 60)
+        try:
+            samples = [run(code) for _ in range(runs)]
+        except RuntimeError as e:
+            print(f"{name:10} ⏭  skipped: {e}")
+            continue
+        median_ms = (statistics.median(elapsed for elapsed, _ in samples) - baseline) * 1000
+        within = median_ms <= limits[name]
+        print(f"{name:10} {median_ms:8.0f} ms   budget {limits[name]:.0f} ms   {'✅' if within else '❌ over budget'}")
+        print("  slowest modules (self / cumulative):")
+        for self_us, cumulative_us, module in slowest_modules(samples[-1][1]):
+            print(f"    {self_us / 1000:7.1f} / {cumulative_us / 1000:7.1f} ms  {module}")
+        if not within:
+            over.append(name)
+    print("-" * 60)
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# benchmark_fleet.py
+"""
+Fleet overview benchmark.
+
+Loads synthetic readings for 1,000 devices into an in-memory SQLite copy
+of the schema, seeds a FleetTracker with the grouped latest-row query and
+times building one page of /fleet plus the orjson encoding of the
+response. The dashboard renders a page from a single such response.
+
+Usage: python benchmark_fleet.py [devices] [readings_per_device]
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import orjson
+from sqlalchemy import create_engine, insert
+
+from fleet import FleetTracker
+from models import Base, SoilData
+from storage import SqlReadingStore
+
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    per_device = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    now = datetime(2024, 6, 1, 12, 0)
+    rows = []
+    for d in range(devices):
+        # A tenth of the fleet went quiet an hour ago
+        last = now - timedelta(hours=1) if d % 10 == 0 else now
+        for i in range(per_device):
+            rows.append({
+                "device_id": f"node-{d:04d}", "seq": i,
+                "timestamp": last - timedelta(seconds=5 * (per_device - i)),
+                "nitrogen": random.randint(10, 60), "phosphorus": random.randint(10, 45),
+                "potassium": random.randint(80, 220), "ph": round(random.uniform(5.5, 8.5), 2),
+                "ec": random.randint(50, 1500), "humidity": round(random.uniform(30, 80), 1),
+                "temperature": round(random.uniform(10, 35), 1),
+                "relay": random.choice(["ON", "OFF"]),
+            })
+    with engine.begin() as conn:
+        conn.execute(insert(SoilData), rows)
+
+    print(f"🚀 Fleet overview: {devices} devices, {len(rows):,} stored readings")
+    print("-" * 60)
+    tracker = FleetTracker()
+    start = time.perf_counter()
+    tracker.seed(SqlReadingStore(engine).latest_per_device())
+    print(f"Seed (one grouped query): {(time.perf_counter() - start) * 1000:10.1f} ms")
+
+    for sort in ("staleness", "health", "device_id"):
+        for page_size in (50, 250):
+            runs = 20
+            start = time.perf_counter()
+            for _ in range(runs):
+                body = orjson.dumps(tracker.overview(now, 1, page_size, sort))
+            elapsed = (time.perf_counter() - start) / runs
+            print(f"Page of {page_size:3d} by {sort:10s}:   {elapsed * 1000:10.2f} ms  ({len(body):,} bytes)")
+
+    page = tracker.overview(now, 1, 50)
+    print(f"Online/stale/pumps on:   {page['online']}/{page['stale']}/{page['relay_on']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# benchmark_logging.py
+"""
+Measure the request-thread cost of the ingest log lines.
+
+Compares the original eager f-string + synchronous handler against the
+lazy, queued and sampled setups from log_config.py. Output goes to a
+temporary file, flushed per record like the real StreamHandler/FileHandler.
+
+Usage: python benchmark_logging.py [iterations]
+"""
+import logging
+import logging.handlers
+import queue
+import sys
+import tempfile
+import time
+
+from log_config import BoundedQueueHandler, JsonFormatter, RouteSampler
+
+SAMPLE_READING = {
+    "nitrogen": 25, "phosphorus": 30, "potassium": 150, "ph": 6.8,
+    "ec": 800, "humidity": 45.5, "temperature": 24.2, "relay": "OFF",
+}
+
+
+class Reading:
+    """Stand-in for the pydantic model; formatting it costs a dict() call"""
+
+    def dict(self):
+        return dict(SAMPLE_READING)
+
+    def __str__(self):
+        return str(self.dict())
+
+
+def build_logger(name, handler, sampler=None):
+    logger = logging.getLogger(name)
+    logger.handlers[:] = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    if sampler is not None:
+        handler.addFilter(sampler)
+    return logger
+
+
+def run(label, fn, iterations, log_queue=None):
+    if log_queue is not None:
+        # Let the listener drain the previous run so it does not compete
+        while not log_queue.empty():
+            time.sleep(0.01)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<42} {elapsed / iterations * 1e6:8.2f} µs/call")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    sink = tempfile.TemporaryFile("w")
+    data = Reading()
+
+    print(f"🚀 Logging benchmark ({iterations} calls each)")
+    print("-" * 60)
+
+    eager = build_logger("bench.eager", logging.StreamHandler(sink))
+    run("eager f-string, sync text", lambda: eager.info(f"Received data from ESP8266: {data.dict()}"), iterations)
+
+    lazy = build_logger("bench.lazy", logging.StreamHandler(sink))
+    run("lazy args, sync text", lambda: lazy.info("Received data from ESP8266: %s", data), iterations)
+
+    json_handler = logging.StreamHandler(sink)
+    json_handler.setFormatter(JsonFormatter())
+    structured = build_logger("bench.json", json_handler)
+    run("lazy args, sync json", lambda: structured.info(
+        "Received data from ESP8266: %s", data, extra={"route": "/soil-data"}), iterations)
+
+    queued_out = logging.StreamHandler(sink)
+    log_queue = queue.Queue(maxsize=iterations + 1)
+    listener = logging.handlers.QueueListener(log_queue, queued_out)
+    queued = build_logger("bench.queued", BoundedQueueHandler(log_queue))
+    listener.start()
+    run("lazy args, queued", lambda: queued.info("Received data from ESP8266: %s", data), iterations, log_queue)
+
+    sampled = build_logger(
+        "bench.sampled",
+        BoundedQueueHandler(log_queue),
+        RouteSampler(sample_every={"/soil-data": 10}),
+    )
+    run("lazy args, queued, sampled 1/10", lambda: sampled.info(
+        "Received data from ESP8266: %s", data, extra={"route": "/soil-data"}), iterations, log_queue)
+
+    disabled = build_logger("bench.disabled", logging.StreamHandler(sink))
+    disabled.setLevel(logging.WARNING)
+    run("lazy args, level disabled", lambda: disabled.info("Received data from ESP8266: %s", data), iterations)
+
+    listener.stop()
+    sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# benchmark_relay_storage.py
+"""
+Relay storage benchmark: per-reading strings vs run-length intervals.
+
+Builds two SQLite databases with the same synthetic readings (pump runs of
+a few minutes a few times a day):
+
+- legacy:     relay as a text column on every reading, plus idx_relay
+- compressed: relay as a one-byte enum/bool, plus relay_intervals
+
+and reports the space taken by the relay data (from SQLite's dbstat) and
+the time to answer "how long did each pump run over the period", by
+scanning readings versus reading intervals.
+
+Usage: python benchmark_relay_storage.py [devices] [readings_per_device]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def synthetic_readings(devices, per_device):
+    start = datetime(2024, 1, 1)
+    for d in range(devices):
+        relay = "OFF"
+        remaining = random.randint(100, 700)
+        for i in range(per_device):
+            if remaining == 0:
+                relay = "ON" if relay == "OFF" else "OFF"
+                # ~5 minute runs, a few hours apart, at one reading every 5 s
+                remaining = random.randint(40, 80) if relay == "ON" else random.randint(1500, 3000)
+            remaining -= 1
+            yield f"node-{d:03d}", (start + timedelta(seconds=5 * i)).isoformat(sep=" "), relay
+
+
+def intervals_from(readings):
+    current = {}
+    for device, ts, relay in readings:
+        state = current.get(device)
+        if state is None or state[1] != relay:
+            if state is not None:
+                yield device, state[0], ts, state[1]
+            current[device] = (ts, relay)
+    for device, (ts, relay) in current.items():
+        yield device, ts, None, relay
+
+
+def build(path, readings, compressed):
+    conn = sqlite3.connect(path)
+    if compressed:
+        conn.execute("CREATE TABLE soil_data (id INTEGER PRIMARY KEY, device_id TEXT, timestamp TEXT, relay INTEGER)")
+        conn.executemany("INSERT INTO soil_data (device_id, timestamp, relay) VALUES (?, ?, ?)",
+                         ((d, ts, relay == "ON") for d, ts, relay in readings))
+        conn.execute("CREATE TABLE relay_intervals (device_id TEXT, start_ts TEXT, end_ts TEXT, state INTEGER, "
+                     "PRIMARY KEY (device_id, start_ts)) WITHOUT ROWID")
+        conn.executemany("INSERT INTO relay_intervals VALUES (?, ?, ?, ?)",
+                         ((d, s, e, state == "ON") for d, s, e, state in intervals_from(readings)))
+    else:
+        conn.execute("CREATE TABLE soil_data (id INTEGER PRIMARY KEY, device_id TEXT, timestamp TEXT, relay TEXT)")
+        conn.executemany("INSERT INTO soil_data (device_id, timestamp, relay) VALUES (?, ?, ?)", readings)
+        conn.execute("CREATE INDEX idx_relay ON soil_data (relay)")
+    conn.execute("CREATE INDEX idx_device_ts ON soil_data (device_id, timestamp)")
+    conn.commit()
+    conn.execute("VACUUM")
+    return conn
+
+
+def size(conn, name):
+    """Bytes of pages used by a table or index"""
+    return conn.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name = ?", (name,)).fetchone()[0]
+
+
+def run_durations_from_readings(conn, device):
+    rows = conn.execute("SELECT timestamp, relay FROM soil_data WHERE device_id = ? ORDER BY timestamp", (device,))
+    runs, on_since, last = [], None, None
+    for ts, relay in rows:
+        if relay == "ON" and on_since is None:
+            on_since = ts
+        elif relay == "OFF" and on_since is not None:
+            runs.append((on_since, ts))
+            on_since = None
+        last = ts
+    if on_since is not None:
+        runs.append((on_since, last))
+    return runs
+
+
+def run_durations_from_intervals(conn, device):
+    return conn.execute(
+        "SELECT start_ts, end_ts FROM relay_intervals WHERE device_id = ? AND state = 1 ORDER BY start_ts",
+        (device,),
+    ).fetchall()
+
+
+def timed(fn, *args, runs=5):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn(*args)
+    return (time.perf_counter() - start) / runs, result
+
+
+def main():
+    devices = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    per_device = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    readings = list(synthetic_readings(devices, per_device))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = build(os.path.join(tmp, "legacy.db"), readings, compressed=False)
+        compact = build(os.path.join(tmp, "compact.db"), readings, compressed=True)
+        intervals = compact.execute("SELECT COUNT(*) FROM relay_intervals").fetchone()[0]
+
+        print(f"🚀 Relay storage: {devices} devices, {len(readings):,} readings, {intervals:,} intervals")
+        print("-" * 60)
+        legacy_table, compact_table = size(legacy, "soil_data"), size(compact, "soil_data")
+        legacy_index = size(legacy, "idx_relay")
+        interval_bytes = size(compact, "relay_intervals")
+        legacy_total = legacy_table + legacy_index
+        compact_total = compact_table + interval_bytes
+        print(f"Legacy readings table:   {legacy_table / 1e6:10.2f} MB")
+        print(f"Legacy idx_relay:        {legacy_index / 1e6:10.2f} MB")
+        print(f"Compact readings table:  {compact_table / 1e6:10.2f} MB")
+        print(f"relay_intervals:         {interval_bytes / 1e6:10.2f} MB")
+        print(f"Total saved:             {(legacy_total - compact_total) / 1e6:10.2f} MB "
+              f"({1 - compact_total / legacy_total:.0%})")
+        print("-" * 60)
+
+        device = "node-000"
+        scan_time, scan_runs = timed(run_durations_from_readings, legacy, device)
+        interval_time, interval_runs = timed(run_durations_from_intervals, compact, device)
+        assert len(scan_runs) == len(interval_runs)
+        print(f"Pump runs for {device}: {len(interval_runs)}")
+        print(f"Scan readings:           {scan_time * 1000:10.2f} ms")
+        print(f"Read intervals:          {interval_time * 1000:10.2f} ms")
+        print(f"Speedup:                 {scan_time / interval_time:10.0f}x")
+        legacy.close()
+        compact.close()
+
+
+if __name__ == "__main__":
+    main()
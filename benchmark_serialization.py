@@ -0,0 +1,91 @@
+# benchmark_serialization.py
+"""
+Micro-benchmark for the `/latest-data` read path.
+
+Compares the old path (ORM query + hand-built dict + jsonable_encoder +
+json.dumps, which is what FastAPI's default JSONResponse does) against the
+new one (Core select returning a row + orjson). Runs against an in-memory
+SQLite copy of the soil_data table, so no MySQL server is needed.
+
+Usage: python benchmark_serialization.py [iterations]
+"""
+import json
+import random
+import sys
+import time
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, SoilData
+from storage import SqlReadingStore
+
+ROWS = 10000
+
+
+def timed(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<36} {elapsed / iterations * 1e6:9.2f} µs/call")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    with Session() as db:
+        db.add_all(
+            SoilData(
+                nitrogen=random.randint(10, 60), phosphorus=random.randint(10, 50),
+                potassium=random.randint(80, 220), ph=round(random.uniform(5.5, 8), 2),
+                ec=random.randint(100, 1500), humidity=round(random.uniform(20, 70), 1),
+                temperature=round(random.uniform(15, 35), 1), relay="OFF",
+            )
+            for _ in range(ROWS)
+        )
+        db.commit()
+
+    extra = {"mode": "auto", "last_command": "OFF"}
+
+    def orm_row():
+        with Session() as db:
+            data = db.query(SoilData).order_by(SoilData.timestamp.desc()).first()
+            return {
+                "id": data.id, "nitrogen": data.nitrogen, "phosphorus": data.phosphorus,
+                "potassium": data.potassium, "ph": data.ph, "ec": data.ec,
+                "humidity": data.humidity, "temperature": data.temperature,
+                "relay": data.relay, "timestamp": data.timestamp, **extra,
+            }
+
+    store = SqlReadingStore(engine)
+
+    def core_row():
+        return {**store.latest(), **extra}
+
+    sample = orm_row()
+
+    def default_encode():
+        return json.dumps(jsonable_encoder(sample), ensure_ascii=False, allow_nan=False,
+                          separators=(",", ":")).encode("utf-8")
+
+    def orjson_encode():
+        return orjson.dumps(sample)
+
+    print(f"🚀 /latest-data read path ({ROWS} rows, {iterations} calls each)")
+    print("-" * 60)
+    timed("ORM query + dict", orm_row, iterations)
+    timed("Core select -> row", core_row, iterations)
+    timed("jsonable_encoder + json.dumps", default_encode, iterations * 10)
+    timed("orjson.dumps", orjson_encode, iterations * 10)
+    timed("old path end to end", lambda: json.dumps(jsonable_encoder(orm_row())), iterations)
+    timed("new path end to end", lambda: orjson.dumps(core_row()), iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# benchmark_sqlite.py
+"""
+SQLite ingest benchmark: the old db.py write path vs the SQLite backend.
+
+- per-row:  what db.py used to do: open a connection, INSERT one reading,
+            COMMIT, close (rollback journal, synchronous=FULL)
+- backend:  SqliteReadingStore: WAL, synchronous=NORMAL, one writer
+            connection grouping concurrent requests into shared commits,
+            rollups upserted in the same transaction
+
+Both are driven by CLIENTS threads, each posting single readings the way
+devices do. Reports readings/s, readings per commit and how long a range
+read takes on a reader connection while the writer is busy.
+
+Usage: python benchmark_sqlite.py [readings] [clients]
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy.orm import sessionmaker
+
+from db import SqliteReadingStore, sqlite_engine
+from metrics import metrics
+from models import Base, SENSOR_FIELDS
+
+START = datetime(2024, 1, 1)
+
+
+def reading(device, seq):
+    return {
+        "nitrogen": random.randint(10, 60), "phosphorus": random.randint(10, 45),
+        "potassium": random.randint(80, 220), "ph": random.randint(550, 850) / 100,
+        "ec": random.randint(50, 1500), "humidity": random.randint(200, 800) / 10,
+        "temperature": random.randint(-50, 350) / 10, "relay": "OFF",
+        "device_id": device, "seq": seq, "timestamp": START + timedelta(seconds=5 * seq),
+    }
+
+
+def run_clients(clients, per_client, post):
+    def client(c):
+        for seq in range(per_client):
+            post(reading(f"node-{c:02d}", seq))
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * per_client / (time.perf_counter() - start)
+
+
+def per_row(path, clients, per_client):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE soil_data (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        + ", ".join(f"{field} REAL" for field in SENSOR_FIELDS)
+        + ", relay TEXT, timestamp DATETIME, device_id TEXT, seq INTEGER)"
+    )
+    conn.close()
+    columns = (*SENSOR_FIELDS, "relay", "timestamp", "device_id", "seq")
+    sql = f"INSERT INTO soil_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def post(row):
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute(sql, [row[c] for c in columns])
+        conn.commit()
+        conn.close()
+
+    return run_clients(clients, per_client, post)
+
+
+def backend(path, clients, per_client):
+    engine = sqlite_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    store = SqliteReadingStore(engine)
+    store.start()
+
+    def post(row):
+        db = Session()
+        try:
+            store.insert(db, row["device_id"], [row])
+            db.commit()
+        finally:
+            db.close()
+
+    reads = []
+    done = threading.Event()
+
+    def reader():
+        # Dashboards polling one device's history while ingest runs
+        while not done.wait(0.05):
+            start = time.perf_counter()
+            store.history("node-00", START, START + timedelta(hours=1))
+            reads.append(time.perf_counter() - start)
+
+    polling = threading.Thread(target=reader)
+    metrics.reset()
+    polling.start()
+    rate = run_clients(clients, per_client, post)
+    done.set()
+    polling.join()
+    store.close()
+    engine.dispose()
+    commits = metrics.counter("sqlite_commits")
+    return rate, clients * per_client / commits, sorted(reads)
+
+
+def main():
+    readings = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    per_client = readings // clients
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"🚀 SQLite ingest: {clients * per_client:,} single-reading requests from {clients} clients")
+        print("-" * 60)
+        old_rate = per_row(os.path.join(tmp, "per_row.db"), clients, per_client)
+        print(f"Connection + commit per row: {old_rate:10,.0f} readings/s")
+        rate, per_commit, reads = backend(os.path.join(tmp, "backend.db"), clients, per_client)
+        print(f"WAL + single writer:         {rate:10,.0f} readings/s ({per_commit:.1f} per commit)")
+        if reads:
+            print(f"History read during ingest:  {reads[len(reads) // 2] * 1000:10.2f} ms median, "
+                  f"{reads[int(len(reads) * 0.99)] * 1000:.2f} ms p99")
+        print("-" * 60)
+        print(f"Speedup:                     {rate / old_rate:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
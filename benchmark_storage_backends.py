@@ -0,0 +1,131 @@
+# benchmark_storage_backends.py
+"""
+Reading store benchmark: SQL backend vs the embedded columnar engine.
+
+Ingests the same synthetic readings through both storage.ReadingStore
+implementations, the way the ingest pipeline calls them (one transaction
+per request, single readings and store-and-forward batches), then times
+range queries (one device's day as column arrays), quarter-hour rollups for
+that day and the latest reading.
+
+The SQL side uses a temporary SQLite file by default; with --mysql it
+uses the server's MySQL database, writing scratch rows under device ids
+bench-* that are deleted afterwards.
+
+Usage: python benchmark_storage_backends.py [devices] [readings_per_device] [--mysql]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, delete
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, SoilData
+from rollups import soil_rollup_hourly
+from storage import ColumnarReadingStore, SqlReadingStore
+from tsdb import ColumnarStore
+
+BATCH_SIZE = 100
+SINGLE_INSERTS = 2000
+START = datetime(2024, 1, 1)
+
+
+def reading(device_id, seq, ts):
+    return {
+        "nitrogen": random.randint(10, 60), "phosphorus": random.randint(10, 45),
+        "potassium": random.randint(80, 220), "ph": random.randint(550, 850) / 100,
+        "ec": random.randint(50, 1500), "humidity": random.randint(200, 800) / 10,
+        "temperature": random.randint(-50, 350) / 10, "relay": random.choice(("ON", "OFF")),
+        "device_id": device_id, "seq": seq, "timestamp": ts,
+    }
+
+
+def batches(devices, per_device):
+    """Store-and-forward batches, one device at a time, 5 s apart"""
+    for d in range(devices):
+        device_id = f"bench-{d:03d}"
+        for offset in range(0, per_device, BATCH_SIZE):
+            yield device_id, [
+                reading(device_id, seq, START + timedelta(seconds=5 * seq))
+                for seq in range(offset, min(offset + BATCH_SIZE, per_device))
+            ]
+
+
+def ingest(store, Session, work):
+    """Rows per second for (device_id, rows) requests, one commit each"""
+    rows = 0
+    start = time.perf_counter()
+    for device_id, batch in work:
+        db = Session()
+        try:
+            store.insert(db, device_id, batch)
+            db.commit()
+        finally:
+            db.close()
+        rows += len(batch)
+    return rows / (time.perf_counter() - start)
+
+
+def timed(fn, *args, runs=20):
+    fn(*args)  # warm-up
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = fn(*args)
+    return (time.perf_counter() - start) / runs, result
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    devices = int(args[0]) if args else 20
+    per_device = int(args[1]) if len(args) > 1 else 20000
+    use_mysql = "--mysql" in sys.argv
+
+    tmp = tempfile.TemporaryDirectory()
+    if use_mysql:
+        from server import engine
+    else:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp.name, 'readings.db')}")
+        Base.metadata.create_all(engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    stores = {
+        f"sql ({engine.dialect.name})": SqlReadingStore(engine),
+        "tsdb": ColumnarReadingStore(ColumnarStore(os.path.join(tmp.name, "tsdb"))),
+    }
+
+    print(f"🚀 Storage backends: {devices} devices x {per_device:,} readings")
+    print("-" * 72)
+    day = (START, START + timedelta(days=1))
+    try:
+        for label, store in stores.items():
+            random.seed(1)
+            batch_rate = ingest(store, Session, batches(devices, per_device))
+            single_rate = ingest(store, Session, (
+                ("bench-single", [reading("bench-single", seq, START + timedelta(seconds=5 * seq))])
+                for seq in range(SINGLE_INSERTS)
+            ))
+            history_time, history = timed(store.history, "bench-007", *day)
+            rollup_time, rollups = timed(store.rollups, "bench-007", day[0], day[1] - timedelta(hours=1))
+            latest_time, _ = timed(store.latest, "bench-007", runs=200)
+            print(f"{label}")
+            print(f"  ingest, batches of {BATCH_SIZE}:  {batch_rate:12,.0f} rows/s")
+            print(f"  ingest, single rows:     {single_rate:12,.0f} rows/s")
+            print(f"  day of history:          {history_time * 1000:12.2f} ms ({len(history['timestamp']):,} rows)")
+            print(f"  day of rollups:          {rollup_time * 1000:12.2f} ms ({len(rollups)} buckets)")
+            print(f"  latest reading:          {latest_time * 1000:12.3f} ms")
+        print("-" * 72)
+    finally:
+        stores["tsdb"].close()
+        if use_mysql:
+            with engine.begin() as conn:
+                conn.execute(delete(SoilData).where(SoilData.device_id.like("bench-%")))
+                conn.execute(delete(soil_rollup_hourly).where(soil_rollup_hourly.c.device_id.like("bench-%")))
+        engine.dispose()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# benchmark_storage_encoding.py
+"""
+Sensor storage encoding benchmark: INT/FLOAT columns vs raw SMALLINT.
+
+Loads the same synthetic readings into two tables, one with the current
+column types and one using ScaledInteger (register value * scale in
+SMALLINT), then reports bytes per row and the time to range-scan a day of
+one device's readings, decoded to physical units in both cases.
+
+By default the tables live in a temporary SQLite file. With --mysql the
+benchmark runs against the server's MySQL database (scratch tables
+bench_float / bench_scaled, dropped afterwards) and also reports InnoDB
+data size and the buffer-pool hit rate of the scans.
+
+Usage: python benchmark_storage_encoding.py [rows] [--mysql]
+    e.g. python benchmark_storage_encoding.py 100000000 --mysql
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    BigInteger, Column, DateTime, Float, Index, Integer, MetaData, String, Table,
+    create_engine, insert, select, text,
+)
+
+from models import SENSOR_SCALES, compact_type
+
+DEVICES = 100
+INSERT_BATCH = 20000
+FLOAT_FIELDS = ("ph", "humidity", "temperature")
+
+
+def make_table(metadata, name, compact):
+    columns = []
+    for field in SENSOR_SCALES:
+        if compact:
+            columns.append(Column(field, compact_type(field)))
+        else:
+            columns.append(Column(field, Float if field in FLOAT_FIELDS else Integer))
+    table = Table(
+        name, metadata,
+        Column("id", Integer, primary_key=True, autoincrement=True),
+        *columns,
+        Column("timestamp", DateTime),
+        Column("device_id", String(64)),
+        Column("seq", BigInteger),
+    )
+    Index(f"idx_{name}_device_ts", table.c.device_id, table.c.timestamp)
+    return table
+
+
+def synthetic_batches(rows):
+    start = datetime(2024, 1, 1)
+    per_device = rows // DEVICES
+    batch = []
+    for i in range(per_device):
+        ts = start + timedelta(seconds=5 * i)
+        for d in range(DEVICES):
+            batch.append({
+                "nitrogen": random.randint(10, 60), "phosphorus": random.randint(10, 45),
+                "potassium": random.randint(80, 220), "ph": random.randint(550, 850) / 100,
+                "ec": random.randint(50, 1500), "humidity": random.randint(200, 800) / 10,
+                "temperature": random.randint(-50, 350) / 10,
+                "timestamp": ts, "device_id": f"node-{d:03d}", "seq": i,
+            })
+            if len(batch) >= INSERT_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def bytes_per_row(engine, table, rows):
+    with engine.connect() as conn:
+        if engine.dialect.name == "mysql":
+            conn.execute(text(f"ANALYZE TABLE {table.name}"))
+            data = conn.execute(text(
+                "SELECT data_length FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = :name"
+            ), {"name": table.name}).scalar()
+        else:
+            data = conn.execute(text("SELECT SUM(pgsize) FROM dbstat WHERE name = :name"),
+                                {"name": table.name}).scalar()
+    return data / rows
+
+
+def buffer_pool_counters(conn):
+    rows = conn.execute(text(
+        "SHOW GLOBAL STATUS WHERE Variable_name IN "
+        "('Innodb_buffer_pool_read_requests', 'Innodb_buffer_pool_reads')"
+    ))
+    return {name: int(value) for name, value in rows}
+
+
+def range_scan(engine, table, runs=20):
+    """Time reading one device's day, decoded; returns (seconds per scan, rows, hit rate)"""
+    day_start = datetime(2024, 1, 1)
+    query = select(table).where(
+        table.c.device_id == "node-007",
+        table.c.timestamp >= day_start,
+        table.c.timestamp < day_start + timedelta(days=1),
+    )
+    mysql = engine.dialect.name == "mysql"
+    with engine.connect() as conn:
+        conn.execute(query).all()  # warm-up
+        before = buffer_pool_counters(conn) if mysql else None
+        start = time.perf_counter()
+        for _ in range(runs):
+            rows = conn.execute(query).all()
+        elapsed = (time.perf_counter() - start) / runs
+        hit_rate = None
+        if mysql:
+            after = buffer_pool_counters(conn)
+            requests = after["Innodb_buffer_pool_read_requests"] - before["Innodb_buffer_pool_read_requests"]
+            reads = after["Innodb_buffer_pool_reads"] - before["Innodb_buffer_pool_reads"]
+            hit_rate = 1 - reads / requests if requests else None
+    return elapsed, len(rows), hit_rate
+
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    rows = int(args[0]) if args else 1_000_000
+    use_mysql = "--mysql" in sys.argv
+
+    tmp = None
+    if use_mysql:
+        from server import engine
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        engine = create_engine(f"sqlite:///{os.path.join(tmp.name, 'encoding.db')}")
+
+    metadata = MetaData()
+    tables = {
+        "INT/FLOAT": make_table(metadata, "bench_float", compact=False),
+        "SMALLINT": make_table(metadata, "bench_scaled", compact=True),
+    }
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    print(f"🚀 Storage encoding: {rows:,} rows on {engine.dialect.name}")
+    print("-" * 60)
+    try:
+        for batch in synthetic_batches(rows):
+            with engine.begin() as conn:
+                for table in tables.values():
+                    conn.execute(insert(table), batch)
+
+        results = {}
+        for label, table in tables.items():
+            size = bytes_per_row(engine, table, rows)
+            scan, scanned, hit_rate = range_scan(engine, table)
+            results[label] = (size, scan)
+            hit = f"  buffer-pool hit rate {hit_rate:.2%}" if hit_rate is not None else ""
+            print(f"{label:10s} {size:7.1f} bytes/row   scan of {scanned:,} rows {scan * 1000:8.2f} ms{hit}")
+
+        (old_size, old_scan), (new_size, new_scan) = results["INT/FLOAT"], results["SMALLINT"]
+        print("-" * 60)
+        print(f"Row size:   {1 - new_size / old_size:6.1%} smaller")
+        print(f"Range scan: {old_scan / new_scan:6.2f}x")
+    finally:
+        metadata.drop_all(engine)
+        if tmp is not None:
+            tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
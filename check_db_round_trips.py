@@ -0,0 +1,99 @@
+# check_db_round_trips.py
+"""
+Database round trips per request, checked against a budget per route.
+
+Runs the server in-process against a throwaway SQLite database
+(STORAGE_BACKEND=sql) and sends a typical request sequence: a node
+posting readings and a batch, polling its ack, a dashboard reading
+history and the relay log, and an alert rule added and removed. Each
+request's round trips (statements plus COMMIT/ROLLBACK) are read from
+the per-route `db_round_trips` summary that GET /metrics reports.
+
+Budgets are written as the statements a route is meant to need, not as
+the counts it happens to make today. SQLite adds an explicit BEGIN and a
+COMMIT or ROLLBACK to every transaction, both free in-process. On MySQL
+each write saves the BEGIN, and a read on the autocommit pool is just its
+statements.
+
+The exit status is 1 if a request is over its budget, so the script can
+run in CI.
+
+Usage: python check_db_round_trips.py
+"""
+import os
+import sys
+import tempfile
+
+DATABASE_FILE = os.path.join(tempfile.mkdtemp(), "round_trips.db")
+os.environ.update({"DATABASE_URL": f"sqlite:///{DATABASE_FILE}", "STORAGE_BACKEND": "sql", "LOG_LEVEL": "WARNING"})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from metrics import metrics  # noqa: E402
+
+READING = {"nitrogen": 30, "phosphorus": 25, "potassium": 150, "ph": 6.8, "ec": 800,
+           "humidity": 45.0, "temperature": 24.0, "relay": "OFF", "device_id": "node-1"}
+RULE = {"parameter": "temperature", "operator": ">", "threshold": 35.0}
+
+
+def transaction(*statements):
+    """Budget of one transaction: its statements plus BEGIN and COMMIT/ROLLBACK"""
+    return len(statements) + 2
+
+
+# (label, method, path, body, route, budget)
+REQUESTS = [
+    # The relay state's first interval is written by a listener after the
+    # reading commits, in its own transaction, so it can never lose the reading
+    ("first reading", "post", "/soil-data", {**READING, "seq": 1}, "/soil-data",
+     transaction("INSERT reading", "upsert rollup") + transaction("close interval", "open interval")),
+    # Steady state: the relay state is unchanged, so nothing but the reading
+    ("next reading", "post", "/soil-data", {**READING, "seq": 2}, "/soil-data",
+     transaction("INSERT reading", "upsert rollup")),
+    # Answered from the dedupe cache
+    ("retried reading", "post", "/soil-data", {**READING, "seq": 2}, "/soil-data", 0),
+    # The same for any batch size: one multi-row INSERT and one upsert for all buckets
+    ("batch of 50", "post", "/soil-data/batch",
+     {"device_id": "node-1", "readings": [{**READING, "seq": seq} for seq in range(3, 53)]}, "/soil-data/batch",
+     transaction("SELECT stored seqs", "INSERT readings", "upsert rollups")),
+    ("ack poll", "get", "/soil-data/ack/node-1?from_seq=1", None, "/soil-data/ack/{device_id}",
+     transaction("SELECT max(seq)", "SELECT stored seqs")),
+    ("history", "get", "/history?device_id=node-1", None, "/history", transaction("SELECT readings")),
+    # Served from the query cache
+    ("history (cached)", "get", "/history?device_id=node-1", None, "/history", 0),
+    ("relay events", "get", "/relay-events?device_id=node-1", None, "/relay-events", transaction("SELECT events")),
+    # The rule to replace is found in memory, and the new id comes back with the INSERT
+    ("add alert rule", "post", "/alert-rules", RULE, "/alert-rules", transaction("INSERT rule")),
+    ("replace alert rule", "post", "/alert-rules", {**RULE, "threshold": 36.0}, "/alert-rules",
+     transaction("UPDATE rule")),
+    # The DELETE's row count says whether the rule existed
+    ("delete alert rule", "delete", "/alert-rules/1", None, "/alert-rules/{rule_id}", transaction("DELETE rule")),
+]
+
+
+def round_trips(route):
+    summary = metrics.snapshot()["summaries"].get(f"db_round_trips{{route={route}}}")
+    return summary["sum"] if summary else 0
+
+
+def main():
+    over = []
+    with TestClient(server.app) as client:
+        print(f"🚀 Database round trips per request ({server.engine.dialect.name})")
+        print("-" * 60)
+        for label, method, path, body, route, budget in REQUESTS:
+            before = round_trips(route)
+            response = getattr(client, method)(path, **({"json": body} if body is not None else {}))
+            response.raise_for_status()
+            used = round_trips(route) - before
+            within = used <= budget
+            print(f"{label:20} {used:4.0f}   budget {budget:2}   {'✅' if within else '❌ over budget'}")
+            if not within:
+                over.append(label)
+    print("-" * 60)
+    return 1 if over else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
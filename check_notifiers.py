@@ -0,0 +1,111 @@
+# check_notifiers.py
+"""
+End-to-end check of the webhook and SMTP notifiers against local stand-ins.
+
+Starts a throwaway HTTP server and a minimal SMTP sink on localhost, sends
+one alert through each backend and prints what the stand-ins received.
+No external services are contacted.
+
+Usage: python check_notifiers.py
+"""
+import json
+import socketserver
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from notifiers import SmtpNotifier, WebhookNotifier, describe
+
+SAMPLE_ALERT = {
+    "rule_id": 1,
+    "device_id": "node-1",
+    "parameter": "temperature",
+    "operator": ">",
+    "threshold": 30.0,
+    "value": 31.5,
+    "state": "firing",
+    "channel": "webhook",
+    "target": None,
+    "timestamp": "2024-06-01T12:00:00",
+}
+
+received = {"webhook": [], "smtp": []}
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        received["webhook"].append(json.loads(self.rfile.read(length)))
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class SmtpSinkHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP to accept one message"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost sink")
+        in_data, lines = False, []
+        for raw in self.rfile:
+            line = raw.decode().rstrip("\r\n")
+            if in_data:
+                if line == ".":
+                    received["smtp"].append("\n".join(lines))
+                    in_data, lines = False, []
+                    self.reply("250 OK")
+                else:
+                    lines.append(line)
+                continue
+            command = line.split(" ", 1)[0].upper()
+            if command == "DATA":
+                in_data = True
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+def serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+
+def main():
+    http_server = HTTPServer(("127.0.0.1", 0), WebhookHandler)
+    smtp_server = socketserver.TCPServer(("127.0.0.1", 0), SmtpSinkHandler)
+    http_port = serve(http_server)
+    smtp_port = serve(smtp_server)
+
+    print(f"🔔 Sending: {describe(SAMPLE_ALERT)}")
+    print("-" * 60)
+    ok = True
+    try:
+        WebhookNotifier(timeout=5).send(f"http://127.0.0.1:{http_port}/hook", SAMPLE_ALERT)
+        assert received["webhook"] and received["webhook"][0]["value"] == SAMPLE_ALERT["value"]
+        print(f"✅ Webhook delivered to stand-in on port {http_port}")
+    except Exception as e:
+        ok = False
+        print(f"❌ Webhook failed: {e}")
+
+    try:
+        SmtpNotifier(host="127.0.0.1", port=smtp_port).send("farmer@example.com", SAMPLE_ALERT)
+        assert received["smtp"] and "Soil alert" in received["smtp"][0]
+        print(f"✅ E-mail delivered to SMTP sink on port {smtp_port}")
+    except Exception as e:
+        ok = False
+        print(f"❌ SMTP failed: {e}")
+
+    http_server.shutdown()
+    smtp_server.shutdown()
+    print("🎉 All notifiers working" if ok else "⚠️ Some notifiers failed")
+
+
+if __name__ == "__main__":
+    main()
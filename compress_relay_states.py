@@ -0,0 +1,103 @@
+# compress_relay_states.py
+"""
+One-shot migration to run-length encoded relay state.
+
+Builds relay_intervals from the relay column of existing soil_data rows
+(one interval per run of unchanged state), then, on MySQL, converts the
+relay column from VARCHAR(10) to ENUM('OFF','ON') and drops the
+low-cardinality idx_relay index. Rows are streamed per device in chunks,
+so memory stays flat regardless of table size. Run it with the server
+stopped, since the server appends to relay_intervals on ingest.
+
+Usage: python compress_relay_states.py [--force]
+"""
+import sys
+
+from sqlalchemy import delete, func, insert, select, text
+
+from models import SoilData, RelayInterval, DEFAULT_DEVICE_ID
+from server import engine
+
+CHUNK_SIZE = 10000
+
+
+def device_intervals(conn, device_id):
+    """Yield (start, end, state) runs for one device, oldest first"""
+    device_filter = SoilData.device_id.is_(None) if device_id is None else SoilData.device_id == device_id
+    state = start = None
+    last_ts, last_id = None, 0
+    while True:
+        query = select(SoilData.id, SoilData.timestamp, SoilData.relay).where(device_filter)
+        if last_ts is not None:
+            query = query.where(
+                (SoilData.timestamp > last_ts) | ((SoilData.timestamp == last_ts) & (SoilData.id > last_id))
+            )
+        rows = conn.execute(query.order_by(SoilData.timestamp, SoilData.id).limit(CHUNK_SIZE)).all()
+        if not rows:
+            break
+        last_id, last_ts = rows[-1].id, rows[-1].timestamp
+        for _, timestamp, relay in rows:
+            relay = (relay or "OFF").strip().upper()
+            relay = relay if relay in ("ON", "OFF") else "OFF"
+            if relay != state:
+                if state is not None:
+                    yield start, timestamp, state
+                state, start = relay, timestamp
+    if state is not None:
+        yield start, None, state
+
+
+def build_intervals(force=False):
+    RelayInterval.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        existing = conn.execute(select(func.count()).select_from(RelayInterval)).scalar()
+    if existing and not force:
+        print(f"❌ relay_intervals already has {existing} rows; rerun with --force to rebuild it")
+        return False
+
+    total_intervals = 0
+    with engine.connect() as conn:
+        if existing:
+            conn.execute(delete(RelayInterval))
+        devices = conn.execute(select(SoilData.device_id).distinct()).scalars().all()
+        for device_id in devices:
+            batch = []
+            for start, end, state in device_intervals(conn, device_id):
+                batch.append({"device_id": device_id or DEFAULT_DEVICE_ID,
+                              "start_ts": start, "end_ts": end, "state": state})
+                if len(batch) >= CHUNK_SIZE:
+                    conn.execute(insert(RelayInterval), batch)
+                    total_intervals += len(batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(RelayInterval), batch)
+                total_intervals += len(batch)
+            conn.commit()
+            print(f"✅ {device_id or DEFAULT_DEVICE_ID}: intervals built")
+        total_rows = conn.execute(select(func.count()).select_from(SoilData)).scalar()
+
+    print(f"🎉 {total_rows} readings compressed into {total_intervals} relay intervals")
+    return True
+
+
+def compact_relay_column():
+    if engine.dialect.name != "mysql":
+        print("ℹ️ Not MySQL; relay column type left unchanged")
+        return
+    with engine.begin() as conn:
+        # NULL stays NULL: first-generation nodes have no relay
+        conn.execute(text("UPDATE soil_data SET relay = 'OFF' WHERE UPPER(relay) NOT IN ('ON', 'OFF')"))
+        conn.execute(text("ALTER TABLE soil_data MODIFY relay ENUM('OFF', 'ON') NULL DEFAULT 'OFF'"))
+        has_index = conn.execute(text(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'soil_data' AND index_name = 'idx_relay'"
+        )).scalar()
+        if has_index:
+            conn.execute(text("DROP INDEX idx_relay ON soil_data"))
+    print("✅ relay column is now ENUM('OFF','ON'); idx_relay dropped")
+
+
+if __name__ == "__main__":
+    print("🚀 Compressing relay states...")
+    if build_intervals(force="--force" in sys.argv):
+        compact_relay_column()
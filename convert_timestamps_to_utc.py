@@ -0,0 +1,173 @@
+# convert_timestamps_to_utc.py
+"""
+One-shot migration of stored timestamps from local time to UTC.
+
+Earlier versions stored naive wall-clock times in Asia/Kolkata; every
+timestamp column now holds naive UTC (see timezones.py). This shifts
+soil_data, alert_rules, relay_events and relay_intervals in key-ordered
+chunks, then rebuilds soil_rollup_hourly from the converted readings
+(buckets move by the half-hour offset, so they cannot simply be shifted).
+
+With STORAGE_BACKEND=tsdb the readings live under TSDB_PATH instead: each
+device's series is copied one chunk period at a time, timestamps shifted
+in one vectorised pass, into TSDB_PATH.utc, which then replaces TSDB_PATH;
+the original store is kept as TSDB_PATH.local. Its rollups are computed
+from the readings, so there is nothing to rebuild.
+
+Stop the server first and take a backup. A marker table
+(timestamp_migrations), and a marker file in the tsdb directory, record a
+completed run so the shift is never applied twice; if a run is
+interrupted, restore the backup and rerun.
+
+Usage: python convert_timestamps_to_utc.py [FROM_ZONE]
+"""
+import os
+import shutil
+import sys
+
+import numpy as np
+from sqlalchemy import Column, DateTime, MetaData, String, Table, bindparam, delete, func, select, update
+
+from backfill_rollups import backfill
+from models import AlertRule, RelayEvent, RelayInterval, SoilData, utc_now
+from rollups import soil_rollup_hourly
+from server import engine, store
+from timezones import to_utc, utc_column, zone
+from tsdb import COLUMNS, RECORD, ColumnarStore
+
+CHUNK_SIZE = 10000
+MIGRATION = "timestamps_utc"
+
+timestamp_migrations = Table(
+    "timestamp_migrations", MetaData(),
+    Column("name", String(32), primary_key=True),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def shift_by_id(conn, table, column, source):
+    """Convert one timestamp column of a table with an integer id, in id chunks"""
+    last_id = 0
+    total = 0
+    statement = update(table).where(table.c.id == bindparam("row_id")).values({column: bindparam("value")})
+    while True:
+        rows = conn.execute(
+            select(table.c.id, table.c[column]).where(table.c.id > last_id).order_by(table.c.id).limit(CHUNK_SIZE)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        changed = [{"row_id": row_id, "value": to_utc(value, source)} for row_id, value in rows if value is not None]
+        if changed:
+            conn.execute(statement, changed)
+        conn.commit()
+        total += len(rows)
+        print(f"✅ {table.name}.{column}: {total} rows converted...")
+
+
+def shift_intervals(conn, source):
+    """Convert relay_intervals, one device at a time, keys read before any is updated"""
+    table = RelayInterval.__table__
+    statement = update(table).where(
+        table.c.device_id == bindparam("key_device"), table.c.start_ts == bindparam("key_start")
+    ).values(start_ts=bindparam("start"), end_ts=bindparam("end"))
+    devices = conn.execute(select(table.c.device_id).distinct()).scalars().all()
+    for device_id in devices:
+        # One row per run of unchanged state, so a device's keys fit in memory;
+        # reading them all first means no shifted row is read (and shifted) again
+        rows = conn.execute(
+            select(table.c.start_ts, table.c.end_ts).where(table.c.device_id == device_id).order_by(table.c.start_ts)
+        ).all()
+        changes = [
+            {"key_device": device_id, "key_start": start, "start": to_utc(start, source), "end": to_utc(end, source)}
+            for start, end in rows
+        ]
+        # Keys moving later (zones west of UTC) are updated newest first, keys
+        # moving earlier oldest first: every shifted key lands beyond the ones
+        # still to be shifted, so the (device_id, start_ts) primary key never collides
+        if changes and changes[0]["start"] > changes[0]["key_start"]:
+            changes.reverse()
+        for offset in range(0, len(changes), CHUNK_SIZE):
+            conn.execute(statement, changes[offset:offset + CHUNK_SIZE])
+            conn.commit()
+        print(f"✅ relay_intervals for {device_id!r}: {len(changes)} rows converted")
+
+
+def convert_tsdb(columnar, source):
+    """Copy every series into a converted store, then swap it into place"""
+    root = columnar.path.rstrip(os.sep)
+    if os.path.exists(os.path.join(root, MIGRATION)):
+        print("✅ tsdb timestamps are already stored in UTC")
+        return True
+    target, backup = root + ".utc", root + ".local"
+    if os.path.exists(backup):
+        print(f"❌ {backup} already exists; move it away and rerun")
+        return False
+    # Left behind by an interrupted run; the original store is untouched
+    shutil.rmtree(target, ignore_errors=True)
+    converted = ColumnarStore(target, columnar.block_rows, columnar.chunk_days)
+    for device_id in columnar.devices():
+        series = columnar.series(device_id)
+        total = 0
+        for low, high in series.chunk_ranges():
+            columns = series.read(low, high, COLUMNS)
+            records = np.empty(len(columns["ts"]), RECORD)
+            for name in COLUMNS:
+                records[name] = columns[name]
+            records["ts"] = utc_column(columns["ts"].astype("datetime64[us]"), source).astype(np.int64)
+            converted.append(device_id, records)
+            total += len(records)
+        print(f"✅ tsdb series for {device_id!r}: {total} rows converted")
+    # Shifted rows straddle the old chunk boundaries; merge the small blocks
+    converted.compact()
+    converted.close()
+    columnar.close()
+    with open(os.path.join(target, MIGRATION), "w") as f:
+        f.write(f"{utc_now().isoformat()} from {source.zone}\n")
+    os.rename(root, backup)
+    os.rename(target, root)
+    print(f"✅ Original tsdb store kept as {backup}")
+    return True
+
+
+def convert(source_name="Asia/Kolkata"):
+    source = zone(source_name)
+    tsdb = store.name == "tsdb"
+
+    timestamp_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        applied = conn.execute(
+            select(func.count()).select_from(timestamp_migrations).where(timestamp_migrations.c.name == MIGRATION)
+        ).scalar()
+        if applied:
+            print("✅ Database timestamps are already stored in UTC")
+        else:
+            if not tsdb:
+                shift_by_id(conn, SoilData.__table__, "timestamp", source)
+            shift_by_id(conn, AlertRule.__table__, "created_at", source)
+            shift_by_id(conn, RelayEvent.__table__, "timestamp", source)
+            shift_intervals(conn, source)
+
+            if not tsdb:
+                soil_rollup_hourly.create(bind=conn, checkfirst=True)
+                conn.execute(delete(soil_rollup_hourly))
+            conn.execute(timestamp_migrations.insert().values(name=MIGRATION, applied_at=utc_now()))
+            conn.commit()
+
+    if tsdb:
+        if not convert_tsdb(store.columnar, source):
+            return False
+    elif applied:
+        store.close()
+        return True
+    else:
+        # Buckets are rebuilt from the converted readings
+        backfill(force=True)
+        store.close()
+    print(f"🎉 Timestamps converted from {source.zone} to UTC")
+    return True
+
+
+if __name__ == "__main__":
+    print("🚀 Converting stored timestamps to UTC...")
+    convert(*sys.argv[1:2])
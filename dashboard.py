@@ -1,17 +1,35 @@
 import time
 import streamlit as st
-import requests
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-import pandas as pd
 from datetime import datetime, timedelta
-import plotly.express as px
 import os
 from dotenv import load_dotenv
 
+# requests, pandas and plotly are imported where they are first used, so a
+# fresh dashboard process paints the page and sidebar before loading them
+# (python benchmark_cold_start.py measures this). Streamlit re-runs the
+# script on every interaction; later imports are dictionary lookups.
+
 # Load environment variables
 load_dotenv()
 
+def http():
+    """Keep-alive HTTP session to the server, one per viewer (requests.Session is not thread-safe)"""
+    if "http" not in st.session_state:
+        import requests
+        st.session_state.http = requests.Session()
+    return st.session_state.http
+
+@st.cache_resource
+def gauge_template():
+    """Layout shared by every gauge, built and validated once per process"""
+    import plotly.graph_objects as go
+    return go.layout.Template(layout=go.Layout(
+        height=200,
+        margin=dict(l=20, r=20, t=50, b=20),
+        paper_bgcolor="rgba(0,0,0,0)",
+        font={'color': "black", 'family': "Roboto"},
+    ))
+
 # Page configuration
 st.set_page_config(
     page_title="Smart Soil Dashboard", 
@@ -227,6 +245,17 @@ st.markdown("""
 # Enhanced sidebar with more options
 st.sidebar.header("⚙ Dashboard Controls")
 
+# Fleet overview or one device's detailed view
+if 'view' not in st.session_state:
+    st.session_state.view = "🌱 Single Device"
+st.sidebar.radio("🗺 View", ["🌱 Single Device", "🗺 Fleet Overview"], key="view")
+selected_device = st.session_state.get("selected_device")
+if selected_device:
+    st.sidebar.info(f"📟 Device: {selected_device}")
+    if st.sidebar.button("↩️ Latest from any device", use_container_width=True):
+        del st.session_state.selected_device
+        st.rerun()
+
 # Theme selector
 theme_option = st.sidebar.selectbox(
     "🎨 Dashboard Theme",
@@ -244,14 +273,14 @@ refresh_interval = st.sidebar.slider(
     help="Set how often the dashboard updates (5-300 seconds)"
 )
 
-# Data retention settings
-data_retention = st.sidebar.slider(
-    "📊 Historical data points",
-    min_value=10,
-    max_value=100,
-    value=20,
+# Chart history settings
+history_minutes = st.sidebar.slider(
+    "📊 History window (minutes)",
+    min_value=5,
+    max_value=120,
+    value=30,
     step=5,
-    help="Number of historical readings to keep for charts"
+    help="How much recent history the charts show"
 )
 
 # Alert thresholds customization
@@ -260,13 +289,51 @@ with st.sidebar.expander("🚨 Custom Alert Thresholds"):
     custom_ph_max = st.number_input("Max pH", value=8.0, step=0.1)
     custom_temp_max = st.number_input("Max Temperature (°C)", value=30, step=1)
     custom_humidity_max = st.number_input("Max Humidity (%)", value=70, step=1)
+    alert_webhook = st.text_input("Webhook URL (optional)", value="")
+    if st.button("💾 Save as Server Alert Rules", use_container_width=True):
+        channel = "webhook" if alert_webhook else "log"
+        thresholds = [
+            ("ph", "<", custom_ph_min, 0.1),
+            ("ph", ">", custom_ph_max, 0.1),
+            ("temperature", ">", custom_temp_max, 1.0),
+            ("humidity", ">", custom_humidity_max, 2.0),
+        ]
+        try:
+            for parameter, operator, threshold, hysteresis in thresholds:
+                http().post(
+                    "http://localhost:8000/alert-rules",
+                    json={
+                        "parameter": parameter,
+                        "operator": operator,
+                        "threshold": threshold,
+                        "hysteresis": hysteresis,
+                        "channel": channel,
+                        "target": alert_webhook or None,
+                    },
+                    timeout=5,
+                ).raise_for_status()
+            st.success("✅ Alert rules saved on the server")
+        except Exception as e:
+            st.error(f"Error saving alert rules: {str(e)}")
 
 # Export options
 with st.sidebar.expander("📤 Export Options"):
+    export_days = st.number_input("Days of data", min_value=1, max_value=3650, value=7, step=1)
+    export_format = st.selectbox("Format", ["csv", "ndjson", "parquet"])
+    export_start = (datetime.now() - timedelta(days=export_days)).strftime("%Y-%m-%dT%H:%M:%S")
     if st.button("💾 Export Current Data", use_container_width=True):
-        st.success("Data export feature coming soon!")
+        # The browser downloads straight from the server's streaming endpoint,
+        # so large exports never pass through the dashboard process
+        export_url = f"http://localhost:8000/export?format={export_format}&start={export_start}"
+        st.markdown(f"[⬇️ Download {export_format.upper()} export]({export_url})")
     if st.button("📈 Generate Report", use_container_width=True):
-        st.success("Report generation feature coming soon!")
+        try:
+            response = http().get("http://localhost:8000/report", params={"start": export_start}, timeout=30)
+            response.raise_for_status()
+            st.session_state.report = response.json()
+            st.success("✅ Report generated below")
+        except Exception as e:
+            st.error(f"Error generating report: {str(e)}")
 
 # Manual refresh button with enhanced styling
 if st.sidebar.button("🔄 Refresh Now", use_container_width=True):
@@ -277,10 +344,6 @@ if st.sidebar.button("🔄 Refresh Now", use_container_width=True):
 # Connection status with enhanced display
 st.sidebar.markdown("### 📡 System Status")
 
-# Initialize session state for data history with custom retention
-if 'data_history' not in st.session_state:
-    st.session_state.data_history = []
-
 # Initialize weather data session state with hourly refresh
 if 'weather_data' not in st.session_state:
     st.session_state.weather_data = None
@@ -309,8 +372,11 @@ def get_cached_weather_data():
 
 # Function to get data from server
 def get_soil_data():
+    import requests
+
     try:
-        response = requests.get("http://localhost:8000/latest-data", timeout=10)
+        params = {"device_id": selected_device} if selected_device else None
+        response = http().get("http://localhost:8000/latest-data", params=params, timeout=10)
         response.raise_for_status()
         return response.json(), True
     except requests.exceptions.ConnectionError:
@@ -320,8 +386,49 @@ def get_soil_data():
     except Exception as e:
         return {"error": str(e)}, False
 
-# Get current data
+# Recent readings from the server's ring buffer, shared by every viewer
+def get_history(device_id, minutes):
+    try:
+        response = http().get(
+            "http://localhost:8000/window",
+            params={"device_id": device_id, "seconds": minutes * 60},
+            timeout=10,
+        )
+        response.raise_for_status()
+        columns = response.json()["columns"]
+    except Exception:
+        return pd.DataFrame()
+    if not columns:
+        return pd.DataFrame()
+    df = pd.DataFrame(columns)
+    df["reading_time"] = pd.to_datetime(df.pop("timestamp"))
+    return df
+
+# Liveness of the device on screen: "Server Online" alone says nothing about the node
+def get_liveness(device_id):
+    try:
+        response = http().get("http://localhost:8000/liveness", params={"device_id": device_id}, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except Exception:
+        return None
+
+def describe_age(seconds):
+    if seconds is None:
+        return "never"
+    if seconds < 120:
+        return f"{seconds:.0f} s ago"
+    if seconds < 7200:
+        return f"{seconds / 60:.0f} min ago"
+    return f"{seconds / 3600:.1f} h ago"
+
+# Get current data (first use of pandas: everything above is already drawn)
+import pandas as pd
 data, is_connected = get_soil_data()
+if is_connected and 'message' not in data:
+    history = get_history(data.get("device_id") or "default", history_minutes)
+else:
+    history = pd.DataFrame()
 
 # Enhanced connection status display
 if is_connected and 'message' not in data:
@@ -329,8 +436,15 @@ if is_connected and 'message' not in data:
         '<div><span class="status-indicator status-online"></span><strong>Server Online</strong></div>',
         unsafe_allow_html=True
     )
-    st.sidebar.success("✅ Connected to sensors")
-    st.sidebar.info(f"🕒 Last ping: {datetime.now().strftime('%H:%M:%S')}")
+    device_liveness = get_liveness(data.get("device_id") or "default")
+    if device_liveness is None:
+        st.sidebar.warning("⚠ Device status unknown")
+    elif device_liveness["status"] == "online":
+        st.sidebar.success(f"✅ Device online (heard {describe_age(device_liveness['silent_seconds'])})")
+    else:
+        st.sidebar.error(f"❌ Device offline: silent since {describe_age(device_liveness['silent_seconds'])}")
+    if device_liveness is not None:
+        st.sidebar.info(f"🕒 Last reading: {describe_age(device_liveness['reading_age_seconds'])}")
 else:
     st.sidebar.markdown(
         '<div><span class="status-indicator status-offline"></span><strong>Server Offline</strong></div>',
@@ -341,9 +455,10 @@ else:
 
 # System info in sidebar
 st.sidebar.markdown("### 📊 System Info")
-if st.session_state.data_history:
-    st.sidebar.metric("📈 Data Points", len(st.session_state.data_history))
-    st.sidebar.metric("🕒 Session Duration", f"{len(st.session_state.data_history) * refresh_interval // 60} min")
+if not history.empty:
+    history_span = history["reading_time"].iloc[-1] - history["reading_time"].iloc[0]
+    st.sidebar.metric("📈 Data Points", len(history))
+    st.sidebar.metric("🕒 History Span", f"{int(history_span.total_seconds() // 60)} min")
 
 # Weather refresh status in sidebar
 st.sidebar.markdown("### 🌤 Weather Status")
@@ -369,7 +484,7 @@ def get_soil_recommendations(nitrogen, phosphorus, potassium, ec, moisture, humi
         nitrogen (int): Nitrogen level in mg/kg
         phosphorus (int): Phosphorus level in mg/kg  
         potassium (int): Potassium level in mg/kg
-        ec (int): Electrical conductivity in µS/cm
+        ec (int): Electrical conductivity in µS/cm (None without an EC probe)
         moisture (float): Soil moisture percentage
         humidity (float): Humidity percentage
         temperature (float): Temperature in °C
@@ -457,31 +572,32 @@ def get_soil_recommendations(nitrogen, phosphorus, potassium, ec, moisture, humi
             "action": "Reduce potassium fertilizer application"
         })
     
-    # Electrical Conductivity recommendations
-    if ec < 100:
-        recommendations.append({
-            "type": "warning",
-            "icon": "🔍",
-            "parameter": "Electrical Conductivity",
-            "message": "Soil salinity is low; nutrients may be deficient.",
-            "action": "Consider adding balanced fertilizers to improve nutrient availability"
-        })
-    elif 100 <= ec <= 1400:
-        recommendations.append({
-            "type": "good",
-            "icon": "✅",
-            "parameter": "Electrical Conductivity",
-            "message": "Soil salinity is normal.",
-            "action": "Maintain current soil management practices"
-        })
-    else:  # ec > 1400
-        recommendations.append({
-            "type": "critical",
-            "icon": "🚨",
-            "parameter": "Electrical Conductivity",
-            "message": "High soil salinity detected. Consider leaching or soil amendments.",
-            "action": "Implement soil leaching or add gypsum to reduce salinity"
-        })
+    # Electrical Conductivity recommendations (first-generation nodes have no EC probe)
+    if ec is not None:
+        if ec < 100:
+            recommendations.append({
+                "type": "warning",
+                "icon": "🔍",
+                "parameter": "Electrical Conductivity",
+                "message": "Soil salinity is low; nutrients may be deficient.",
+                "action": "Consider adding balanced fertilizers to improve nutrient availability"
+            })
+        elif 100 <= ec <= 1400:
+            recommendations.append({
+                "type": "good",
+                "icon": "✅",
+                "parameter": "Electrical Conductivity",
+                "message": "Soil salinity is normal.",
+                "action": "Maintain current soil management practices"
+            })
+        else:  # ec > 1400
+            recommendations.append({
+                "type": "critical",
+                "icon": "🚨",
+                "parameter": "Electrical Conductivity",
+                "message": "High soil salinity detected. Consider leaching or soil amendments.",
+                "action": "Implement soil leaching or add gypsum to reduce salinity"
+            })
     
     # Soil Moisture recommendations
     if moisture < 20:
@@ -565,6 +681,25 @@ def get_soil_recommendations(nitrogen, phosphorus, potassium, ec, moisture, humi
 
 # Function to create a gauge chart
 def create_gauge_chart(value, title, min_val, max_val, optimal_min, optimal_max, unit, delta=None, delta_ref=None):
+    import plotly.graph_objects as go
+
+    if value is None:
+        # Sensor not fitted (first-generation nodes have no pH or EC probe)
+        return go.Figure(go.Indicator(
+            mode="gauge",
+            value=min_val,
+            domain={'x': [0, 1], 'y': [0, 1]},
+            title={'text': f"{title} ({unit})<br><span style='font-size:0.8em;color:gray'>n/a</span>",
+                   'font': {'size': 16}},
+            gauge={
+                'axis': {'range': [min_val, max_val], 'tickwidth': 1, 'tickcolor': "black"},
+                'bar': {'color': "lightgray", 'thickness': 0},
+                'bgcolor': "whitesmoke",
+                'borderwidth': 2,
+                'bordercolor': "gray",
+            }
+        ), layout={"template": gauge_template()})
+
     # Define color ranges
     critical_color = "#f44336"  # Red
     warning_color = "#ff9800"   # Yellow
@@ -602,21 +737,17 @@ def create_gauge_chart(value, title, min_val, max_val, optimal_min, optimal_max,
                 'value': value
             }
         }
-    ))
-    fig.update_layout(
-        height=200,
-        margin=dict(l=20, r=20, t=50, b=20),
-        paper_bgcolor="rgba(0,0,0,0)",
-        font={'color': "black", 'family': "Roboto"}
-    )
+    ), layout={"template": gauge_template()})
     return fig
 
 # Function to control relay
 def control_relay(command):
+    import requests
+
     try:
-        response = requests.post(
+        response = http().post(
             "http://localhost:8000/control-relay", 
-            json={"command": command},
+            json={"command": command, "device_id": selected_device},
             timeout=5
         )
         response.raise_for_status()
@@ -655,7 +786,7 @@ def get_weather_data():
     
     try:
         url = f"http://api.openweathermap.org/data/2.5/weather?q={CITY}&appid={API_KEY}&units=metric"
-        response = requests.get(url, timeout=5)
+        response = http().get(url, timeout=5)
         response.raise_for_status()
         data = response.json()
         
@@ -687,14 +818,74 @@ def get_weather_data():
             "error": str(e)
         }
 
+# Fleet overview: one aggregated request per page, drill down into a device
+def open_device(device_id):
+    st.session_state.selected_device = device_id
+    st.session_state.view = "🌱 Single Device"
+
+if st.session_state.view == "🗺 Fleet Overview":
+    st.markdown("## 🗺 Fleet Overview")
+    fleet_col1, fleet_col2, fleet_col3 = st.columns(3)
+    fleet_sort = fleet_col1.selectbox("Sort by", ["staleness", "health", "device_id"])
+    fleet_status = fleet_col2.selectbox("Show", ["all", "online", "stale"])
+    fleet_page_size = fleet_col3.selectbox("Rows per page", [50, 100, 250], index=0)
+    fleet_page = st.session_state.get("fleet_page", 1)
+    try:
+        response = http().get(
+            "http://localhost:8000/fleet",
+            params={
+                "page": fleet_page,
+                "page_size": fleet_page_size,
+                "sort": fleet_sort,
+                "status": None if fleet_status == "all" else fleet_status,
+            },
+            timeout=10,
+        )
+        response.raise_for_status()
+        fleet = response.json()
+    except Exception as e:
+        st.error(f"Error loading fleet overview: {str(e)}")
+        st.stop()
+
+    summary_cols = st.columns(4)
+    summary_cols[0].metric("📟 Devices", fleet["total"])
+    summary_cols[1].metric("🟢 Online", fleet["online"])
+    summary_cols[2].metric("🔴 Stale", fleet["stale"])
+    summary_cols[3].metric("💧 Pumps ON", fleet["relay_on"])
+
+    if fleet["devices"]:
+        fleet_df = pd.DataFrame(fleet["devices"])
+        fleet_df["status"] = fleet_df["stale"].map({True: "🔴 stale", False: "🟢 online"})
+        fleet_df["age"] = pd.to_timedelta(fleet_df["age_seconds"], unit="s").astype(str)
+        st.dataframe(
+            fleet_df[["device_id", "status", "health", "relay", "age", "nitrogen", "phosphorus",
+                      "potassium", "ph", "ec", "humidity", "temperature"]],
+            column_config={
+                "health": st.column_config.ProgressColumn("Health", min_value=0, max_value=100, format="%d"),
+            },
+            hide_index=True,
+            use_container_width=True,
+            height=min(35 * len(fleet_df) + 38, 600),
+        )
+    else:
+        st.info("No devices match the current filter.")
+
+    pages = max((fleet["matching"] + fleet_page_size - 1) // fleet_page_size, 1)
+    nav_col1, nav_col2, nav_col3, nav_col4 = st.columns([1, 1, 2, 2])
+    if nav_col1.button("⬅️ Previous", disabled=fleet_page <= 1):
+        st.session_state.fleet_page = fleet_page - 1
+        st.rerun()
+    if nav_col2.button("Next ➡️", disabled=fleet_page >= pages):
+        st.session_state.fleet_page = fleet_page + 1
+        st.rerun()
+    nav_col3.markdown(f"Page **{fleet_page}** of **{pages}**")
+    if fleet["devices"]:
+        drill_device = nav_col4.selectbox("🔎 Open device", [d["device_id"] for d in fleet["devices"]])
+        nav_col4.button("Open", on_click=open_device, args=(drill_device,), use_container_width=True)
+    st.stop()
+
 # Enhanced main dashboard content
 if is_connected and 'message' not in data and 'error' not in data:
-    # Manage data history with custom retention
-    if len(st.session_state.data_history) >= data_retention:
-        st.session_state.data_history.pop(0)
-    
-    data_with_time = {**data, 'reading_time': datetime.now()}
-    st.session_state.data_history.append(data_with_time)
     
     # Enhanced status bar
     col_status1, col_status2, col_status3 = st.columns(3)
@@ -787,7 +978,7 @@ if is_connected and 'message' not in data and 'error' not in data:
     # Irrigation Relay Status Display - MOVED TO TOP
     st.markdown("## 💧 Irrigation Control System")
     
-    relay_status = data.get('relay', 'Unknown')
+    relay_status = data.get('relay') or 'Unknown'  # None for first-generation nodes
     current_mode = data.get('mode', 'auto')
     
     # Create control layout
@@ -810,7 +1001,7 @@ if is_connected and 'message' not in data and 'error' not in data:
             if st.button("🎛 MANUAL MODE", use_container_width=True, key="mode_toggle"):
                 # Switch to Auto Mode
                 try:
-                    response = requests.post("http://localhost:8000/set-auto-mode", timeout=5)
+                    response = http().post("http://localhost:8000/set-auto-mode", timeout=5)
                     if response.status_code == 200:
                         st.success("🤖 Switched to Auto Mode!")
                         time.sleep(1)
@@ -894,8 +1085,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             """, unsafe_allow_html=True)
     
     # Quick stats overview
-    if len(st.session_state.data_history) > 1:
-        df = pd.DataFrame(st.session_state.data_history)
+    if len(history) > 1:
+        df = history
         st.markdown("""
         <div class="quick-stats">
             <div class="stat-item">
@@ -937,8 +1128,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=20,
             optimal_max=50,
             unit="mg/kg",
-            delta=data['nitrogen'] - 25 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=25 if len(st.session_state.data_history) > 1 else None
+            delta=data['nitrogen'] - 25 if len(history) > 1 else None,
+            delta_ref=25 if len(history) > 1 else None
         )
         st.plotly_chart(nitrogen_fig, use_container_width=True)
         
@@ -951,8 +1142,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=15,
             optimal_max=40,
             unit="mg/kg",
-            delta=data['phosphorus'] - 27 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=27 if len(st.session_state.data_history) > 1 else None
+            delta=data['phosphorus'] - 27 if len(history) > 1 else None,
+            delta_ref=27 if len(history) > 1 else None
         )
         st.plotly_chart(phosphorus_fig, use_container_width=True)
         
@@ -965,8 +1156,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=100,
             optimal_max=200,
             unit="mg/kg",
-            delta=data['potassium'] - 150 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=150 if len(st.session_state.data_history) > 1 else None
+            delta=data['potassium'] - 150 if len(history) > 1 else None,
+            delta_ref=150 if len(history) > 1 else None
         )
         st.plotly_chart(potassium_fig, use_container_width=True)
     
@@ -982,8 +1173,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=custom_ph_min,
             optimal_max=custom_ph_max,
             unit="",
-            delta=data['ph'] - 7.0 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=7.0 if len(st.session_state.data_history) > 1 else None
+            delta=data['ph'] - 7.0 if len(history) > 1 and data['ph'] is not None else None,
+            delta_ref=7.0 if len(history) > 1 else None
         )
         st.plotly_chart(ph_fig, use_container_width=True)
         
@@ -996,8 +1187,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=100,
             optimal_max=1400,
             unit="µS/cm",
-            delta=data['ec'] - 750 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=750 if len(st.session_state.data_history) > 1 else None
+            delta=data['ec'] - 750 if len(history) > 1 and data['ec'] is not None else None,
+            delta_ref=750 if len(history) > 1 else None
         )
         st.plotly_chart(ec_fig, use_container_width=True)
         
@@ -1010,8 +1201,8 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=40,
             optimal_max=custom_humidity_max,
             unit="%",
-            delta=data['humidity'] - 55 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=55 if len(st.session_state.data_history) > 1 else None
+            delta=data['humidity'] - 55 if len(history) > 1 else None,
+            delta_ref=55 if len(history) > 1 else None
         )
         st.plotly_chart(humidity_fig, use_container_width=True)
     
@@ -1024,13 +1215,13 @@ if is_connected and 'message' not in data and 'error' not in data:
             optimal_min=15,
             optimal_max=custom_temp_max,
             unit="°C",
-            delta=data['temperature'] - 25 if len(st.session_state.data_history) > 1 else None,
-            delta_ref=25 if len(st.session_state.data_history) > 1 else None
+            delta=data['temperature'] - 25 if len(history) > 1 else None,
+            delta_ref=25 if len(history) > 1 else None
         )
         st.plotly_chart(temp_fig, use_container_width=True)
 
     # Enhanced charts with more visualization options
-    if len(st.session_state.data_history) > 1:
+    if len(history) > 1:
         st.markdown("## 📈 Advanced Analytics & Trends")
         
         # Chart type selector
@@ -1039,10 +1230,12 @@ if is_connected and 'message' not in data and 'error' not in data:
             ["Multi-Parameter View", "Individual Parameters", "Correlation Matrix", "Trend Analysis"]
         )
         
-        df = pd.DataFrame(st.session_state.data_history)
-        df['reading_time'] = pd.to_datetime(df['reading_time'])
+        df = history
+        import plotly.graph_objects as go
         
         if chart_type == "Multi-Parameter View":
+            from plotly.subplots import make_subplots
+
             # Create subplots
             fig = make_subplots(
                 rows=2, cols=2,
@@ -1116,14 +1309,39 @@ if is_connected and 'message' not in data and 'error' not in data:
             st.plotly_chart(fig, use_container_width=True)
             
         elif chart_type == "Correlation Matrix":
-            numeric_cols = ['nitrogen', 'phosphorus', 'potassium', 'ph', 'ec', 'humidity', 'temperature']
-            corr_matrix = df[numeric_cols].corr()
-            
-            fig = px.imshow(corr_matrix, 
-                          text_auto=True, 
-                          aspect="auto",
-                          title="Parameter Correlation Matrix")
-            st.plotly_chart(fig, use_container_width=True)
+            # Computed by the server over stored data, not just this session's readings
+            analytics_days = st.select_slider("Analysis window (days)", options=[1, 7, 30, 90, 365], value=30)
+            analytics_start = (datetime.now() - timedelta(days=analytics_days)).strftime("%Y-%m-%dT%H:%M:%S")
+            try:
+                response = http().get(
+                    "http://localhost:8000/analytics",
+                    params={"device_id": data.get("device_id") or "default", "start": analytics_start},
+                    timeout=30,
+                )
+                response.raise_for_status()
+                analytics = response.json()
+            except Exception as e:
+                analytics = None
+                st.error(f"Error loading analytics: {str(e)}")
+
+            if analytics and analytics["hours"]:
+                fields = analytics["correlation"]["fields"]
+                corr_matrix = pd.DataFrame(analytics["correlation"]["matrix"], index=fields, columns=fields, dtype=float)
+
+                import plotly.express as px  # the heaviest plotly module, only for this view
+                fig = px.imshow(corr_matrix.round(2),
+                              text_auto=True,
+                              aspect="auto",
+                              title=f"Parameter Correlation Matrix (hourly means, last {analytics_days} days)")
+                st.plotly_chart(fig, use_container_width=True)
+
+                lags = pd.DataFrame(analytics["cross_correlation"]["lags"])
+                fig = go.Figure(go.Bar(x=lags["lag_hours"], y=lags["r"], marker_color="lightblue"))
+                fig.update_layout(title="Irrigation → Humidity Response (correlation by lag)",
+                                  xaxis_title="Hours after irrigation", yaxis_title="r", height=350)
+                st.plotly_chart(fig, use_container_width=True)
+            elif analytics:
+                st.info("No stored data for this window yet")
             
         elif chart_type == "Trend Analysis":
             # Simple trend indicators
@@ -1355,6 +1573,50 @@ else:
     </div>
     """, unsafe_allow_html=True)
 
+# Report built from the server's hourly rollups
+if st.session_state.get("report"):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    report = st.session_state.report
+    st.markdown("## 📈 Soil Report")
+    st.caption(f"Generated {report['generated_at']} • from {report['start'] or 'first reading'}")
+    if not report["devices"]:
+        st.info("No rollup data in the selected range.")
+    for device_id, device_report in report["devices"].items():
+        summary = device_report["summary"]
+        st.markdown(f"### 🌱 Device {device_id}")
+        st.markdown(
+            f"{summary['samples']:,} readings from {device_report['first_bucket']} to "
+            f"{device_report['last_bucket']} • pump ON {summary['relay_on_fraction']:.0%} of readings"
+        )
+        params = ["nitrogen", "phosphorus", "potassium", "ph", "ec", "humidity", "temperature"]
+        st.dataframe(
+            pd.DataFrame({param.title(): summary[param] for param in params}).T.round(2),
+            use_container_width=True,
+        )
+        daily = pd.DataFrame([
+            {"day": day["bucket"], **{param: day[param]["mean"] for param in params}}
+            for day in device_report["daily"]
+        ])
+        fig = make_subplots(rows=1, cols=3, subplot_titles=("NPK (daily mean)", "pH", "Temperature & Humidity"))
+        for param, col in [("nitrogen", 1), ("phosphorus", 1), ("potassium", 1), ("ph", 2),
+                           ("temperature", 3), ("humidity", 3)]:
+            fig.add_trace(go.Scatter(x=daily["day"], y=daily[param], name=param.title(), mode="lines+markers"),
+                          row=1, col=col)
+        fig.update_layout(height=350, showlegend=True)
+        st.plotly_chart(fig, use_container_width=True)
+        st.download_button(
+            "⬇️ Download report (HTML)",
+            data=fig.to_html(include_plotlyjs="cdn"),
+            file_name=f"soil_report_{device_id}.html",
+            mime="text/html",
+            key=f"report_download_{device_id}",
+        )
+    if st.button("✖️ Close Report"):
+        del st.session_state.report
+        st.rerun()
+
 # Enhanced auto-refresh with countdown
 if refresh_interval > 0:
     # Wait for refresh interval without showing countdown
@@ -6,19 +6,154 @@ CREATE DATABASE IF NOT EXISTS soil_db;
 USE soil_db;
 
 -- Create the main soil_data table
+-- ph, ec and relay are NULL for first-generation nodes, which have no pH/EC
+-- probe or relay (existing installs: run `python allow_legacy_readings.py`)
 CREATE TABLE IF NOT EXISTS soil_data (
     id INT AUTO_INCREMENT PRIMARY KEY,
     nitrogen INT NOT NULL,
     phosphorus INT NOT NULL,
     potassium INT NOT NULL,
-    ph FLOAT NOT NULL,
-    ec INT NOT NULL,
+    ph FLOAT NULL,
+    ec INT NULL,
     humidity FLOAT NOT NULL,
     temperature FLOAT NOT NULL,
-    relay VARCHAR(10) DEFAULT 'OFF',
+    relay ENUM('OFF', 'ON') NULL DEFAULT 'OFF',
     timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+    device_id VARCHAR(64) NULL,
+    seq BIGINT UNSIGNED NULL,
     INDEX idx_timestamp (timestamp),
-    INDEX idx_relay (relay)
+    UNIQUE KEY uq_device_seq (device_id, seq)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Compact storage (COMPACT_STORAGE=1, see encode_sensor_columns.py) keeps the
+-- sensor registers as sent: nitrogen, phosphorus, potassium and ec as
+-- SMALLINT UNSIGNED, ph (x100) and humidity (x10) as SMALLINT UNSIGNED and
+-- temperature (x10) as SMALLINT, 2 bytes each instead of 4.
+
+-- Hourly per-device rollups, merged incrementally on ingest (see rollups.py)
+-- Existing installs: run `python backfill_rollups.py` once after creating it,
+-- and `python add_rollup_counts.py` if the table has no *_count columns yet
+CREATE TABLE IF NOT EXISTS soil_rollup_hourly (
+    device_id VARCHAR(64) NOT NULL,
+    bucket DATETIME NOT NULL,
+    samples INT NOT NULL,
+    relay_on INT NOT NULL,
+    nitrogen_sum DOUBLE, nitrogen_sumsq DOUBLE, nitrogen_min DOUBLE, nitrogen_max DOUBLE,
+    phosphorus_sum DOUBLE, phosphorus_sumsq DOUBLE, phosphorus_min DOUBLE, phosphorus_max DOUBLE,
+    potassium_sum DOUBLE, potassium_sumsq DOUBLE, potassium_min DOUBLE, potassium_max DOUBLE,
+    ph_sum DOUBLE, ph_sumsq DOUBLE, ph_min DOUBLE, ph_max DOUBLE,
+    ec_sum DOUBLE, ec_sumsq DOUBLE, ec_min DOUBLE, ec_max DOUBLE,
+    humidity_sum DOUBLE, humidity_sumsq DOUBLE, humidity_min DOUBLE, humidity_max DOUBLE,
+    temperature_sum DOUBLE, temperature_sumsq DOUBLE, temperature_min DOUBLE, temperature_max DOUBLE,
+    nitrogen_count INT NOT NULL DEFAULT 0, phosphorus_count INT NOT NULL DEFAULT 0,
+    potassium_count INT NOT NULL DEFAULT 0, ph_count INT NOT NULL DEFAULT 0, ec_count INT NOT NULL DEFAULT 0,
+    humidity_count INT NOT NULL DEFAULT 0, temperature_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (device_id, bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Alert rules evaluated by the server on every stored reading
+CREATE TABLE IF NOT EXISTS alert_rules (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    device_id VARCHAR(64) NULL,
+    parameter VARCHAR(20) NOT NULL,
+    operator VARCHAR(1) NOT NULL,
+    threshold FLOAT NOT NULL,
+    hysteresis FLOAT NOT NULL DEFAULT 0,
+    debounce INT NOT NULL DEFAULT 3,
+    channel VARCHAR(10) NOT NULL DEFAULT 'log',
+    target VARCHAR(255) NULL,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_alert_device (device_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Relay state, run-length encoded: one row per stretch of unchanged state
+-- Existing installs: run `python compress_relay_states.py` once
+CREATE TABLE IF NOT EXISTS relay_intervals (
+    device_id VARCHAR(64) NOT NULL,
+    start_ts DATETIME NOT NULL,
+    end_ts DATETIME NULL,
+    state ENUM('OFF', 'ON') NOT NULL,
+    PRIMARY KEY (device_id, start_ts)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Append-only relay audit log: issued, delivered and acknowledged commands
+CREATE TABLE IF NOT EXISTS relay_events (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    device_id VARCHAR(64) NULL,
+    event VARCHAR(12) NOT NULL,
+    command VARCHAR(3) NOT NULL,
+    mode VARCHAR(6) NULL,
+    command_id INT NULL,
+    latency_seconds FLOAT NULL,
+    timestamp DATETIME NOT NULL,
+    group_id INT NULL,
+    INDEX idx_relay_event_device_ts (device_id, timestamp),
+    INDEX idx_relay_event_group (group_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Device groups: farms, fields (parent: a farm) and zones (parent: a field)
+-- Existing installs: run `python add_device_groups.py` once
+CREATE TABLE IF NOT EXISTS device_groups (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    kind VARCHAR(5) NOT NULL,
+    parent_id INT NULL,
+    INDEX idx_group_parent (parent_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Device registry: the group each device belongs to
+CREATE TABLE IF NOT EXISTS devices (
+    device_id VARCHAR(64) NOT NULL PRIMARY KEY,
+    group_id INT NULL,
+    name VARCHAR(64) NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Hourly per-group rollups, merged on ingest for grouped devices (see groups.py)
+CREATE TABLE IF NOT EXISTS group_rollup_hourly (
+    group_id INT NOT NULL,
+    bucket DATETIME NOT NULL,
+    samples INT NOT NULL,
+    relay_on INT NOT NULL,
+    nitrogen_sum DOUBLE, nitrogen_sumsq DOUBLE, nitrogen_min DOUBLE, nitrogen_max DOUBLE,
+    phosphorus_sum DOUBLE, phosphorus_sumsq DOUBLE, phosphorus_min DOUBLE, phosphorus_max DOUBLE,
+    potassium_sum DOUBLE, potassium_sumsq DOUBLE, potassium_min DOUBLE, potassium_max DOUBLE,
+    ph_sum DOUBLE, ph_sumsq DOUBLE, ph_min DOUBLE, ph_max DOUBLE,
+    ec_sum DOUBLE, ec_sumsq DOUBLE, ec_min DOUBLE, ec_max DOUBLE,
+    humidity_sum DOUBLE, humidity_sumsq DOUBLE, humidity_min DOUBLE, humidity_max DOUBLE,
+    temperature_sum DOUBLE, temperature_sumsq DOUBLE, temperature_min DOUBLE, temperature_max DOUBLE,
+    nitrogen_count INT NOT NULL DEFAULT 0, phosphorus_count INT NOT NULL DEFAULT 0,
+    potassium_count INT NOT NULL DEFAULT 0, ph_count INT NOT NULL DEFAULT 0, ec_count INT NOT NULL DEFAULT 0,
+    humidity_count INT NOT NULL DEFAULT 0, temperature_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (group_id, bucket)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Scheduled irrigation programs (see schedule.py), indexed by next start
+CREATE TABLE IF NOT EXISTS irrigation_programs (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(64) NOT NULL,
+    device_id VARCHAR(64) NULL,
+    group_id INT NULL,
+    start_time VARCHAR(8) NOT NULL,
+    duration_seconds INT NOT NULL,
+    days VARCHAR(27) NOT NULL DEFAULT 'daily',
+    timezone VARCHAR(64) NOT NULL,
+    enabled BOOLEAN NOT NULL DEFAULT TRUE,
+    next_run DATETIME NULL,
+    run_until DATETIME NULL,
+    run_command_id INT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_program_next_run (next_run)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Gaps in each device's reading series (see gaps.py)
+CREATE TABLE IF NOT EXISTS reading_gaps (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    device_id VARCHAR(64) NOT NULL,
+    start_ts DATETIME NOT NULL,
+    end_ts DATETIME NOT NULL,
+    seconds DOUBLE NOT NULL,
+    INDEX idx_gap_device_start (device_id, start_ts)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- Create a user for the application (optional)
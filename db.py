@@ -1,32 +1,163 @@
 # db.py
-import aiosqlite
-
-DB_NAME = "soil_data.db"
-
-async def init_db():
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS soil_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nitrogen REAL,
-                phosphorus REAL,
-                potassium REAL,
-                ph REAL,
-                ec REAL,
-                humidity REAL,
-                temperature REAL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        await db.commit()
-
-async def insert_data(data):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('''
-            INSERT INTO soil_data (nitrogen, phosphorus, potassium, ph, ec, humidity, temperature)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['nitrogen'], data['phosphorus'], data['potassium'],
-            data['ph'], data['ec'], data['humidity'], data['temperature']
-        ))
-        await db.commit()
+"""
+SQLite backend for small installs (STORAGE_BACKEND=sqlite).
+
+Every table lives in one SQLite file (SQLITE_PATH) with the same columns
+and index names as the MySQL schema in database_setup.sql, created on
+start-up. The file runs in WAL mode with synchronous=NORMAL, so readers
+never block the writer and a commit appends to the WAL without an fsync
+(a power cut can lose the last commits, never corrupt the file).
+
+Readings are written by one long-lived writer connection on its own
+thread. Ingest requests queue their readings and wait; the writer takes
+everything queued, inserts it in a single BEGIN IMMEDIATE transaction
+with one rollup upsert for the whole group, and commits once. If the
+group fails, its requests are retried one transaction each so only the
+bad one gets the error. Under load many requests share a commit, which is
+what lets a Raspberry Pi sustain thousands of inserts per second. Reads
+use a small pool of reader connections.
+"""
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+
+from sqlalchemy import create_engine, event
+
+from metrics import metrics
+from rollups import aggregate, merge_rollups
+from storage import SqlReadingStore, insert_readings
+
+logger = logging.getLogger(__name__)
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "soil_monitor.db")  # soil_data.db is the legacy schema
+SQLITE_READERS = int(os.getenv("SQLITE_READERS", "4"))
+SQLITE_WRITE_BATCH = int(os.getenv("SQLITE_WRITE_BATCH", "500"))  # requests per commit
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+def sqlite_engine(url=None):
+    """Engine for a SQLite file with WAL, synchronous=NORMAL and a reader pool"""
+    engine = create_engine(
+        url or f"sqlite:///{SQLITE_PATH}",
+        connect_args={"check_same_thread": False},
+        # Readers, plus the writer and the occasional relay/alert-rule write
+        pool_size=SQLITE_READERS + 2,
+        max_overflow=0,
+    )
+
+    @event.listens_for(engine, "connect")
+    def configure(dbapi_connection, connection_record):
+        # Turn off pysqlite's implicit transactions so the "begin" hook below
+        # decides how each one starts; set the pragmas once per connection
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        # The writer takes the write lock up front instead of upgrading mid-transaction
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.info.get("writer") else "BEGIN")
+
+    return engine
+
+
+class SqliteWriter:
+    """One connection, one thread: queued inserts grouped into shared commits"""
+
+    def __init__(self, engine, max_batch=SQLITE_WRITE_BATCH):
+        self.engine = engine
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, device_id, rows):
+        """Insert one request's readings; returns their ids once committed"""
+        self.start()
+        future = Future()
+        self._queue.put((device_id, rows, future))
+        return future.result()
+
+    def stop(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+
+    def _run(self):
+        with self.engine.connect() as conn:
+            conn.info["writer"] = True
+            stop = False
+            while not stop:
+                item = self._queue.get()
+                if item is None:
+                    break
+                jobs = [item]
+                while len(jobs) < self.max_batch:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    jobs.append(item)
+                self._commit(conn, jobs)
+            conn.info.pop("writer", None)
+
+    def _commit(self, conn, jobs):
+        try:
+            with conn.begin():
+                results = [insert_readings(conn, rows) for _, rows, _ in jobs]
+                # One rollup upsert for the whole group
+                by_device = {}
+                for (device_id, rows, _), ids in zip(jobs, results):
+                    if ids:
+                        by_device.setdefault(device_id, []).extend(rows)
+                merge_rollups(conn, [row for device_id, rows in by_device.items()
+                                     for row in aggregate(device_id, rows)])
+        except Exception as e:
+            if len(jobs) == 1:
+                jobs[0][2].set_exception(e)
+                return
+            # Retry one request per transaction so only the failing one errors
+            logger.warning("Grouped SQLite commit of %d requests failed (%s); retrying one by one", len(jobs), e)
+            for job in jobs:
+                self._commit(conn, [job])
+            return
+        metrics.inc("sqlite_commits")
+        metrics.observe("sqlite_requests_per_commit", len(jobs))
+        for (_, _, future), ids in zip(jobs, results):
+            future.set_result(ids)
+
+
+class SqliteReadingStore(SqlReadingStore):
+    """soil_data in a SQLite file, written through the single writer"""
+
+    name = "sqlite"
+
+    def __init__(self, engine, writer=None):
+        super().__init__(engine)
+        self.writer = writer or SqliteWriter(engine)
+
+    def insert(self, db, device_id, rows):
+        # Reads during ingest stay on the request's session (a reader connection)
+        return self.writer.submit(device_id, rows)
+
+    def start(self):
+        self.writer.start()
+
+    def close(self):
+        self.writer.stop()
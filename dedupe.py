@@ -0,0 +1,69 @@
+# dedupe.py
+"""
+Recent-key cache for idempotent ingest.
+
+When a NodeMCU's HTTP POST times out after the server already stored the
+reading, the retry carries the same (device_id, seq). Remembering the most
+recent keys in memory rejects almost all of those retries without a
+database round trip; the unique index on (device_id, seq) catches the rest.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+
+DEDUPE_CACHE_SIZE = int(os.getenv("DEDUPE_CACHE_SIZE", "100000"))
+
+
+class RecentKeyCache:
+    """Bounded LRU set of recently stored (device_id, seq) keys"""
+
+    def __init__(self, maxsize=DEDUPE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def seen(self, key):
+        """Return True if the key was stored recently (a duplicate)"""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                self.cache_hits += 1
+                metrics.inc("dedupe_cache_hits")
+                return True
+            self.misses += 1
+            return False
+
+    def add(self, key):
+        with self._lock:
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+
+    def record_db_duplicate(self, key):
+        """The cache missed but the unique index rejected the insert"""
+        with self._lock:
+            # The key was counted as a miss in seen(); move it to db_hits
+            self.misses -= 1
+            self.db_hits += 1
+        metrics.inc("dedupe_db_hits")
+        self.add(key)
+
+    def stats(self):
+        with self._lock:
+            checked = self.cache_hits + self.db_hits + self.misses
+            duplicates = self.cache_hits + self.db_hits
+            return {
+                "size": len(self._keys),
+                "checked": checked,
+                "cache_hits": self.cache_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "duplicate_rate": duplicates / checked if checked else 0.0,
+                "cache_hit_rate": self.cache_hits / duplicates if duplicates else 0.0,
+            }
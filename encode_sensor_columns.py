@@ -0,0 +1,140 @@
+# encode_sensor_columns.py
+"""
+One-shot migration of soil_data to compact sensor storage.
+
+Multiplies pH, humidity and temperature by their register scale (100, 10,
+10) in id-range chunks, then converts the seven sensor columns to 2-byte
+SMALLINT (UNSIGNED except temperature, which can be negative). Start the
+server with COMPACT_STORAGE=1 afterwards so values are encoded on insert
+and decoded on read.
+
+Stop the server first: rows it writes during the run would stay unscaled
+and be decoded wrongly once the columns are SMALLINT (the run stops if
+new rows appear). Take a backup as well.
+
+Every value is checked against its SMALLINT range before anything is
+written, so the final ALTER cannot fail (or clip) on an out-of-range
+reading such as a sentinel stored under VALIDATION_MODE=flag. Progress
+is recorded in `sensor_encoding`, in the same transaction as each chunk,
+so an interrupted or failed run resumes where it stopped and never scales
+a row twice. Safe to rerun.
+
+Usage: python encode_sensor_columns.py
+"""
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import BigInteger, Column, DateTime, MetaData, String, Table, create_engine, select, text
+
+from models import OPTIONAL_FIELDS, SENSOR_FIELDS, SENSOR_SCALES, SIGNED_FIELDS, utc_now
+
+load_dotenv()
+
+CHUNK_SIZE = 50000
+MIGRATION = "sensor_scaling"
+SMALLINT_RANGES = {True: (-32768, 32767), False: (0, 65535)}  # signed, unsigned
+
+sensor_encoding = Table(
+    "sensor_encoding", MetaData(),
+    Column("name", String(32), primary_key=True),
+    Column("scaled_to_id", BigInteger, nullable=False),  # rows up to this id are scaled
+    Column("completed_at", DateTime, nullable=True),
+)
+
+
+def database_url():
+    """The server's database, without importing (and starting) the server"""
+    return os.getenv("DATABASE_URL") or "mysql+pymysql://{}:{}@{}/{}".format(
+        os.getenv("DB_USER", "root"), os.getenv("DB_PASSWORD", "your_password"),
+        os.getenv("DB_HOST", "localhost"), os.getenv("DB_NAME", "soil_db"),
+    )
+
+
+def column_types(conn):
+    rows = conn.execute(text(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = 'soil_data'"
+    ))
+    return {name.lower(): data_type.lower() for name, data_type in rows}
+
+
+def out_of_range(conn, fields, scaled, done_id):
+    """Rows per field whose register value (after scaling) does not fit its SMALLINT"""
+    checks = []
+    for f in fields:
+        value = f"CASE WHEN id > :done THEN ROUND({f} * {SENSOR_SCALES[f]}) ELSE {f} END" if f in scaled else f
+        low, high = SMALLINT_RANGES[f in SIGNED_FIELDS]
+        checks.append(f"COALESCE(SUM(CASE WHEN {value} < {low} OR {value} > {high} THEN 1 ELSE 0 END), 0)")
+    counts = conn.execute(text(f"SELECT {', '.join(checks)} FROM soil_data"), {"done": done_id}).one()
+    return {f: count for f, count in zip(fields, counts) if count}
+
+
+def encode(engine):
+    if engine.dialect.name != "mysql":
+        print("❌ This migration targets MySQL; SQLite copies can be recreated with create_all()")
+        return False
+
+    sensor_encoding.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        types = column_types(conn)
+        pending = [f for f in SENSOR_FIELDS if types.get(f) != "smallint"]
+        if not pending:
+            print("✅ Sensor columns are already compact")
+            return True
+
+        progress = conn.execute(select(sensor_encoding).where(sensor_encoding.c.name == MIGRATION)).first()
+        if progress is None:
+            conn.execute(sensor_encoding.insert().values(name=MIGRATION, scaled_to_id=0))
+            conn.commit()
+            done_id, completed = 0, False
+        else:
+            done_id, completed = progress.scaled_to_id, progress.completed_at is not None
+        scaled = [] if completed else [f for f in pending if SENSOR_SCALES[f] != 1]
+        if completed and conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM soil_data")).scalar() > done_id:
+            print(f"❌ Rows above id {done_id} were added after scaling and are unscaled: "
+                  "scale them by hand (or restore the backup) with the server stopped")
+            return False
+
+        bad = out_of_range(conn, pending, scaled, done_id)
+        if bad:
+            print("❌ Values outside the SMALLINT range (fix or delete these rows, then rerun): "
+                  + ", ".join(f"{f}: {count} rows" for f, count in bad.items()))
+            return False
+
+        if scaled:
+            max_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM soil_data")).scalar()
+            assignments = ", ".join(f"{f} = ROUND({f} * {SENSOR_SCALES[f]})" for f in scaled)
+            for start in range(done_id, max_id, CHUNK_SIZE):
+                end = min(start + CHUNK_SIZE, max_id)
+                conn.execute(
+                    text(f"UPDATE soil_data SET {assignments} WHERE id > :start AND id <= :end"),
+                    {"start": start, "end": end},
+                )
+                conn.execute(
+                    sensor_encoding.update().where(sensor_encoding.c.name == MIGRATION).values(scaled_to_id=end)
+                )
+                conn.commit()
+                print(f"✅ Scaled rows up to id {end} of {max_id}")
+
+            if conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM soil_data")).scalar() > max_id:
+                print("❌ Rows were added during the run: stop the server and rerun to scale them")
+                return False
+            conn.execute(
+                sensor_encoding.update().where(sensor_encoding.c.name == MIGRATION).values(completed_at=utc_now())
+            )
+            conn.commit()
+
+        modifications = ", ".join(
+            f"MODIFY {f} SMALLINT{'' if f in SIGNED_FIELDS else ' UNSIGNED'} {'NULL' if f in OPTIONAL_FIELDS else 'NOT NULL'}"
+            for f in pending
+        )
+        conn.execute(text(f"ALTER TABLE soil_data {modifications}"))
+        conn.commit()
+
+    print(f"🎉 Converted {', '.join(pending)} to SMALLINT; now start the server with COMPACT_STORAGE=1")
+    return True
+
+
+if __name__ == "__main__":
+    print("🚀 Encoding sensor columns as raw register integers (server stopped?)...")
+    encode(create_engine(database_url()))
@@ -0,0 +1,83 @@
+# events.py
+"""
+Live event stream for dashboards and integrations.
+
+`publish()` can be called from any thread; every subscriber has its own
+bounded asyncio queue and a slow subscriber only loses its own oldest
+events. `GET /events` streams them as Server-Sent Events.
+"""
+import asyncio
+import threading
+
+import orjson
+
+from metrics import metrics
+from timezones import localize
+
+SUBSCRIBER_QUEUE_SIZE = 1000
+KEEPALIVE_SECONDS = 15
+
+
+class EventBus:
+    """Fan-out of events to SSE subscribers"""
+
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._loop = None
+
+    def subscribe(self):
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        with self._lock:
+            self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+
+    def publish(self, event_type, data):
+        """Queue an event for every subscriber; never blocks"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        message = (event_type, data)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            self._deliver(subscribers, message)
+        elif self._loop is not None:
+            self._loop.call_soon_threadsafe(self._deliver, subscribers, message)
+
+    def _deliver(self, subscribers, message):
+        for queue in subscribers:
+            if queue.full():
+                queue.get_nowait()
+                metrics.inc("events_dropped")
+            queue.put_nowait(message)
+        metrics.inc("events_published")
+
+    async def stream(self, event_types=None, tz=None):
+        """Async generator of SSE-formatted messages for one subscriber (times shown in `tz`)"""
+        queue = self.subscribe()
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    event_type, data = await asyncio.wait_for(queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # SSE comment line keeps proxies from closing an idle stream
+                    yield ": keepalive\n\n"
+                    continue
+                if event_types and event_type not in event_types:
+                    continue
+                if tz is not None:
+                    data = localize(data, tz)
+                yield f"event: {event_type}\ndata: {orjson.dumps(data).decode()}\n\n"
+        finally:
+            self.unsubscribe(queue)
@@ -0,0 +1,153 @@
+# export.py
+"""
+Streaming export of raw readings as CSV, NDJSON or Parquet.
+
+Rows come from the reading store (storage.py) and are encoded one
+partition at a time; the SQL backend reads them with a server-side cursor
+(`yield_per`), so memory use is bounded by EXPORT_CHUNK_ROWS no matter how
+long the requested range is. Parquet output writes one row
+group per partition; it needs the optional `pyarrow` package.
+
+Timestamps are exported in UTC, as stored: NDJSON carries a `+00:00`
+suffix, Parquet uses a UTC-adjusted timestamp type and CSV keeps the
+stored naive UTC values.
+"""
+import csv
+import io
+import os
+
+import orjson
+from sqlalchemy import select
+
+from models import SoilData, DEFAULT_DEVICE_ID, SENSOR_FIELDS
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_COLUMNS = ("timestamp", "device_id", "seq", *SENSOR_FIELDS, "relay")
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+
+def device_filter(device_ids):
+    """soil_data rows of a device set; the default device's rows are stored with device_id NULL"""
+    condition = SoilData.device_id.in_(device_ids)
+    if DEFAULT_DEVICE_ID in device_ids:
+        condition = condition | SoilData.device_id.is_(None)
+    return condition
+
+
+def export_query(device_ids=None, start=None, end=None):
+    """Readings for a device set and time range, oldest first"""
+    query = select(*[SoilData.__table__.c[name] for name in EXPORT_COLUMNS])
+    if device_ids:
+        query = query.where(device_filter(device_ids))
+    if start is not None:
+        query = query.where(SoilData.timestamp >= start)
+    if end is not None:
+        query = query.where(SoilData.timestamp < end)
+    return query.order_by(SoilData.timestamp, SoilData.id)
+
+
+def iter_partitions(engine, query, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Yield lists of rows from a server-side cursor"""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=chunk_rows).execute(query)
+        for partition in result.partitions():
+            yield partition
+
+
+def stream_csv(partitions):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for partition in partitions:
+        writer.writerows(partition)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def stream_ndjson(partitions):
+    for partition in partitions:
+        yield b"".join(
+            orjson.dumps(dict(zip(EXPORT_COLUMNS, row)), option=orjson.OPT_NAIVE_UTC) + b"\n" for row in partition
+        )
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands written bytes back to the generator"""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def parquet_schema():
+    import pyarrow as pa
+
+    types = {
+        "timestamp": pa.timestamp("us", tz="UTC"),
+        "device_id": pa.string(),
+        "seq": pa.int64(),
+        "ph": pa.float64(),
+        "humidity": pa.float64(),
+        "temperature": pa.float64(),
+        "relay": pa.string(),
+    }
+    return pa.schema([(name, types.get(name, pa.int64())) for name in EXPORT_COLUMNS])
+
+
+def stream_parquet(partitions):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for partition in partitions:
+            columns = list(zip(*partition))
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            data = sink.drain()
+            if data:
+                yield data
+    yield sink.drain()
+
+
+def parquet_available():
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+STREAMERS = {"csv": stream_csv, "ndjson": stream_ndjson, "parquet": stream_parquet}
+
+
+def stream_export(store, fmt, device_ids=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+    """Encoded chunks of the requested export, read from a storage.ReadingStore"""
+    return STREAMERS[fmt](store.partitions(device_ids, start, end, chunk_rows))
@@ -0,0 +1,145 @@
+# fleet.py
+"""
+Latest state of every device for the fleet overview.
+
+The tracker keeps one row per device (latest values, relay state, time
+seen), updated by the ingest pipeline and seeded at start-up with a single
+grouped query, so `GET /fleet` answers for hundreds of devices from memory
+instead of one `/latest-data` round trip per node. Health scores and
+staleness are computed per request, which keeps them current even for
+devices that have gone quiet.
+"""
+import os
+import threading
+
+from sqlalchemy import and_, func, select
+
+from models import SoilData, SENSOR_FIELDS, DEFAULT_DEVICE_ID
+
+FLEET_STALE_SECONDS = int(os.getenv("FLEET_STALE_SECONDS", "300"))
+FLEET_MAX_PAGE_SIZE = 500
+
+# Same optimal bands the dashboard's recommendations use
+OPTIMAL_RANGES = {
+    "nitrogen": (20, 50),
+    "phosphorus": (15, 40),
+    "potassium": (100, 200),
+    "ph": (6.0, 8.0),
+    "ec": (100, 1400),
+    "humidity": (40, 70),
+    "temperature": (15, 30),
+}
+OUT_OF_RANGE_PENALTY = 10
+STALE_PENALTY = 40
+
+SORT_KEYS = ("device_id", "health", "staleness")
+
+
+def health_score(reading, stale):
+    """0-100: every parameter outside its optimal band and staleness cost points"""
+    score = 100
+    for field, (low, high) in OPTIMAL_RANGES.items():
+        value = reading.get(field)
+        if value is not None and not low <= value <= high:
+            score -= OUT_OF_RANGE_PENALTY
+    if stale:
+        score -= STALE_PENALTY
+    return max(score, 0)
+
+
+def latest_rows_query():
+    """Newest reading of every device in one grouped query"""
+    # By timestamp, not id: store-and-forward batches are inserted late,
+    # so their rows get higher ids than newer readings already stored
+    newest = (
+        select(SoilData.device_id, func.max(SoilData.timestamp).label("timestamp"))
+        .group_by(SoilData.device_id)
+        .subquery()
+    )
+    latest = (
+        select(func.max(SoilData.id).label("id"))  # one row where readings share a timestamp
+        .join(newest, and_(
+            SoilData.device_id.is_not_distinct_from(newest.c.device_id),
+            SoilData.timestamp == newest.c.timestamp,
+        ))
+        .group_by(SoilData.device_id)
+        .subquery()
+    )
+    return (
+        select(SoilData.device_id, SoilData.timestamp, SoilData.relay,
+               *[SoilData.__table__.c[field] for field in SENSOR_FIELDS])
+        .join(latest, SoilData.id == latest.c.id)
+    )
+
+
+class FleetTracker:
+    """Latest reading per device"""
+
+    def __init__(self, stale_seconds=FLEET_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def update(self, device_id, rows):
+        newest = max(rows, key=lambda row: row["timestamp"])
+        entry = {field: newest[field] for field in SENSOR_FIELDS}
+        entry["relay"] = newest.get("relay")
+        entry["timestamp"] = newest["timestamp"]
+        with self._lock:
+            current = self._latest.get(device_id)
+            # Store-and-forward batches can be older than what is already known
+            if current is None or current["timestamp"] <= entry["timestamp"]:
+                self._latest[device_id] = entry
+
+    def seed(self, rows):
+        """Start from the reading store's latest row per device"""
+        for row in rows:
+            reading = dict(row)
+            self.update(reading.pop("device_id") or DEFAULT_DEVICE_ID, [reading])
+
+    def device_count(self):
+        return len(self._latest)
+
+    def overview(self, now, page=1, page_size=50, sort="staleness", status=None):
+        """One page of device summaries plus fleet-wide totals"""
+        with self._lock:
+            items = list(self._latest.items())
+
+        devices = []
+        stale_count = relay_on = 0
+        for device_id, entry in items:
+            age = (now - entry["timestamp"]).total_seconds()
+            stale = age > self.stale_seconds
+            stale_count += stale
+            relay_on += str(entry["relay"]).upper() == "ON"
+            devices.append({
+                "device_id": device_id,
+                **entry,
+                "age_seconds": round(age),
+                "stale": stale,
+                "health": health_score(entry, stale),
+            })
+
+        if status == "stale":
+            devices = [d for d in devices if d["stale"]]
+        elif status == "online":
+            devices = [d for d in devices if not d["stale"]]
+
+        if sort == "health":
+            devices.sort(key=lambda d: (d["health"], d["device_id"]))
+        elif sort == "staleness":
+            devices.sort(key=lambda d: (-d["age_seconds"], d["device_id"]))
+        else:
+            devices.sort(key=lambda d: d["device_id"])
+
+        start = (page - 1) * page_size
+        return {
+            "total": len(items),
+            "matching": len(devices),
+            "online": len(items) - stale_count,
+            "stale": stale_count,
+            "relay_on": relay_on,
+            "page": page,
+            "page_size": page_size,
+            "devices": devices[start:start + page_size],
+        }
@@ -0,0 +1,111 @@
+# gaps.py
+"""
+Gaps in stored reading series.
+
+Gaps are found at ingest rather than by scanning soil_data. The detector
+remembers each device's newest reading time (seeded at start-up from the
+store's latest row per device), and a reading that arrives more than
+GAP_MIN_SECONDS after it opens a row in `reading_gaps` (device, last
+reading before, first reading after, length), indexed by device and
+start. In-order readings cost a comparison; nothing is written while a
+device reports steadily.
+
+Store-and-forward uploads can fill a gap after it was recorded. Readings
+older than the device's newest reading are looked up against that
+device's gaps (an indexed range query, only for such late batches), and
+the gaps they fall into are replaced by whatever stretches are still
+longer than GAP_MIN_SECONDS.
+"""
+import os
+import threading
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, select
+
+from metrics import metrics
+from models import DEFAULT_DEVICE_ID, ReadingGap
+
+GAP_MIN_SECONDS = float(os.getenv("GAP_MIN_SECONDS", "300"))
+
+
+def split_gaps(start, end, timestamps, min_gap):
+    """Stretches longer than min_gap between start, the timestamps inside (start, end) and end"""
+    points = [start, *sorted(ts for ts in timestamps if start < ts < end), end]
+    return [(low, high) for low, high in zip(points, points[1:]) if high - low > min_gap]
+
+
+class GapDetector:
+    """Newest reading time per device; new gaps are returned for writing"""
+
+    def __init__(self, min_seconds=GAP_MIN_SECONDS):
+        self.min_gap = timedelta(seconds=min_seconds)
+        self._newest = {}
+        self._lock = threading.Lock()
+
+    def seed(self, rows):
+        """Start from the reading store's latest row per device"""
+        with self._lock:
+            for row in rows:
+                self._newest[row["device_id"] or DEFAULT_DEVICE_ID] = row["timestamp"]
+
+    def observe(self, device_id, rows):
+        """(gaps opened by these readings, timestamps of late readings) for a device's stored rows"""
+        gaps = []
+        late = []
+        with self._lock:
+            newest = self._newest.get(device_id)
+            for ts in sorted(row["timestamp"] for row in rows):
+                if newest is None or ts >= newest:
+                    if newest is not None and ts - newest > self.min_gap:
+                        gaps.append((newest, ts))
+                    newest = ts
+                else:
+                    late.append(ts)
+            self._newest[device_id] = newest
+        return gaps, late
+
+    def record(self, conn, device_id, gaps, late=()):
+        """Write new gaps and shrink stored gaps that late readings fall into"""
+        table = ReadingGap
+        if late:
+            stored = conn.execute(
+                select(table.id, table.start_ts, table.end_ts)
+                .where(table.device_id == device_id, table.start_ts < max(late), table.end_ts > min(late))
+            ).all()
+            filled = [gap for gap in stored if any(gap.start_ts < ts < gap.end_ts for ts in late)]
+            if filled:
+                conn.execute(delete(table).where(table.id.in_([gap.id for gap in filled])))
+                metrics.inc("gaps_filled", len(filled))
+                for gap in filled:
+                    gaps.extend(split_gaps(gap.start_ts, gap.end_ts, late, self.min_gap))
+        if gaps:
+            conn.execute(insert(table), [
+                {"device_id": device_id, "start_ts": start, "end_ts": end, "seconds": (end - start).total_seconds()}
+                for start, end in gaps
+            ])
+            metrics.inc("gaps_detected", len(gaps))
+
+    def open_gap(self, device_id, now):
+        """The gap still running since a device's newest reading, if it is long enough"""
+        newest = self._newest.get(device_id)
+        if newest is None or now - newest <= self.min_gap:
+            return None
+        return {"device_id": device_id, "start_ts": newest, "end_ts": None,
+                "seconds": (now - newest).total_seconds(), "open": True}
+
+
+def query_gaps(conn, device_id=None, start=None, end=None, limit=100):
+    """Stored gaps overlapping [start, end), newest first"""
+    table = ReadingGap
+    query = (
+        select(table.device_id, table.start_ts, table.end_ts, table.seconds)
+        .order_by(table.start_ts.desc())
+        .limit(limit)
+    )
+    if device_id is not None:
+        query = query.where(table.device_id == device_id)
+    if start is not None:
+        query = query.where(table.end_ts > start)
+    if end is not None:
+        query = query.where(table.start_ts < end)
+    return [{**row._asdict(), "open": False} for row in conn.execute(query)]
@@ -0,0 +1,191 @@
+# groups.py
+"""
+Device groups: farms, fields and zones.
+
+Groups form a three-level hierarchy (farm -> field -> zone, stored in
+`device_groups`) and each device can be registered into one group (the
+`devices` table). The registry keeps the hierarchy in memory together
+with running totals per group over its members' latest readings: per
+sensor field the sum and count of the latest values, plus how many
+members report and how many have the relay ON.
+
+A reading only replaces its device's latest values, so ingest applies
+the difference to the device's group and that group's ancestors (at most
+three groups), whatever the group sizes. Group latest values, and relay
+commands sent to a group (see relay.py), therefore cost O(groups
+touched) instead of a pass over the member devices.
+
+Hourly group rollups (`group_rollup_hourly`, the same aggregates as the
+per-device rollups) are merged on ingest for the same groups, so group
+history reads one row per hour. A group's history counts the readings
+its devices sent while they were members.
+"""
+import threading
+
+from models import DEFAULT_DEVICE_ID, GROUP_KINDS, SENSOR_FIELDS
+from rollups import aggregate
+
+
+def _contribution(entry):
+    """What one device's latest reading adds to its groups' totals"""
+    if entry is None:
+        return None
+    return {
+        "reporting": 1,
+        "relay_on": int(str(entry["relay"]).upper() == "ON"),
+        "values": {field: entry[field] for field in SENSOR_FIELDS if entry[field] is not None},
+    }
+
+
+def _empty_totals():
+    return {"devices": 0, "reporting": 0, "relay_on": 0,
+            "sums": dict.fromkeys(SENSOR_FIELDS, 0.0), "counts": dict.fromkeys(SENSOR_FIELDS, 0)}
+
+
+class GroupRegistry:
+    """Group hierarchy, device membership and per-group totals of latest readings"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._groups = {}    # group id -> {"id", "name", "kind", "parent_id"}
+        self._children = {}  # group id -> child group ids
+        self._totals = {}    # group id -> running totals (_empty_totals)
+        self._members = {}   # device_id -> group id
+        self._latest = {}    # device_id -> latest reading (timestamp, sensor fields, relay)
+
+    def add_group(self, group):
+        """Add a group (id, name, kind, parent_id); the parent must be one level up"""
+        group = dict(group)
+        with self._lock:
+            self.check_parent(group["kind"], group["parent_id"])
+            self._groups[group["id"]] = group
+            self._children.setdefault(group["id"], [])
+            self._totals[group["id"]] = _empty_totals()
+            if group["parent_id"] is not None:
+                self._children[group["parent_id"]].append(group["id"])
+        return group
+
+    def check_parent(self, kind, parent_id):
+        """ValueError unless a `kind` group may have this parent"""
+        if kind not in GROUP_KINDS:
+            raise ValueError(f"kind must be one of {', '.join(GROUP_KINDS)}")
+        level = GROUP_KINDS.index(kind)
+        if level == 0:
+            if parent_id is not None:
+                raise ValueError("A farm has no parent group")
+            return
+        parent = self._groups.get(parent_id)
+        if parent is None or parent["kind"] != GROUP_KINDS[level - 1]:
+            raise ValueError(f"A {kind} needs a {GROUP_KINDS[level - 1]} as parent_id")
+
+    def load(self, groups, devices):
+        """Start from the stored groups (parents first) and device memberships"""
+        for group in sorted(groups, key=lambda g: GROUP_KINDS.index(g["kind"])):
+            self.add_group(group)
+        for device in devices:
+            if device["group_id"] is not None:
+                self.assign(device["device_id"], device["group_id"])
+
+    def group(self, group_id):
+        return self._groups.get(group_id)
+
+    def group_count(self):
+        return len(self._groups)
+
+    def _chain(self, group_id):
+        chain = []
+        while group_id is not None:
+            chain.append(group_id)
+            group_id = self._groups[group_id]["parent_id"]
+        return chain
+
+    def ancestors(self, device_id):
+        """The device's group and that group's ancestors, innermost first"""
+        group_id = self._members.get(device_id)
+        return tuple(self._chain(group_id)) if group_id is not None else ()
+
+    def _apply(self, chain, contribution, sign, membership=0):
+        for group_id in chain:
+            totals = self._totals[group_id]
+            totals["devices"] += membership
+            if contribution is None:
+                continue
+            totals["reporting"] += sign * contribution["reporting"]
+            totals["relay_on"] += sign * contribution["relay_on"]
+            for field, value in contribution["values"].items():
+                totals["sums"][field] += sign * value
+                totals["counts"][field] += sign
+
+    def assign(self, device_id, group_id):
+        """Move a device into a group (None: out of every group)"""
+        with self._lock:
+            if group_id is not None and group_id not in self._groups:
+                raise KeyError(group_id)
+            contribution = _contribution(self._latest.get(device_id))
+            previous = self._members.pop(device_id, None)
+            if previous is not None:
+                self._apply(self._chain(previous), contribution, -1, membership=-1)
+            if group_id is not None:
+                self._members[device_id] = group_id
+                self._apply(self._chain(group_id), contribution, 1, membership=1)
+
+    def update(self, device_id, rows):
+        """Fold a device's newly stored readings in; returns the groups touched"""
+        newest = max(rows, key=lambda row: row["timestamp"])
+        entry = {field: newest[field] for field in SENSOR_FIELDS}
+        entry["relay"] = newest.get("relay")
+        entry["timestamp"] = newest["timestamp"]
+        with self._lock:
+            current = self._latest.get(device_id)
+            chain = self._chain(self._members[device_id]) if device_id in self._members else []
+            # Store-and-forward batches can be older than the latest values
+            if current is None or current["timestamp"] <= entry["timestamp"]:
+                self._latest[device_id] = entry
+                self._apply(chain, _contribution(current), -1)
+                self._apply(chain, _contribution(entry), 1)
+        return chain
+
+    def seed(self, rows):
+        """Start from the reading store's latest row per device"""
+        for row in rows:
+            reading = dict(row)
+            self.update(reading.pop("device_id") or DEFAULT_DEVICE_ID, [reading])
+
+    def _summary(self, group_id):
+        totals = self._totals[group_id]
+        means = {}
+        for field in SENSOR_FIELDS:
+            count = totals["counts"][field]
+            means[field] = totals["sums"][field] / count if count else None
+        return {
+            **self._groups[group_id],
+            "devices": totals["devices"],
+            "reporting": totals["reporting"],
+            "relay_on": totals["relay_on"],
+            "means": means,
+        }
+
+    def latest(self, group_id):
+        """Mean latest values of a group's devices, and of each child group"""
+        with self._lock:
+            if group_id not in self._groups:
+                return None
+            summary = self._summary(group_id)
+            summary["children"] = [self._summary(child) for child in self._children[group_id]]
+        return summary
+
+    def tree(self):
+        """Every group with its device count, parents before children"""
+        with self._lock:
+            groups = [{**group, "devices": self._totals[group["id"]]["devices"]} for group in self._groups.values()]
+        return sorted(groups, key=lambda g: (GROUP_KINDS.index(g["kind"]), g["id"]))
+
+
+def group_rollup_rows(chain, rows):
+    """group_rollup_hourly rows for a device's newly stored readings, one set per group in `chain`"""
+    if not chain:
+        return []
+    buckets = aggregate(None, rows)
+    for bucket in buckets:
+        del bucket["device_id"]
+    return [{"group_id": group_id, **bucket} for group_id in chain for bucket in buckets]
@@ -0,0 +1,262 @@
+# ingest.py
+"""
+Ingest pipeline shared by `/soil-data` and `/soil-data/batch`.
+
+A batch of readings from one device goes through:
+
+1. deduplication against the recent-key cache and, for batches, one
+   indexed range query over (device_id, seq)
+2. sensor validation (quarantine or flag faulty readings)
+3. one write to the reading store (storage.py): on the SQL backend an
+   INSERT (executemany for batches) plus one rollup upsert
+4. listeners registered with `add_listener`, called with the stored rows
+
+Readings can carry the device's own clock (`client_ts`, Unix seconds) so
+readings buffered offline keep the time they were taken.
+
+Devices learn what they can drop from their buffer through an ack
+computed from `first_seq` (the oldest sequence number still buffered,
+default the lowest in the upload): `acked_seq` is the highest seq up to
+which every seq from `first_seq` on has reached the server, and `missing`
+lists the ranges above it (up to the upload's highest seq) that have not.
+Out-of-order or split uploads therefore never ack readings the server
+does not hold. Duplicates and quarantined readings count as received,
+since resending cannot help; quarantined seqs are remembered per device
+(the last MAX_BATCH_SIZE), so `GET /soil-data/ack` agrees with the batch
+response. After a restart they are listed as missing once more, and the
+resent readings are validated (and recorded) again.
+
+Ingest holds a per-device lock from the duplicate check to the commit,
+so concurrent retries of the same upload cannot both pass the check and
+roll up (or notify listeners about) the same readings twice. The unique
+index on (device_id, seq) still guards the rows themselves.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from models import utc_now
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "5000"))
+
+# Device clocks before this (unsynced NTP) or too far ahead are ignored
+MIN_CLIENT_EPOCH = 1577836800  # 2020-01-01
+MAX_CLOCK_SKEW_SECONDS = 300
+
+
+def ack_ranges(first_seq, received):
+    """
+    (acked_seq, missing) for the seqs received from `first_seq` on:
+    acked_seq is the end of the unbroken run starting at first_seq (None if
+    first_seq itself is missing), missing the [low, high] gaps above it
+    """
+    acked = None
+    missing = []
+    expected = first_seq
+    for seq in sorted(seq for seq in received if seq >= first_seq):
+        if seq > expected:
+            missing.append([expected, seq - 1])
+        if not missing:
+            acked = seq
+        expected = seq + 1
+    return acked, missing
+
+
+def resolve_timestamp(client_ts, received_at):
+    """Naive UTC timestamp for a reading, preferring a plausible device clock"""
+    if client_ts is None:
+        return received_at
+    if client_ts < MIN_CLIENT_EPOCH or client_ts > time.time() + MAX_CLOCK_SKEW_SECONDS:
+        metrics.inc("client_ts_rejected")
+        return received_at
+    return datetime.fromtimestamp(client_ts, timezone.utc).replace(tzinfo=None)
+
+
+class IngestResult:
+    """Outcome of ingesting one batch"""
+
+    def __init__(self):
+        self.ids = []            # ids of stored rows (single inserts only)
+        self.stored = 0
+        self.duplicates = 0
+        self.quarantined = []    # (reading, faults) pairs
+        self.acked_seq = None
+        self.missing = []        # [low, high] seq ranges the server does not hold
+
+    def as_dict(self):
+        return {
+            "stored": self.stored,
+            "duplicates": self.duplicates,
+            "quarantined": len(self.quarantined),
+            "acked_seq": self.acked_seq,
+            "missing": self.missing,
+        }
+
+
+class IngestPipeline:
+    """Deduplicate, validate, store and roll up readings from one device"""
+
+    def __init__(self, store, validator, dedupe_cache, validation_mode="quarantine"):
+        self.store = store
+        self.validator = validator
+        self.dedupe_cache = dedupe_cache
+        self.validation_mode = validation_mode
+        self.listeners = []
+        self._device_locks = {}
+        self._quarantined_seqs = {}  # device_id -> {seq: None}, oldest first, for the ack
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """Call `listener(device_id, rows)` after rows are committed"""
+        self.listeners.append(listener)
+
+    def _device_lock(self, device_id):
+        with self._lock:
+            return self._device_locks.setdefault(device_id, threading.Lock())
+
+    def ingest(self, db, device_id, readings, first_seq=None):
+        """
+        Ingest reading dicts (SoilInput fields) from one device and commit.
+        `device_id` is the id used for rollups and validation state; the
+        readings' own `device_id` is what gets stored. `first_seq` is the
+        oldest seq the device still buffers, for the ack.
+        """
+        result = IngestResult()
+        received_at = utc_now()
+        rows = []
+        for reading in readings:
+            row = dict(reading)
+            row["timestamp"] = resolve_timestamp(row.pop("client_ts", None), received_at)
+            rows.append(row)
+
+        # Oldest first, so stuck-sensor runs and rollups follow device time
+        if len(rows) > 1:
+            rows.sort(key=lambda r: (r.get("seq") is None, r.get("seq") or 0, r["timestamp"]))
+        seqs = [r["seq"] for r in rows if r.get("device_id") is not None and r.get("seq") is not None]
+        if seqs:
+            first_seq = min(seqs) if first_seq is None else min(first_seq, min(seqs))
+
+        with self._device_lock(device_id):
+            rows, stored = self._drop_duplicates(db, rows, result, first_seq)
+            if rows:
+                rows = self._validate(device_id, rows, result)
+            if rows:
+                self._store(db, device_id, rows, result)
+            db.commit()
+            self._record_quarantined(result)
+
+        for row in rows:
+            if row.get("device_id") is not None and row.get("seq") is not None:
+                self.dedupe_cache.add((row["device_id"], row["seq"]))
+
+        # Only acknowledge once the batch is durable; every seq of the upload
+        # is received (stored, duplicate or quarantined)
+        if seqs:
+            result.acked_seq, result.missing = ack_ranges(first_seq, stored | set(seqs))
+
+        if rows:
+            for listener in self.listeners:
+                try:
+                    listener(device_id, rows)
+                except Exception:
+                    logger.exception("Ingest listener %r failed", listener)
+        return result
+
+    def _drop_duplicates(self, db, rows, result, first_seq):
+        """Rows not stored yet, and the seqs already stored from first_seq up to the upload's highest"""
+        # A seq repeated within the upload is stored once (the unique index
+        # would drop the copy anyway), so only the first reaches rollups and listeners
+        unique = []
+        in_batch = set()
+        for row in rows:
+            key = (row.get("device_id"), row.get("seq"))
+            if key[0] is not None and key[1] is not None:
+                if key in in_batch:
+                    result.duplicates += 1
+                    continue
+                in_batch.add(key)
+            unique.append(row)
+        rows = unique
+
+        keyed = [r for r in rows if r.get("device_id") is not None and r.get("seq") is not None]
+        if not keyed:
+            return rows, set()
+
+        fresh = []
+        for row in rows:
+            key = (row.get("device_id"), row.get("seq"))
+            if key[0] is not None and key[1] is not None and self.dedupe_cache.seen(key):
+                result.duplicates += 1
+            else:
+                fresh.append(row)
+
+        # Batches: one range lookup instead of relying on INSERT IGNORE, so
+        # only rows that are really new are rolled up. The same lookup fills
+        # in the ack wherever the upload skips seqs from first_seq on
+        seqs = [r["seq"] for r in fresh if r.get("seq") is not None and r.get("device_id") is not None]
+        high = max(r["seq"] for r in keyed)
+        stored = set()
+        if len(seqs) > 1 or high - first_seq + 1 > len({r["seq"] for r in keyed}):
+            stored = self.store.stored_seqs(db, keyed[0]["device_id"], first_seq, high)
+            if stored:
+                kept = []
+                for row in fresh:
+                    if row.get("seq") in stored:
+                        self.dedupe_cache.record_db_duplicate((row["device_id"], row["seq"]))
+                        result.duplicates += 1
+                    else:
+                        kept.append(row)
+                fresh = kept
+        return fresh, stored
+
+    def _validate(self, device_id, rows, result):
+        check = self.validator.validate(device_id, rows)
+        if check.all_accepted:
+            return rows
+        for index, faults in check.reasons.items():
+            result.quarantined.append((rows[index], faults))
+        if self.validation_mode != "quarantine":
+            return rows
+        return [row for row, ok in zip(rows, check.accepted) if ok]
+
+    def _store(self, db, device_id, rows, result):
+        ids = self.store.insert(db, device_id, rows)
+        if not ids:
+            # The store already held this keyed reading and the cache did not know
+            row = rows[0]
+            self.dedupe_cache.record_db_duplicate((row["device_id"], row["seq"]))
+            result.duplicates += 1
+            rows.clear()
+            return
+        if len(rows) == 1:
+            result.ids.append(ids[0])
+        result.stored += len(rows)
+        metrics.inc("readings_stored", len(rows))
+
+    def _record_quarantined(self, result):
+        """Remember quarantined seqs as received (under the device lock)"""
+        for reading, _ in result.quarantined:
+            device, seq = reading.get("device_id"), reading.get("seq")
+            if device is None or seq is None:
+                continue
+            seqs = self._quarantined_seqs.setdefault(device, {})
+            seqs[seq] = None
+            if len(seqs) > MAX_BATCH_SIZE:
+                del seqs[next(iter(seqs))]
+
+    def ack(self, db, device, first_seq):
+        """(acked_seq, missing) for a device's received readings (stored or quarantined) from first_seq on"""
+        with self._device_lock(device):
+            quarantined = [seq for seq in self._quarantined_seqs.get(device, {}) if seq >= first_seq]
+        highest = self.store.max_seq(db, device)
+        if quarantined:
+            highest = max(highest if highest is not None else first_seq, max(quarantined))
+        if highest is None or highest < first_seq:
+            return None, []
+        received = self.store.stored_seqs(db, device, first_seq, highest)
+        return ack_ranges(first_seq, received | set(quarantined))
@@ -0,0 +1,177 @@
+# liveness.py
+"""
+Per-device liveness.
+
+Every stored reading and every `/relay-status` poll is a heartbeat, and
+all a heartbeat does is write the device's last-seen time into a dict.
+Deadlines sit in a heap with one entry per device. When an entry comes
+due, the device goes offline only if it has not been seen since;
+otherwise the entry is pushed back to last seen + LIVENESS_TIMEOUT_SECONDS.
+A healthy device therefore costs one heap pop and one push per timeout
+period however often it reports, and a check with nothing due is a look
+at the heap top. An asyncio task sleeps until the earliest deadline.
+
+Devices going offline and coming back are logged, published on the event
+stream (`device_offline` / `device_online`) and counted in /metrics.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from metrics import metrics
+from models import utc_now
+
+logger = logging.getLogger(__name__)
+
+LIVENESS_TIMEOUT_SECONDS = float(os.getenv("LIVENESS_TIMEOUT_SECONDS", "60"))
+LIVENESS_STATES = ("online", "offline")
+
+
+class LivenessTracker:
+    """Last-seen times plus one pending deadline per online device"""
+
+    def __init__(self, timeout=LIVENESS_TIMEOUT_SECONDS, notify=None):
+        self.timeout = timedelta(seconds=timeout)
+        self.notify = notify  # notify(event_type, payload) on every online/offline change
+        self._lock = threading.Lock()
+        self._seen = {}          # device_id -> last heartbeat
+        self._last_reading = {}  # device_id -> timestamp of the newest stored reading
+        self._offline = {}       # device_id -> time it went offline
+        self._deadlines = []     # (deadline, device_id), one per online device
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def _schedule(self, device_id, deadline):
+        heapq.heappush(self._deadlines, (deadline, device_id))
+        if self._deadlines[0][1] == device_id and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def heartbeat(self, device_id, now, reading_ts=None):
+        """A device was heard from (a reading stored at `reading_ts`, or a poll)"""
+        with self._lock:
+            known = device_id in self._seen
+            self._seen[device_id] = now
+            if reading_ts is not None:
+                newest = self._last_reading.get(device_id)
+                if newest is None or reading_ts > newest:
+                    self._last_reading[device_id] = reading_ts
+            down_since = self._offline.pop(device_id, None)
+            if down_since is not None or not known:
+                self._schedule(device_id, now + self.timeout)
+        if down_since is not None:
+            self._changed("device_online", device_id, now, (now - down_since).total_seconds())
+
+    def observe(self, device_id, rows):
+        """Ingest listener"""
+        self.heartbeat(device_id, utc_now(), max(row["timestamp"] for row in rows))
+
+    def seed(self, rows, now):
+        """Start from the reading store's latest row per device; silent ones start offline"""
+        with self._lock:
+            for row in rows:
+                device_id, seen = row["device_id"], row["timestamp"]
+                self._seen[device_id] = self._last_reading[device_id] = seen
+                if seen + self.timeout <= now:
+                    self._offline[device_id] = seen + self.timeout
+                else:
+                    self._schedule(device_id, seen + self.timeout)
+
+    def expire(self, now):
+        """Mark devices whose deadline passed without a heartbeat offline"""
+        gone = []
+        with self._lock:
+            while self._deadlines and self._deadlines[0][0] <= now:
+                _, device_id = heapq.heappop(self._deadlines)
+                deadline = self._seen[device_id] + self.timeout
+                if deadline <= now:
+                    self._offline[device_id] = deadline
+                    gone.append(device_id)
+                else:
+                    heapq.heappush(self._deadlines, (deadline, device_id))
+        for device_id in gone:
+            self._changed("device_offline", device_id, now, None)
+        return gone
+
+    def _changed(self, event_type, device_id, now, down_seconds):
+        metrics.inc("liveness_changes", state=event_type)
+        payload = {"device_id": device_id, "last_seen": self._seen.get(device_id), "timestamp": now}
+        if down_seconds is None:
+            logger.warning("Device %s is offline (silent since %s)", device_id, payload["last_seen"])
+        else:
+            payload["down_seconds"] = down_seconds
+            logger.info("Device %s is back online after %.0f s", device_id, down_seconds)
+        if self.notify is not None:
+            self.notify(event_type, payload)
+
+    def _entry(self, device_id, now):
+        seen = self._seen[device_id]
+        reading = self._last_reading.get(device_id)
+        return {
+            "device_id": device_id,
+            "status": "offline" if device_id in self._offline else "online",
+            "last_seen": seen,
+            "silent_seconds": round((now - seen).total_seconds(), 1),
+            "last_reading": reading,
+            "reading_age_seconds": round((now - reading).total_seconds(), 1) if reading is not None else None,
+        }
+
+    def device(self, device_id, now):
+        with self._lock:
+            return self._entry(device_id, now) if device_id in self._seen else None
+
+    def offline(self):
+        """Offline devices and when they went offline"""
+        with self._lock:
+            return dict(self._offline)
+
+    def overview(self, now, status=None):
+        """Every device (or only online/offline ones), longest silent first"""
+        with self._lock:
+            if status == "offline":
+                devices = list(self._offline)
+            else:
+                devices = [device for device in self._seen if status is None or device not in self._offline]
+            entries = [self._entry(device_id, now) for device_id in devices]
+            counts = self.counts()
+        entries.sort(key=lambda entry: (-entry["silent_seconds"], entry["device_id"]))
+        return {**counts, "timeout_seconds": self.timeout.total_seconds(), "devices": entries}
+
+    def counts(self):
+        offline = len(self._offline)
+        return {"online": len(self._seen) - offline, "offline": offline}
+
+    def start(self):
+        """Run the deadline timer on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            with self._lock:
+                due = self._deadlines[0][0] if self._deadlines else None
+            delay = self.timeout.total_seconds() if due is None else (due - utc_now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            try:
+                self.expire(utc_now())
+            except Exception:
+                logger.exception("Liveness check failed")
@@ -0,0 +1,206 @@
+# log_config.py
+"""
+Logging setup for the soil monitoring server.
+
+The device endpoints (`/soil-data`, `/relay-status`) are hit every few
+seconds by every NodeMCU, so their log lines must stay cheap:
+
+- messages use lazy %-style arguments and are only formatted when emitted
+- records tagged with a `route` can be sampled (1 in N) and rate limited
+  per route; warnings and errors are never dropped
+- with LOG_ASYNC enabled the request thread only puts the record on a
+  bounded queue and a QueueListener thread does the formatting (including
+  the %-interpolation) and I/O
+- LOG_FORMAT=json writes one JSON object per line with the `extra` fields
+
+Everything is configured from environment variables, see `.env.example`.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from metrics import metrics
+
+# Attributes present on every LogRecord; anything else came from `extra=`
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# Argument types that cannot change before the listener formats the record
+_IMMUTABLE_ARGS = (str, int, float, bytes, datetime, type(None))
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects"""
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class RouteSampler(logging.Filter):
+    """
+    Per-route sampling and rate limiting.
+
+    Only records carrying a `route` attribute below WARNING are affected.
+    `sample_every` keeps one record out of N for a route, and `max_per_second`
+    caps what is left with a token bucket.
+    """
+
+    def __init__(self, sample_every=None, max_per_second=0.0):
+        super().__init__()
+        self.sample_every = sample_every or {}
+        self.max_per_second = max_per_second
+        self._seen = {}
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        route = getattr(record, "route", None)
+        if route is None or record.levelno >= logging.WARNING:
+            return True
+
+        with self._lock:
+            seen = self._seen.get(route, 0) + 1
+            self._seen[route] = seen
+            every = self.sample_every.get(route, 1)
+            if every > 1 and seen % every != 1:
+                keep = False
+            elif self.max_per_second > 0:
+                keep = self._take_token(route)
+            else:
+                keep = True
+
+        if not keep:
+            metrics.inc("log_records_sampled_out", route=route)
+        return keep
+
+    def _take_token(self, route):
+        now = time.monotonic()
+        tokens, last = self._buckets.get(route, (self.max_per_second, now))
+        tokens = min(self.max_per_second, tokens + (now - last) * self.max_per_second)
+        if tokens < 1:
+            self._buckets[route] = (tokens, now)
+            return False
+        self._buckets[route] = (tokens - 1, now)
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks the request thread.
+
+    When the queue is full the record is dropped and counted instead of
+    raising. Time spent on the hot path is recorded in the metrics registry.
+    """
+
+    @staticmethod
+    def _freeze(arg):
+        return arg if isinstance(arg, _IMMUTABLE_ARGS) else str(arg)
+
+    def prepare(self, record):
+        # msg and args go on the queue unformatted and the listener's
+        # formatter interpolates them. Arguments that could still change
+        # (request objects, dicts, lists) are turned into strings first;
+        # numbers and strings are passed through so %d and %.1f still work.
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        if isinstance(record.args, dict):
+            record.args = {key: self._freeze(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(self._freeze(arg) for arg in record.args)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def emit(self, record):
+        start = time.perf_counter()
+        try:
+            self.enqueue(self.prepare(record))
+        except queue.Full:
+            metrics.inc("log_records_dropped")
+        except Exception:
+            self.handleError(record)
+        metrics.observe("log_emit_seconds", time.perf_counter() - start)
+
+
+def _parse_sample_rates(value):
+    """Parse 'route=N,route=N' into a dict of route -> N"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        route, _, every = item.partition("=")
+        try:
+            rates[route.strip()] = max(1, int(every))
+        except ValueError:
+            continue
+    return rates
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+def setup_logging():
+    """Configure the root logger from environment variables"""
+    global _listener
+
+    level = os.getenv("LOG_LEVEL", "INFO").upper()
+    log_format = os.getenv("LOG_FORMAT", "text").lower()
+    log_file = os.getenv("LOG_FILE")
+
+    output = logging.FileHandler(log_file) if log_file else logging.StreamHandler()
+    if log_format == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+
+    sampler = RouteSampler(
+        sample_every=_parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "")),
+        max_per_second=float(os.getenv("LOG_RATE_LIMIT", "0")),
+    )
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    if _env_flag("LOG_ASYNC", "1"):
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        front = BoundedQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+    else:
+        front = output
+
+    front.addFilter(sampler)
+    root.addHandler(front)
+    root.setLevel(level)
+    return root
+
+
+def shutdown_logging():
+    """Flush and stop the background writer"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,65 @@
+# metrics.py
+"""
+In-process metrics registry for the soil monitoring server.
+
+Counters and summaries are kept in plain dictionaries guarded by a lock, so
+recording a value costs well under a microsecond. The `/metrics` endpoint
+returns a snapshot of everything recorded since the process started.
+"""
+import threading
+from collections import defaultdict
+
+
+def _key(name, labels):
+    """Build a flat metric key such as 'log_records{route=/soil-data}'"""
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class MetricsRegistry:
+    """Thread-safe counters and summaries (count / sum / max)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._summaries = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                if value > summary[2]:
+                    summary[2] = value
+
+    def counter(self, name, **labels):
+        return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {
+                key: {"count": count, "sum": total, "avg": total / count, "max": peak}
+                for key, (count, total, peak) in self._summaries.items()
+            }
+        return {"counters": counters, "summaries": summaries}
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+
+
+# Shared registry used by every module of the server
+metrics = MetricsRegistry()
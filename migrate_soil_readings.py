@@ -0,0 +1,69 @@
+# migrate_soil_readings.py
+"""
+One-shot copy of the retired soil_data.py service's `soil_readings` table
+into the reading store.
+
+First-generation nodes now post to server.py like every other node; their
+old readings are copied the same way new ones are stored: under
+LEGACY_DEVICE_ID, with `phosphorous` -> phosphorus, `moisture` -> humidity,
+no pH, EC or relay, and rolled up on the way in. Rows are read in id order
+in chunks, so memory stays flat regardless of table size.
+
+soil_readings is read from the server's database, or from SOURCE_URL (e.g.
+the MySQL database when the server now runs on STORAGE_BACKEND=sqlite).
+
+Usage: python migrate_soil_readings.py [SOURCE_URL] [--force]
+"""
+import sys
+
+from sqlalchemy import MetaData, Table, create_engine, select
+
+from server import LEGACY_DEVICE_ID, SessionLocal, engine, store
+
+CHUNK_SIZE = 10000
+
+
+def migrate(source, force=False):
+    if store.latest(LEGACY_DEVICE_ID) is not None and not force:
+        print(f"❌ The store already has readings for {LEGACY_DEVICE_ID!r}; rerun with --force to add to them")
+        return False
+
+    readings = Table("soil_readings", MetaData(), autoload_with=source)
+    last_id = 0
+    total = 0
+    with source.connect() as conn:
+        while True:
+            rows = conn.execute(
+                select(readings).where(readings.c.id > last_id).order_by(readings.c.id).limit(CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]["id"]
+
+            converted = [
+                {
+                    "nitrogen": row["nitrogen"], "phosphorus": row["phosphorous"], "potassium": row["potassium"],
+                    "ph": None, "ec": None, "humidity": row["moisture"], "temperature": row["temperature"],
+                    "relay": None, "timestamp": row["timestamp"], "device_id": LEGACY_DEVICE_ID, "seq": None,
+                }
+                for row in rows if row["timestamp"] is not None
+            ]
+            db = SessionLocal()
+            try:
+                store.insert(db, LEGACY_DEVICE_ID, converted)
+                db.commit()
+            finally:
+                db.close()
+
+            total += len(rows)
+            print(f"✅ Copied {total} rows...")
+
+    store.close()
+    print(f"🎉 Migration complete: {total} rows stored under {LEGACY_DEVICE_ID!r}")
+    return True
+
+
+if __name__ == "__main__":
+    print("🚀 Copying soil_readings into the reading store...")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    migrate(create_engine(args[0]) if args else engine, force="--force" in sys.argv)
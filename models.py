@@ -0,0 +1,192 @@
+# models.py
+"""
+SQLAlchemy table definitions shared by the server and its helper modules.
+
+The MySQL schema itself is created by database_setup.sql; these classes
+only describe it (and are used with create_all() for SQLite test copies).
+"""
+from sqlalchemy import Column, Float, Integer, BigInteger, Boolean, DateTime, Enum, Index, SmallInteger, String, UniqueConstraint
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import declarative_base
+from sqlalchemy.types import TypeDecorator
+from datetime import datetime, timezone
+import os
+
+Base = declarative_base()
+
+# Device id used for rows sent by sketches that do not report one
+DEFAULT_DEVICE_ID = "default"
+
+# Sensor value columns, in the order the sketch sends them
+SENSOR_FIELDS = ("nitrogen", "phosphorus", "potassium", "ph", "ec", "humidity", "temperature")
+
+# Relay states; stored as a one-byte ENUM in MySQL
+RELAY_STATES = ("OFF", "ON")
+
+# Compact storage keeps the sensor's 16-bit register values (value * scale)
+# in SMALLINT columns instead of INT/FLOAT. Set COMPACT_STORAGE=1 after
+# running encode_sensor_columns.py on an existing database.
+COMPACT_STORAGE = os.getenv("COMPACT_STORAGE", "0") == "1"
+SENSOR_SCALES = {"nitrogen": 1, "phosphorus": 1, "potassium": 1, "ph": 100, "ec": 1, "humidity": 10, "temperature": 10}
+SIGNED_FIELDS = ("temperature",)  # the probe reports down to -40 °C
+
+# Stored as NULL for first-generation nodes, which have no pH/EC probe
+OPTIONAL_FIELDS = ("ph", "ec")
+
+def utc_now():
+    """Current time as naive UTC, the form every timestamp column stores (see timezones.py)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class ScaledInteger(TypeDecorator):
+    """
+    Fixed-point sensor value stored as the raw register integer.
+
+    Values are encoded when bound (inserts and WHERE comparisons alike) and
+    decoded when rows are fetched, so SQL filters and MIN/MAX/SUM run on the
+    2-byte integers while the rest of the server sees physical units.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, scale=1, signed=False):
+        super().__init__()
+        self.scale = scale
+        self.signed = signed
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "mysql":
+            return dialect.type_descriptor(mysql.SMALLINT(unsigned=not self.signed))
+        return dialect.type_descriptor(SmallInteger())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(round(value * self.scale))
+
+    def process_result_value(self, value, dialect):
+        if value is None or self.scale == 1:
+            return value
+        return value / self.scale
+
+def compact_type(field):
+    """2-byte column type for a sensor field; only scaled fields need decoding"""
+    signed = field in SIGNED_FIELDS
+    if SENSOR_SCALES[field] != 1:
+        return ScaledInteger(SENSOR_SCALES[field], signed=signed)
+    return SmallInteger().with_variant(mysql.SMALLINT(unsigned=not signed), "mysql")
+
+def sensor_column(field, legacy_type):
+    return Column(compact_type(field) if COMPACT_STORAGE else legacy_type)
+
+class SoilData(Base):
+    __tablename__ = "soil_data"
+    id = Column(Integer, primary_key=True)
+    nitrogen = sensor_column("nitrogen", Integer)
+    phosphorus = sensor_column("phosphorus", Integer)
+    potassium = sensor_column("potassium", Integer)
+    ph = sensor_column("ph", Float)
+    ec = sensor_column("ec", Integer)
+    humidity = sensor_column("humidity", Float)
+    temperature = sensor_column("temperature", Float)
+    relay = Column(Enum(*RELAY_STATES, name="relay_state"), default="OFF")  # Added relay status field
+    timestamp = Column(DateTime, default=utc_now)
+    device_id = Column(String(64), nullable=True)  # NodeMCU chip id, NULL for older sketches
+    seq = Column(BigInteger, nullable=True)  # Per-device sequence number used for deduplication
+
+    # Same index names as database_setup.sql, so a SQLite file matches MySQL
+    __table_args__ = (
+        Index("idx_timestamp", "timestamp"),
+        UniqueConstraint("device_id", "seq", name="uq_device_seq"),
+    )
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(64), nullable=True)  # NULL applies the rule to every device
+    parameter = Column(String(20), nullable=False)
+    operator = Column(String(1), nullable=False)  # ">" or "<"
+    threshold = Column(Float, nullable=False)
+    hysteresis = Column(Float, nullable=False, default=0.0)  # distance back past the threshold to clear
+    debounce = Column(Integer, nullable=False, default=3)  # consecutive breaching readings before firing
+    channel = Column(String(10), nullable=False, default="log")  # log, webhook or smtp
+    target = Column(String(255), nullable=True)  # webhook URL or e-mail address
+    enabled = Column(Boolean, nullable=False, default=True)
+    created_at = Column(DateTime, default=utc_now)
+
+    __table_args__ = (Index("idx_alert_device", "device_id"),)
+
+class RelayEvent(Base):
+    """Append-only relay audit log: commands issued, delivered and acknowledged"""
+    __tablename__ = "relay_events"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(64), nullable=True)  # NULL for commands issued to every device
+    event = Column(String(12), nullable=False)  # issued, delivered or acknowledged
+    command = Column(String(3), nullable=False)  # ON or OFF
+    mode = Column(String(6), nullable=True)  # auto or manual
+    command_id = Column(Integer, nullable=True)  # id of the issued event this one refers to
+    latency_seconds = Column(Float, nullable=True)  # time since the command was issued
+    timestamp = Column(DateTime, nullable=False, default=utc_now)
+    group_id = Column(Integer, nullable=True)  # set for commands issued to a device group
+
+    __table_args__ = (
+        Index("idx_relay_event_device_ts", "device_id", "timestamp"),
+        Index("idx_relay_event_group", "group_id"),
+    )
+
+class RelayInterval(Base):
+    """Run-length encoded relay state: one row per stretch of unchanged state"""
+    __tablename__ = "relay_intervals"
+    device_id = Column(String(64), primary_key=True)
+    start_ts = Column(DateTime, primary_key=True)
+    end_ts = Column(DateTime, nullable=True)  # NULL while the state is still current
+    state = Column(Enum(*RELAY_STATES, name="relay_state"), nullable=False)
+
+# Group levels, top down: a field belongs to a farm and a zone to a field
+GROUP_KINDS = ("farm", "field", "zone")
+
+class DeviceGroup(Base):
+    """A farm, field or zone; see groups.py"""
+    __tablename__ = "device_groups"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(64), nullable=False)
+    kind = Column(String(5), nullable=False)  # farm, field or zone
+    parent_id = Column(Integer, nullable=True)  # NULL for farms
+
+    __table_args__ = (Index("idx_group_parent", "parent_id"),)
+
+class Device(Base):
+    """Device registry: the group each device belongs to"""
+    __tablename__ = "devices"
+    device_id = Column(String(64), primary_key=True)
+    group_id = Column(Integer, nullable=True)  # NULL while the device is not in a group
+    name = Column(String(64), nullable=True)
+
+class IrrigationProgram(Base):
+    """A scheduled irrigation run, repeated daily or on given weekdays; see schedule.py"""
+    __tablename__ = "irrigation_programs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(64), nullable=False)
+    device_id = Column(String(64), nullable=True)  # target device, or
+    group_id = Column(Integer, nullable=True)  # target group; neither: every device
+    start_time = Column(String(8), nullable=False)  # HH:MM[:SS] local time in `timezone`
+    duration_seconds = Column(Integer, nullable=False)
+    days = Column(String(27), nullable=False, default="daily")  # daily, or e.g. mon,wed,fri
+    timezone = Column(String(64), nullable=False)
+    enabled = Column(Boolean, nullable=False, default=True)
+    next_run = Column(DateTime, nullable=True)  # next start, UTC
+    run_until = Column(DateTime, nullable=True)  # end of the run in progress, UTC
+    run_command_id = Column(Integer, nullable=True)  # relay_events id of the run in progress
+    created_at = Column(DateTime, default=utc_now)
+
+    __table_args__ = (Index("idx_program_next_run", "next_run"),)
+
+class ReadingGap(Base):
+    """A stretch with no stored readings from a device; see gaps.py"""
+    __tablename__ = "reading_gaps"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    device_id = Column(String(64), nullable=False)
+    start_ts = Column(DateTime, nullable=False)  # last reading before the gap
+    end_ts = Column(DateTime, nullable=False)  # first reading after it
+    seconds = Column(Float, nullable=False)
+
+    __table_args__ = (Index("idx_gap_device_start", "device_id", "start_ts"),)
@@ -2,6 +2,7 @@
 #include <ESP8266HTTPClient.h>
 #include <SoftwareSerial.h>
 #include <ModbusMaster.h>
+#include <time.h>
 
 // WiFi Credentials
 const char* ssid = "SEED-IOT-LAB";
@@ -26,6 +27,13 @@ ModbusMaster node;
 String controlMode = "auto";  // "auto" or "manual"
 bool relayState = false;
 
+// Deduplication: the server ignores a retried POST with the same (device_id, seq).
+// seq is seeded from the NTP clock at boot and incremented once per reading;
+// readings are 5 s apart, so seq never catches up with the clock and stays
+// increasing across reboots.
+String deviceId;
+unsigned long seq = 0;
+
 WiFiClient client;
 
 void preTransmission() { digitalWrite(MAX485_DE_RE, HIGH); }
@@ -58,6 +66,16 @@ void setup() {
     Serial.print(".");
   }
   Serial.println("\n✅ WiFi connected");
+
+  deviceId = String(ESP.getChipId(), HEX);
+  configTime(0, 0, "pool.ntp.org", "time.nist.gov");
+  for (int i = 0; i < 20 && time(nullptr) < 100000; i++) delay(500);
+  if (time(nullptr) >= 100000) {
+    seq = (unsigned long) time(nullptr);
+    Serial.println("🕒 NTP synced, seq starts at " + String(seq));
+  } else {
+    Serial.println("⚠️ NTP not available, sending readings without seq");
+  }
   Serial.println("🎛️ Relay control enabled on GPIO5 (D1)");
 }
 
@@ -104,7 +122,12 @@ void loop() {
     payload += "\"ec\":" + String(EC) + ",";
     payload += "\"humidity\":" + String(humidityPercent) + ",";
     payload += "\"temperature\":" + String(TMP / 10.0) + ",";
-    payload += "\"relay\":\"" + String(relayState ? "ON" : "OFF") + "\"";  // Fixed to match server expectation
+    payload += "\"relay\":\"" + String(relayState ? "ON" : "OFF") + "\",";  // Fixed to match server expectation
+    payload += "\"device_id\":\"" + deviceId + "\"";
+    if (seq > 0) {
+      seq++;
+      payload += ",\"seq\":" + String(seq);
+    }
     payload += "}";
 
     int httpCode = http.POST(payload);
@@ -113,7 +136,8 @@ void loop() {
 
     // --- Get control command from server ---
     HTTPClient httpRelay;
-    httpRelay.begin(client, relayControlUrl);
+    // device_id lets the server log delivery and acknowledgement per device
+    httpRelay.begin(client, String(relayControlUrl) + "?device_id=" + deviceId);
     int httpCodeRelay = httpRelay.GET();
     if (httpCodeRelay == 200) {
       String relayResponse = httpRelay.getString();
@@ -131,6 +155,10 @@ void loop() {
           Serial.println("🎛️ Manual OFF command executed");
         }
       } else if (relayResponse.indexOf("auto") != -1) {
+        // "auto off" ends a scheduled run: leave manual control with the pump off
+        if (controlMode == "manual" && relayResponse.indexOf("off") != -1 && relayState) {
+          setRelay(false);
+        }
         controlMode = "auto";
         Serial.println("🤖 Switched to AUTO mode");
       }
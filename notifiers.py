@@ -0,0 +1,139 @@
+# notifiers.py
+"""
+Alert delivery channels.
+
+Each notifier implements `send(target, alert)`. Delivery runs on a
+background thread fed by a bounded queue, so a slow webhook or SMTP server
+never holds up ingest. Hosts, ports and URLs are configuration, which
+makes every backend easy to point at a local stand-in (see
+check_notifiers.py).
+"""
+import json
+import logging
+import os
+import queue
+import threading
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "5"))
+
+
+def describe(alert):
+    """One-line human readable summary of an alert event"""
+    return (
+        f"[{alert['state'].upper()}] {alert['device_id']}: {alert['parameter']} = {alert['value']} "
+        f"({alert['operator']} {alert['threshold']})"
+    )
+
+
+class Notifier:
+    """Base class for delivery channels"""
+
+    def send(self, target, alert):
+        raise NotImplementedError
+
+
+class LogNotifier(Notifier):
+    """Write alerts to the server log"""
+
+    def send(self, target, alert):
+        logger.warning("Alert %s", describe(alert))
+
+
+class WebhookNotifier(Notifier):
+    """POST the alert as JSON to the rule's target URL"""
+
+    def __init__(self, timeout=WEBHOOK_TIMEOUT_SECONDS):
+        self.timeout = timeout
+
+    def send(self, target, alert):
+        import urllib.request  # only loaded once a webhook rule fires
+
+        body = json.dumps(alert, default=str).encode("utf-8")
+        request = urllib.request.Request(
+            target, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class SmtpNotifier(Notifier):
+    """E-mail the alert to the rule's target address"""
+
+    def __init__(self, host=None, port=None, sender=None, user=None, password=None, starttls=None):
+        self.host = host or os.getenv("SMTP_HOST", "localhost")
+        self.port = int(port or os.getenv("SMTP_PORT", "25"))
+        self.sender = sender or os.getenv("SMTP_SENDER", "soil-monitor@localhost")
+        self.user = user or os.getenv("SMTP_USER")
+        self.password = password or os.getenv("SMTP_PASSWORD")
+        self.starttls = starttls if starttls is not None else os.getenv("SMTP_STARTTLS", "0") == "1"
+
+    def send(self, target, alert):
+        import smtplib  # only loaded once an e-mail rule fires
+        from email.message import EmailMessage
+
+        message = EmailMessage()
+        message["Subject"] = f"🌱 Soil alert: {describe(alert)}"
+        message["From"] = self.sender
+        message["To"] = target
+        message.set_content(json.dumps(alert, default=str, indent=2))
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.user:
+                smtp.login(self.user, self.password)
+            smtp.send_message(message)
+
+
+class NotificationDispatcher:
+    """Route alerts to notifiers by channel name on a background thread"""
+
+    def __init__(self, notifiers, queue_size=NOTIFY_QUEUE_SIZE):
+        self.notifiers = notifiers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="alert-notifier", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def dispatch(self, channel, target, alert):
+        """Queue an alert for delivery; drops (and counts) when the queue is full"""
+        try:
+            self._queue.put_nowait((channel, target, alert))
+        except queue.Full:
+            metrics.inc("alerts_dropped", channel=channel)
+
+    def deliver(self, channel, target, alert):
+        notifier = self.notifiers.get(channel)
+        if notifier is None:
+            logger.error("No notifier for channel %s", channel)
+            return
+        try:
+            notifier.send(target, alert)
+            metrics.inc("alerts_sent", channel=channel)
+        except Exception as e:
+            metrics.inc("alerts_failed", channel=channel)
+            logger.error("Failed to deliver %s alert to %s: %s", channel, target, e)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            self.deliver(*item)
+
+
+def default_notifiers():
+    return {"log": LogNotifier(), "webhook": WebhookNotifier(), "smtp": SmtpNotifier()}
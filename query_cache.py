@@ -0,0 +1,150 @@
+# query_cache.py
+"""
+Result cache for the history, rollup and report endpoints.
+
+Several dashboards watching the same device and range send identical
+queries; the first one runs and the encoded response body is kept for
+the rest. Entries are keyed on (resolution, devices, range, fields, zone)
+and remember the device set and UTC range they cover:
+
+- Ingest invalidates only the entries whose devices and range contain a
+  newly stored reading (or its quarter-hour rollup bucket), so late
+  store-and-forward uploads clear exactly the closed ranges they change.
+- Ranges are half-open, [start, end): rollup queries return the buckets
+  that begin before `end`. A range ending at or before the start of the
+  current quarter hour is closed, since its last bucket has ended;
+  nothing but a late upload changes it, so it stays until evicted. Open
+  ranges (which include the current bucket) also expire after
+  QUERY_CACHE_TTL_SECONDS.
+- The total size of cached bodies is capped at QUERY_CACHE_MAX_BYTES,
+  least recently used first out.
+
+A query that was running while a write invalidated its devices is not
+stored, so a result from before the commit is never cached after it.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+from models import utc_now
+from rollups import bucket_start
+
+QUERY_CACHE_MAX_BYTES = int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "60"))
+
+
+class _Entry:
+    __slots__ = ("body", "devices", "start", "end", "expires")
+
+    def __init__(self, body, devices, start, end, expires):
+        self.body = body
+        self.devices = devices
+        self.start = start
+        self.end = end
+        self.expires = expires
+
+
+class QueryCache:
+    """LRU cache of encoded response bodies with TTL, size cap and range invalidation"""
+
+    def __init__(self, max_bytes=QUERY_CACHE_MAX_BYTES, ttl=QUERY_CACHE_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._by_device = {}  # device_id (None: all-device entries) -> keys
+        self._generation = {}  # device_id (None: everything) -> invalidation count
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _version(self, devices):
+        if devices is None:
+            return sum(self._generation.values())
+        return sum(self._generation.get(device, 0) for device in devices) + self._generation.get(None, 0)
+
+    def get(self, key, resolution, devices, start, end, load):
+        """
+        Cached body for `key`, or `load()` (bytes) run and cached. `devices`
+        (None: all devices) and the UTC range [start, end) (None: unbounded)
+        are what ingest invalidation matches against.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires is None or entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    metrics.inc("query_cache_hits", resolution=resolution)
+                    return entry.body, True
+                self._remove(key)
+            version = self._version(devices)
+            self.misses += 1
+        metrics.inc("query_cache_misses", resolution=resolution)
+
+        body = load()
+        closed = end is not None and end <= bucket_start(utc_now())
+        with self._lock:
+            if len(body) <= self.max_bytes and self._version(devices) == version:
+                self._remove(key)
+                expires = None if closed else time.monotonic() + self.ttl
+                self._entries[key] = _Entry(body, devices, start, end, expires)
+                self._bytes += len(body)
+                for device in devices or (None,):
+                    self._by_device.setdefault(device, set()).add(key)
+                while self._bytes > self.max_bytes:
+                    self._remove(next(iter(self._entries)))
+                    metrics.inc("query_cache_evictions")
+        return body, False
+
+    def invalidate(self, device_ids, first, last):
+        """Drop entries for these devices whose range holds a reading stored in [first, last]"""
+        # Rollup entries contain the reading's bucket if it begins before their end,
+        # raw entries the reading itself (same half-open bound as the queries)
+        low = bucket_start(first)
+        with self._lock:
+            for device_id in device_ids:
+                self._generation[device_id] = self._generation.get(device_id, 0) + 1
+            candidates = set(self._by_device.get(None, ()))
+            for device_id in device_ids:
+                candidates.update(self._by_device.get(device_id, ()))
+            stale = [
+                key for key in candidates
+                if (self._entries[key].end is None or low < self._entries[key].end)
+                and (self._entries[key].start is None or last >= self._entries[key].start)
+            ]
+            for key in stale:
+                self._remove(key)
+        if stale:
+            metrics.inc("query_cache_invalidations", len(stale))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_device.clear()
+            self._bytes = 0
+            self._generation[None] = self._generation.get(None, 0) + 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+            for device in entry.devices or (None,):
+                keys = self._by_device[device]
+                keys.discard(key)
+                if not keys:
+                    del self._by_device[device]
+
+    def stats(self):
+        with self._lock:
+            checked = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / checked if checked else 0.0,
+            }
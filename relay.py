@@ -0,0 +1,296 @@
+# relay.py
+"""
+Relay command tracking and the relay event log.
+
+Every command goes through three observable steps, each appended to the
+`relay_events` table:
+
+- issued:       the dashboard, an API client or an irrigation program
+                (schedule.py) asked for ON/OFF/auto, for one device, a
+                device group (farm, field or zone) or all
+- delivered:    the device fetched the command from /relay-status
+- acknowledged: a later reading from the device reports the commanded state
+
+The relay state itself is run-length encoded in `relay_intervals`: one row
+per stretch of unchanged state, closed when a reading shows the relay
+switching. Only transitions are written; repeated polls and readings that
+do not change anything cost a dictionary lookup. Pump-on durations and
+water use come from the intervals, never from scanning soil_data.
+
+Commands have a mode: manual (the device follows the command), auto (the
+device follows its own humidity threshold) or schedule (a program's run).
+The newest command for a device wins, except that a manual command in
+force overrides scheduled runs until a newer auto command restores auto
+mode.
+"""
+import os
+import threading
+from operator import itemgetter
+
+from sqlalchemy import and_, func, insert, or_, select, update
+
+from metrics import metrics
+from models import DEFAULT_DEVICE_ID, RelayEvent, RelayInterval
+
+PUMP_FLOW_LITRES_PER_MINUTE = float(os.getenv("PUMP_FLOW_LITRES_PER_MINUTE", "10"))
+
+
+def _order(command):
+    return -1 if command["id"] is None else command["id"]
+
+
+def device_response(command):
+    """
+    The /relay-status body for a command ("manual on", "auto off"). The
+    sketch knows manual and auto only: a run's ON is sent as a manual
+    command and its OFF hands control back to auto mode.
+    """
+    mode = command["mode"]
+    if mode == "schedule":
+        mode = "manual" if command["command"] == "ON" else "auto"
+    return f"{mode} {command['command'].lower()}"
+
+
+class RelayTracker:
+    """Current commands per device plus delivery/acknowledgement state"""
+
+    def __init__(self, now):
+        self._lock = threading.Lock()
+        self.broadcast = {"id": None, "command": "OFF", "mode": "auto", "timestamp": now}
+        self._device_commands = {}  # device_id -> command targeted at that device only
+        self._group_commands = {}   # group id -> command sent to every device in the group
+        self._delivered = {}        # device_id -> id of the last command it fetched
+        self._pending = {}          # device_id -> delivered manual command awaiting a reading
+        self._state = {}            # device_id -> (relay state, since) of the open interval
+        self._newest = {}           # device_id -> time of the newest reading with a relay state
+
+    def issue(self, conn, command, mode, now, pending, device_id=None, group_id=None):
+        """
+        Record a new command for a device or a group; with neither it
+        applies to every device. A group command is one row and one
+        dictionary entry however many devices the group holds.
+
+        The command is only appended to `pending`: devices are sent it once
+        the caller's transaction has committed and it calls `apply(pending)`,
+        so a rolled-back command never reaches a device.
+        """
+        result = conn.execute(insert(RelayEvent).values(
+            device_id=device_id, group_id=group_id, event="issued", command=command, mode=mode, timestamp=now,
+        ))
+        issued = {"id": result.inserted_primary_key[0], "command": command, "mode": mode, "timestamp": now}
+        pending.append((device_id, group_id, issued))
+        return issued
+
+    def issue_many(self, conn, command, mode, now, pending, device_ids=(), group_ids=()):
+        """One command to many devices and groups, in the caller's transaction"""
+        issued = [self.issue(conn, command, mode, now, pending, device_id=device_id) for device_id in device_ids]
+        issued += [self.issue(conn, command, mode, now, pending, group_id=group_id) for group_id in group_ids]
+        return issued
+
+    def apply(self, pending):
+        """Put committed commands (from `issue`) in force"""
+        with self._lock:
+            for device_id, group_id, issued in pending:
+                if device_id is not None:
+                    self._device_commands[device_id] = issued
+                elif group_id is not None:
+                    self._group_commands[group_id] = issued
+                else:
+                    self.broadcast = issued
+                metrics.inc("relay_commands_issued", mode=issued["mode"])
+
+    def current(self, device_id=None, group_id=None, pending=()):
+        """
+        The last command issued to exactly this target (None if not known),
+        counting commands still `pending` in the caller's transaction
+        """
+        for target_device, target_group, issued in reversed(pending):
+            if (target_device, target_group) == (device_id, group_id):
+                return issued
+        if device_id is not None:
+            return self._device_commands.get(device_id)
+        if group_id is not None:
+            return self._group_commands.get(group_id)
+        return self.broadcast
+
+    def effective(self, device_id, groups=()):
+        """
+        The command a device follows, from its own command, the commands of
+        its groups (groups.GroupRegistry.ancestors) and the broadcast command
+        """
+        candidates = [
+            command
+            for command in (self.broadcast, self._device_commands.get(device_id), *map(self._group_commands.get, groups))
+            if command is not None
+        ]
+        newest = max(candidates, key=_order)
+        # A manual override holds against scheduled runs until auto mode is restored
+        held = max((command for command in candidates if command["mode"] != "schedule"), key=_order, default=None)
+        if held is not None and held["mode"] == "manual":
+            return held
+        return newest
+
+    def poll(self, device_id, now, groups=()):
+        """Command to send to a polling device, plus a delivered event the first time"""
+        with self._lock:
+            command = self.effective(device_id, groups)
+            if command["id"] is None or self._delivered.get(device_id) == command["id"]:
+                return command, []
+            self._delivered[device_id] = command["id"]
+            # Only commands the device follows are acknowledged by a reading
+            if device_response(command).startswith("manual"):
+                self._pending[device_id] = command
+            else:
+                self._pending.pop(device_id, None)
+        latency = (now - command["timestamp"]).total_seconds()
+        metrics.observe("relay_delivery_seconds", latency)
+        return command, [self._event(device_id, "delivered", command, now, latency)]
+
+    def observe_readings(self, device_id, rows):
+        """Acknowledgement events and relay transitions for newly stored readings"""
+        events = []
+        transitions = []
+        with self._lock:
+            for row in sorted(rows, key=itemgetter("timestamp")):
+                state = row.get("relay")
+                if state is None:
+                    continue
+                now = row["timestamp"]
+                newest = self._newest.get(device_id)
+                if newest is None or now > newest:
+                    # Late store-and-forward readings, older than the newest
+                    # one seen, cannot reopen history and are skipped
+                    self._newest[device_id] = now
+                    current = self._state.get(device_id)
+                    if current is None or current[0] != state:
+                        self._state[device_id] = (state, now)
+                        transitions.append({"device_id": device_id, "state": state, "timestamp": now})
+                pending = self._pending.get(device_id)
+                if pending is not None and pending["command"] == state:
+                    del self._pending[device_id]
+                    latency = max((now - pending["timestamp"]).total_seconds(), 0.0)
+                    metrics.observe("relay_actuation_seconds", latency)
+                    events.append(self._event(device_id, "acknowledged", pending, now, latency))
+        return events, transitions
+
+    def pending(self):
+        """Delivered manual commands that no reading has confirmed yet"""
+        with self._lock:
+            return {device: dict(command) for device, command in self._pending.items()}
+
+    def _event(self, device_id, event, command, now, latency):
+        return {"device_id": device_id, "event": event, "command": command["command"],
+                "mode": command["mode"], "command_id": command["id"],
+                "latency_seconds": latency, "timestamp": now}
+
+    def append(self, conn, events, transitions=()):
+        if events:
+            conn.execute(insert(RelayEvent), events)
+            metrics.inc("relay_events_written", len(events))
+        for transition in transitions:
+            # Close the open interval, then open the next one
+            conn.execute(
+                update(RelayInterval)
+                .where(RelayInterval.device_id == transition["device_id"], RelayInterval.end_ts.is_(None))
+                .values(end_ts=transition["timestamp"])
+            )
+            conn.execute(insert(RelayInterval).values(
+                device_id=transition["device_id"], start_ts=transition["timestamp"], state=transition["state"],
+            ))
+        if transitions:
+            metrics.inc("relay_transitions", len(transitions))
+
+    def seed(self, conn):
+        """Restore the broadcast and group commands and last known relay states after a restart"""
+        table = RelayEvent
+        last_issued = conn.execute(
+            select(table.id, table.command, table.mode, table.timestamp)
+            .where(table.event == "issued", table.device_id.is_(None), table.group_id.is_(None))
+            .order_by(table.id.desc()).limit(1)
+        ).first()
+        newest_per_group = (
+            select(func.max(table.id).label("id"))
+            .where(table.event == "issued", table.group_id.is_not(None))
+            .group_by(table.group_id)
+            .subquery()
+        )
+        group_commands = conn.execute(
+            select(table.group_id, table.id, table.command, table.mode, table.timestamp)
+            .join(newest_per_group, table.id == newest_per_group.c.id)
+        ).all()
+        open_intervals = conn.execute(
+            select(RelayInterval.device_id, RelayInterval.state, RelayInterval.start_ts)
+            .where(RelayInterval.end_ts.is_(None))
+        )
+        with self._lock:
+            if last_issued is not None:
+                self.broadcast = last_issued._asdict()
+            for group_id, *command in group_commands:
+                self._group_commands[group_id] = dict(zip(("id", "command", "mode", "timestamp"), command))
+            for device_id, state, start_ts in open_intervals:
+                self._state[device_id] = (state, start_ts)
+                self._newest.setdefault(device_id, start_ts)
+
+    def seed_readings(self, rows):
+        """Newest reading time per device, from the reading store's latest row per device"""
+        with self._lock:
+            for row in rows:
+                if row.get("relay") is None:
+                    continue
+                device_id = row.get("device_id") or DEFAULT_DEVICE_ID
+                newest = self._newest.get(device_id)
+                if newest is None or row["timestamp"] > newest:
+                    self._newest[device_id] = row["timestamp"]
+
+
+def query_events(conn, device_id=None, event=None, start=None, end=None, limit=100, groups=()):
+    """
+    Newest relay events first; a device's list includes commands sent to
+    every device and to its `groups`
+    """
+    table = RelayEvent
+    query = select(table).order_by(table.timestamp.desc(), table.id.desc()).limit(limit)
+    if device_id is not None:
+        to_all = and_(table.device_id.is_(None), table.group_id.is_(None))
+        query = query.where(or_(table.device_id == device_id, to_all, table.group_id.in_(groups)))
+    if event is not None:
+        query = query.where(table.event == event)
+    if start is not None:
+        query = query.where(table.timestamp >= start)
+    if end is not None:
+        query = query.where(table.timestamp < end)
+    return [row._asdict() for row in conn.execute(query)]
+
+
+def pump_usage(conn, device_id, start, end, flow_lpm=PUMP_FLOW_LITRES_PER_MINUTE):
+    """Pump-on intervals, total run time and estimated water use over [start, end)"""
+    table = RelayInterval
+    rows = conn.execute(
+        select(table.start_ts, table.end_ts)
+        .where(
+            table.device_id == device_id,
+            table.state == "ON",
+            table.start_ts < end,
+            or_(table.end_ts.is_(None), table.end_ts > start),
+        )
+        .order_by(table.start_ts)
+    ).all()
+
+    # Clip intervals that straddle the range (an open interval runs to `end`)
+    intervals = [(max(begin, start), min(stop or end, end)) for begin, stop in rows]
+    on_seconds = sum((stop - begin).total_seconds() for begin, stop in intervals)
+    return {
+        "device_id": device_id,
+        "start": start,
+        "end": end,
+        "runs": len(intervals),
+        "on_seconds": on_seconds,
+        "mean_run_seconds": on_seconds / len(intervals) if intervals else 0.0,
+        "water_litres": on_seconds / 60 * flow_lpm,
+        "flow_litres_per_minute": flow_lpm,
+        "intervals": [
+            {"start": begin, "end": stop, "seconds": (stop - begin).total_seconds()}
+            for begin, stop in intervals
+        ],
+    }
+
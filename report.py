@@ -0,0 +1,47 @@
+# report.py
+"""
+Summary reports built from the rollups.
+
+Per-device totals and the daily series for the charts are produced by
+merging the additive rollup aggregates, so a year of data costs at most
+35,040 quarter-hour rollup rows per device. Quarter hours never straddle
+a local midnight, so days are exact in any viewer's zone. On the SQL
+backend the rollups are stored and the report never touches soil_data.
+"""
+import numpy as np
+
+from models import utc_now
+from rollups import combine, summarize
+from timezones import localize_column, zone
+
+
+def device_report(rows, tz):
+    """Overall summary and daily series (days in `tz`) for one device's rollup rows"""
+    buckets = np.array([row["bucket"] for row in rows], dtype="datetime64[us]")
+    days = {}
+    for day, row in zip(localize_column(buckets, tz).astype("datetime64[D]").tolist(), rows):
+        days.setdefault(day, []).append(row)
+    overall = summarize(combine(rows))
+    overall.pop("bucket")
+    return {
+        "first_bucket": rows[0]["bucket"],
+        "last_bucket": rows[-1]["bucket"],
+        "summary": overall,
+        "daily": [summarize(combine(day_rows, day)) for day, day_rows in sorted(days.items())],
+    }
+
+
+def generate_report(store, device_ids=None, start=None, end=None, tz=None):
+    """Report for a device set (default: all devices) over a UTC time range"""
+    tz = tz or zone()
+    devices = {}
+    for device_id in device_ids or store.devices():
+        rows = store.rollups(device_id, start, end)
+        if rows:
+            devices[device_id] = device_report(rows, tz)
+    return {
+        "generated_at": utc_now().replace(microsecond=0),
+        "start": start,
+        "end": end,
+        "devices": devices,
+    }
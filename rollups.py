@@ -0,0 +1,261 @@
+# rollups.py
+"""
+Quarter-hour per-device (and per device group) rollups of the sensor values.
+
+Each row of `soil_rollup_hourly` holds mergeable aggregates for one device
+and one 15-minute bucket of UTC time: sample count, relay-ON count and, per sensor field, the
+number of values, sum, sum of squares, min and max. Because every aggregate is additive (or a
+min/max), a batch of readings is pre-aggregated in memory and merged into
+the stored rows with a single upsert. Late, out-of-order readings simply
+land in their own (older) bucket, so rollups stay correct without ever
+being recomputed from raw rows.
+
+Buckets are a quarter hour because every zone's UTC offset is a whole
+number of quarter hours: merged in the viewer's zone (`local_hours`,
+report days) they always make up whole local hours and days, also in
+Asia/Kolkata (+05:30), where UTC hours would straddle local hours and
+midnight. The tables keep their `_hourly` names from when buckets were
+hours; `python backfill_rollups.py --rebuild` rebuilds hour buckets
+stored by earlier versions.
+
+A field's aggregates are NULL, and its count 0, while no reading in the
+bucket had a value for it (first-generation nodes have no pH or EC probe).
+Merging treats NULL as "nothing yet", and means divide by the field's own
+count, so a group mixing such devices with full ones still gets the full
+devices' pH and EC.
+"""
+import itertools
+from functools import lru_cache
+from operator import itemgetter
+
+import numpy as np
+from sqlalchemy import Table, Column, DateTime, Double, Integer, String, bindparam, func, select, text
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Base, SENSOR_FIELDS
+from timezones import localize_column
+
+AGGREGATES = ("sum", "sumsq", "min", "max")
+BUCKET_MINUTES = 15
+
+_EPOCH = np.datetime64(0, "m")
+_BUCKET = np.timedelta64(BUCKET_MINUTES, "m")
+
+
+def rollup_columns():
+    """Bucket and aggregate columns shared by every rollup table"""
+    return [
+        Column("bucket", DateTime, primary_key=True),
+        Column("samples", Integer, nullable=False),
+        Column("relay_on", Integer, nullable=False),
+        # DOUBLE: sums of squares of EC over an hour exceed FLOAT precision
+        *[Column(f"{field}_{agg}", Double) for field in SENSOR_FIELDS for agg in AGGREGATES],
+        # Values behind each field's aggregates (samples minus readings without the field)
+        *[Column(f"{field}_count", Integer, nullable=False, server_default="0") for field in SENSOR_FIELDS],
+    ]
+
+
+soil_rollup_hourly = Table(
+    "soil_rollup_hourly",
+    Base.metadata,
+    Column("device_id", String(64), primary_key=True),
+    *rollup_columns(),
+)
+
+# Per device group, merged on ingest for the devices in the group (see groups.py)
+group_rollup_hourly = Table(
+    "group_rollup_hourly",
+    Base.metadata,
+    Column("group_id", Integer, primary_key=True),
+    *rollup_columns(),
+)
+
+
+def bucket_start(ts):
+    """Start of the quarter-hour bucket containing the timestamp"""
+    return ts.replace(minute=ts.minute - ts.minute % BUCKET_MINUTES, second=0, microsecond=0)
+
+
+def aggregate(device_id, readings):
+    """
+    Pre-aggregate readings (dicts with sensor fields, relay and timestamp)
+    into one rollup row per quarter-hour bucket.
+    """
+    if not readings:
+        return []
+    timestamps = np.array([r["timestamp"] for r in readings], dtype="datetime64[us]")
+    values = np.array([[r[f] for f in SENSOR_FIELDS] for r in readings], dtype=float)
+    relay_on = np.array([str(r.get("relay", "")).upper() == "ON" for r in readings], dtype=int)
+    return aggregate_columns(device_id, timestamps, values, relay_on)
+
+
+def aggregate_columns(device_id, timestamps, values, relay_on):
+    """
+    Rollup rows from column arrays: datetime64 timestamps, an (n, fields)
+    value matrix and 0/1 relay states
+    """
+    if not len(timestamps):
+        return []
+    minutes = np.asarray(timestamps).astype("datetime64[m]")
+    buckets = minutes - (minutes - _EPOCH) % _BUCKET
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    inverse = inverse.ravel()
+    groups = len(keys)
+    width = len(SENSOR_FIELDS)
+
+    # Missing values (NaN, e.g. no pH/EC probe on first-generation nodes)
+    # add nothing; a field with no values in a bucket is stored as NULL
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    sums = np.zeros((groups, width))
+    sumsq = np.zeros((groups, width))
+    counts = np.zeros((groups, width), dtype=int)
+    mins = np.full((groups, width), np.inf)
+    maxs = np.full((groups, width), -np.inf)
+    np.add.at(sums, inverse, filled)
+    np.add.at(sumsq, inverse, filled * filled)
+    np.add.at(counts, inverse, present)
+    np.fmin.at(mins, inverse, values)
+    np.fmax.at(maxs, inverse, values)
+    samples = np.bincount(inverse, minlength=groups)
+    relay_counts = np.bincount(inverse, weights=relay_on, minlength=groups)
+
+    rows = []
+    for g, key in enumerate(keys):
+        row = {
+            "device_id": device_id,
+            "bucket": key.astype("datetime64[us]").item(),
+            "samples": int(samples[g]),
+            "relay_on": int(relay_counts[g]),
+        }
+        for i, field in enumerate(SENSOR_FIELDS):
+            seen = counts[g, i] > 0
+            row[f"{field}_count"] = int(counts[g, i])
+            row[f"{field}_sum"] = float(sums[g, i]) if seen else None
+            row[f"{field}_sumsq"] = float(sumsq[g, i]) if seen else None
+            row[f"{field}_min"] = float(mins[g, i]) if seen else None
+            row[f"{field}_max"] = float(maxs[g, i]) if seen else None
+        rows.append(row)
+    return rows
+
+
+@lru_cache(maxsize=None)
+def upsert_statement(dialect, table=soil_rollup_hourly):
+    """
+    The rollup upsert for a dialect and rollup table, compiled once to a
+    typed text() statement: SQLAlchemy cannot cache ON CONFLICT / ON
+    DUPLICATE KEY constructs and would otherwise recompile all 37 columns
+    on every ingest
+    """
+    if dialect == "mysql":
+        stmt = mysql_insert(table)
+        new = stmt.inserted
+        least, greatest = func.least, func.greatest
+    else:
+        stmt = sqlite_insert(table)
+        new = stmt.excluded
+        # SQLite's scalar min()/max() take several arguments
+        least, greatest = func.min, func.max
+
+    updates = {
+        "samples": table.c.samples + new.samples,
+        "relay_on": table.c.relay_on + new.relay_on,
+    }
+    for field in SENSOR_FIELDS:
+        # NULL (no values yet) on either side must not wipe out the other side
+        for agg in ("sum", "sumsq"):
+            old, added = table.c[f"{field}_{agg}"], new[f"{field}_{agg}"]
+            updates[f"{field}_{agg}"] = func.coalesce(old + added, old, added)
+        for agg, merge in (("min", least), ("max", greatest)):
+            old, added = table.c[f"{field}_{agg}"], new[f"{field}_{agg}"]
+            updates[f"{field}_{agg}"] = func.coalesce(merge(old, added), old, added)
+        updates[f"{field}_count"] = table.c[f"{field}_count"] + new[f"{field}_count"]
+
+    if dialect == "mysql":
+        stmt = stmt.on_duplicate_key_update(**updates)
+        sql = stmt.compile(dialect=mysql.dialect(paramstyle="named"))
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=[column.name for column in table.primary_key], set_=updates)
+        sql = stmt.compile(dialect=sqlite.dialect(paramstyle="named"))
+    # Typed parameters keep DateTime buckets formatted as the table stores them
+    return text(str(sql)).bindparams(*[bindparam(column.name, type_=column.type) for column in table.c])
+
+
+def merge_rollups(db, rows, table=soil_rollup_hourly):
+    """Merge pre-aggregated rows into a rollup table (default soil_rollup_hourly) with one upsert"""
+    if not rows:
+        return
+    # Works with both a Session and a Connection
+    dialect = db.dialect.name if hasattr(db, "dialect") else db.get_bind().dialect.name
+    db.execute(upsert_statement(dialect, table), rows)
+
+
+def summarize(row):
+    """Turn a stored rollup row into mean/min/max/std per field"""
+    samples = row["samples"]
+    summary = {
+        "bucket": row["bucket"],
+        "samples": samples,
+        "relay_on_fraction": row["relay_on"] / samples if samples else 0.0,
+    }
+    for field in SENSOR_FIELDS:
+        total, count = row[f"{field}_sum"], row[f"{field}_count"]
+        known = count and total is not None  # NULL: no reading had this sensor
+        mean = total / count if known else None
+        variance = max(row[f"{field}_sumsq"] / count - mean * mean, 0.0) if known else None
+        summary[field] = {
+            "mean": mean,
+            "min": row[f"{field}_min"],
+            "max": row[f"{field}_max"],
+            "std": variance ** 0.5 if variance is not None else None,
+        }
+    return summary
+
+
+def combine(rows, bucket=None):
+    """Merge several rollup rows into one"""
+    combined = {
+        "bucket": bucket,
+        "samples": sum(row["samples"] for row in rows),
+        "relay_on": sum(row["relay_on"] for row in rows),
+    }
+    for field in SENSOR_FIELDS:
+        # Buckets without the sensor hold NULL aggregates and are left out
+        known = [row for row in rows if row[f"{field}_sum"] is not None]
+        for agg, merge in (("sum", sum), ("sumsq", sum), ("min", min), ("max", max)):
+            name = f"{field}_{agg}"
+            combined[name] = merge(row[name] for row in known) if known else None
+        combined[f"{field}_count"] = sum(row[f"{field}_count"] for row in known)
+    return combined
+
+
+def local_hours(rows, tz):
+    """
+    Rollup rows (oldest first) merged into the hours of `tz`; each merged
+    row's bucket is the naive UTC start of its local hour
+    """
+    if not rows:
+        return []
+    buckets = np.array([row["bucket"] for row in rows], dtype="datetime64[us]")
+    local = localize_column(buckets, tz)
+    # UTC start of each bucket's local hour, so an hour repeated by a DST change stays two hours
+    starts = (buckets - (local - local.astype("datetime64[h]"))).tolist()
+    return [combine([row for _, row in group], start)
+            for start, group in itertools.groupby(zip(starts, rows), key=itemgetter(0))]
+
+
+def query_rollups(conn, device_id, start=None, end=None, table=soil_rollup_hourly):
+    """
+    Stored rollup rows for a device (or a group, from group_rollup_hourly),
+    oldest first: the buckets from start's hour that begin before end
+    (half-open, like every cached range; see query_cache.py)
+    """
+    owner = next(iter(table.primary_key))  # device_id, or group_id
+    query = select(table).where(owner == device_id).order_by(table.c.bucket)
+    if start is not None:
+        query = query.where(table.c.bucket >= bucket_start(start))
+    if end is not None:
+        query = query.where(table.c.bucket < end)
+    return [row._asdict() for row in conn.execute(query)]
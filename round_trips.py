@@ -0,0 +1,40 @@
+# round_trips.py
+"""
+Database round-trip counting, per request and in total.
+
+Every statement sent to the database and every COMMIT/ROLLBACK counts as
+one round trip. The server opens a counter per request (a ContextVar, so
+it follows the request into FastAPI's threadpool) and reports the total
+per route as the `db_round_trips` summary in `GET /metrics`; the overall
+count is the `db_round_trips` counter. Statements run by background
+threads, such as the SQLite batching writer, are counted only in the
+total, since they are shared by many requests.
+"""
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from metrics import metrics
+
+_current = ContextVar("db_round_trips", default=None)
+
+
+def _count(*args, **kwargs):
+    metrics.inc("db_round_trips")
+    counter = _current.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def count_round_trips(engine):
+    """Count the round trips of every connection of an engine"""
+    event.listen(engine, "before_cursor_execute", _count)
+    event.listen(engine, "commit", _count)
+    event.listen(engine, "rollback", _count)
+
+
+def start_counting():
+    """Start a counter for the current context (a request); returns it as a one-item list"""
+    counter = [0]
+    _current.set(counter)
+    return counter
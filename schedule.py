@@ -0,0 +1,269 @@
+# schedule.py
+"""
+Scheduled irrigation programs.
+
+A program waters one device, one device group or every device for a set
+time, starting at a local time of day, daily or on chosen weekdays
+("zone 3, 06:00, 20 minutes, mon,wed,fri"). Programs live in
+`irrigation_programs` along with their next start in UTC (`next_run`,
+indexed), so start-up loads them in time order with one query.
+
+In memory the scheduler keeps a heap of (time, action) entries: the next
+start of every enabled program and the end of every run in progress. A
+single asyncio task sleeps until the earliest entry, or until a new
+program becomes the earliest, and then fires everything due in one
+transaction. Thousands of programs therefore cost one timer plus an
+O(log n) push per run. Entries for deleted programs are dropped when
+they reach the top of the heap.
+
+A run is two relay commands with mode "schedule" for the program's
+target (see relay.py): ON at the start, and at the end OFF, which hands
+the relay back to the device's own threshold. Conflicts resolve as
+follows:
+
+- A manual command in force (for the device, one of its groups or all
+  devices) overrides scheduled runs until auto mode is restored. Runs
+  still start and end on time underneath the override.
+- A run only ends its own command. If anything newer was issued to the
+  same target during the run (a manual command, or a later program
+  starting), the end is skipped and the newer command stays in force.
+
+Starts missed while the server was down are skipped, not caught up.
+Runs that were in progress end as soon as the server is back.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import bindparam, select, update
+
+from metrics import metrics
+from models import IrrigationProgram, utc_now
+from timezones import local_date, to_utc, zone
+
+logger = logging.getLogger(__name__)
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+SCHEDULE_MAX_SLEEP_SECONDS = 60  # the timer re-reads the wall clock at least this often
+SCHEDULE_RETRY_SECONDS = 5
+
+PROGRAM_COLUMNS = [column.name for column in IrrigationProgram.__table__.c]
+SAVE_RUN_STATE = (
+    update(IrrigationProgram)
+    .where(IrrigationProgram.id == bindparam("program_id"))
+    .values(next_run=bindparam("next_run"), run_until=bindparam("run_until"),
+            run_command_id=bindparam("run_command_id"))
+)
+
+
+def parse_days(days):
+    """Weekday numbers (Monday 0) for "daily" or a list such as "mon,wed,fri" """
+    if days == "daily":
+        return frozenset(range(7))
+    names = [name.strip().lower() for name in days.split(",")]
+    unknown = [name for name in names if name not in WEEKDAYS]
+    if unknown or not names:
+        raise ValueError(f"days must be 'daily' or a comma-separated list of {', '.join(WEEKDAYS)}")
+    return frozenset(WEEKDAYS.index(name) for name in names)
+
+
+def parse_start_time(text):
+    try:
+        return time.fromisoformat(text)
+    except ValueError:
+        raise ValueError("start_time must be HH:MM or HH:MM:SS")
+
+
+def next_start(program, after):
+    """First start of a program strictly after `after` (naive UTC), as naive UTC"""
+    tz = zone(program["timezone"])
+    days = parse_days(program["days"])
+    at = parse_start_time(program["start_time"])
+    today = local_date(after, tz)
+    for offset in range(8):
+        day = today + timedelta(days=offset)
+        if day.weekday() in days:
+            start = to_utc(datetime.combine(day, at), tz)
+            if start > after:
+                return start
+    return None
+
+
+class IrrigationScheduler:
+    """Programs by id plus a heap of their due starts and ends, fired by one asyncio task"""
+
+    def __init__(self, engine, relay_tracker):
+        self.engine = engine
+        self.relay = relay_tracker
+        self._programs = {}  # program id -> program dict (IrrigationProgram columns)
+        self._heap = []      # (time, tie-breaker, action, program id); action is "start" or "end"
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+        self._task = None
+
+    def _push(self, when, action, program_id):
+        """Queue an entry; wake the timer if it is now the earliest"""
+        heapq.heappush(self._heap, (when, next(self._order), action, program_id))
+        if self._heap[0][3] == program_id and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _valid(self, entry):
+        """Whether a heap entry still matches its program (deleted programs never do)"""
+        when, _, action, program_id = entry
+        program = self._programs.get(program_id)
+        if program is None:
+            return False
+        return program["next_run"] == when if action == "start" else program["run_until"] == when
+
+    def load(self, conn, now):
+        """Start from the stored enabled programs; returns the number loaded"""
+        rows = conn.execute(
+            select(IrrigationProgram).where(IrrigationProgram.enabled.is_(True)).order_by(IrrigationProgram.next_run)
+        )
+        changed = []
+        with self._lock:
+            for row in rows:
+                program = {name: getattr(row, name) for name in PROGRAM_COLUMNS}
+                if program["next_run"] is None or program["next_run"] <= now:
+                    if program["next_run"] is not None:
+                        metrics.inc("schedule_runs_missed")
+                    program["next_run"] = next_start(program, now)
+                    changed.append(program)
+                if program["run_until"] is not None:
+                    # A run in progress ends on time, or right away if it is over
+                    program["run_until"] = max(program["run_until"], now)
+                self._programs[program["id"]] = program
+                self._heap.append((program["next_run"], next(self._order), "start", program["id"]))
+                if program["run_until"] is not None:
+                    self._heap.append((program["run_until"], next(self._order), "end", program["id"]))
+            heapq.heapify(self._heap)
+        if changed:
+            conn.execute(SAVE_RUN_STATE, [self._run_state(program) for program in changed])
+            conn.commit()
+        return len(self._programs)
+
+    def add(self, program):
+        """Schedule a stored program (a dict of IrrigationProgram columns)"""
+        with self._lock:
+            self._programs[program["id"]] = program
+            self._push(program["next_run"], "start", program["id"])
+
+    def remove(self, conn, program_id, now, pending):
+        """
+        Unschedule a program; a run in progress ends now, its OFF command
+        added to `pending` (see RelayTracker.issue). Returns the program, or None
+        """
+        with self._lock:
+            program = self._programs.pop(program_id, None)
+        if program is not None and program["run_until"] is not None:
+            self._end_run(conn, program, now, pending)
+        return program
+
+    def programs(self):
+        with self._lock:
+            return sorted((dict(program) for program in self._programs.values()), key=lambda p: p["id"])
+
+    def next_due(self):
+        """Time of the earliest valid entry, or None"""
+        with self._lock:
+            while self._heap and not self._valid(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    @staticmethod
+    def _run_state(program):
+        return {"program_id": program["id"], "next_run": program["next_run"],
+                "run_until": program["run_until"], "run_command_id": program["run_command_id"]}
+
+    def _end_run(self, conn, program, now, pending):
+        current = self.relay.current(program["device_id"], program["group_id"], pending)
+        if current is not None and current["id"] is not None and current["id"] > program["run_command_id"]:
+            # Something newer was sent to the target during the run; it stays in force
+            metrics.inc("schedule_runs_overridden")
+        else:
+            self.relay.issue(conn, "OFF", "schedule", now, pending, program["device_id"], program["group_id"])
+        program["run_until"] = program["run_command_id"] = None
+
+    def fire_due(self, now):
+        """Start and end every run due at `now` in one transaction; returns the number fired"""
+        with self._lock:
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry = heapq.heappop(self._heap)
+                if self._valid(entry):
+                    due.append(entry)
+            if not due:
+                return 0
+
+            # Program state and relay commands change only once the transaction is committed
+            changed = {}
+            pending = []
+            started = set()
+            try:
+                with self.engine.begin() as conn:
+                    for when, _, action, program_id in due:
+                        program = changed.setdefault(program_id, dict(self._programs[program_id]))
+                        if action == "start":
+                            # A run still going is simply replaced by the newer command
+                            issued = self.relay.issue(conn, "ON", "schedule", now, pending,
+                                                      program["device_id"], program["group_id"])
+                            program["run_command_id"] = issued["id"]
+                            program["run_until"] = when + timedelta(seconds=program["duration_seconds"])
+                            program["next_run"] = next_start(program, when)
+                            started.add(program_id)
+                            metrics.observe("schedule_start_lateness_seconds", (now - when).total_seconds())
+                        elif program["run_until"] == when:
+                            self._end_run(conn, program, now, pending)
+                    conn.execute(SAVE_RUN_STATE, [self._run_state(program) for program in changed.values()])
+            except Exception:
+                for entry in due:
+                    heapq.heappush(self._heap, entry)
+                raise
+
+            self.relay.apply(pending)
+            for program_id, program in changed.items():
+                self._programs[program_id] = program
+                if program_id in started:
+                    self._push(program["next_run"], "start", program_id)
+                    if program["run_until"] is not None:
+                        self._push(program["run_until"], "end", program_id)
+        metrics.inc("schedule_entries_fired", len(due))
+        return len(due)
+
+    def start(self):
+        """Run the timer on the running event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            due = self.next_due()
+            delay = SCHEDULE_MAX_SLEEP_SECONDS if due is None else (due - utc_now()).total_seconds()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), min(delay, SCHEDULE_MAX_SLEEP_SECONDS))
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+            # Relay commands are written on a worker thread; the loop keeps serving requests
+            try:
+                await self._loop.run_in_executor(None, self.fire_due, utc_now())
+            except Exception:
+                logger.exception("Could not fire irrigation programs, retrying")
+                await asyncio.sleep(SCHEDULE_RETRY_SECONDS)
@@ -4,20 +4,54 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from sqlalchemy import create_engine, Column, Float, Integer, DateTime, String
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-import pytz
+from fastapi.responses import ORJSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, field_validator
+from sqlalchemy import create_engine, delete, select, update
+from sqlalchemy.orm import Session, sessionmaker
+from datetime import datetime, timedelta
+from typing import List, Optional, Union
 import logging
+import threading
 
-app = FastAPI()
+from log_config import setup_logging, shutdown_logging
+from admission import AdmissionController
+from alerts import Rule, RuleEngine
+from analytics import ANALYTICS_FIELDS, ANALYTICS_MAX_LAG_HOURS, RESOLUTIONS, analyze
+from anomaly import AnomalyDetector
+from dedupe import RecentKeyCache
+from events import EventBus
+from export import FORMATS, parquet_available, stream_export
+from fleet import FLEET_MAX_PAGE_SIZE, SORT_KEYS, FleetTracker
+from gaps import GapDetector, query_gaps
+from groups import GroupRegistry, group_rollup_rows
+from ingest import IngestPipeline, MAX_BATCH_SIZE
+from liveness import LIVENESS_STATES, LivenessTracker
+from metrics import metrics
+from models import (Base, AlertRule, DEFAULT_DEVICE_ID, Device, DeviceGroup, IrrigationProgram, RELAY_STATES,
+                    SENSOR_FIELDS, utc_now)
+from notifiers import NotificationDispatcher, default_notifiers
+from query_cache import QueryCache
+from relay import RelayTracker, device_response, pump_usage, query_events
+from report import generate_report
+from round_trips import count_round_trips, start_counting
+from schedule import IrrigationScheduler, next_start, parse_days, parse_start_time
+from rollups import group_rollup_hourly, local_hours, merge_rollups, query_rollups, summarize
+from storage import STORAGE_BACKEND, open_store
+from timezones import localize, localize_column, to_utc, zone
+from db import SQLITE_PATH, sqlite_engine
+from validation import SensorValidator
+from window import WindowStore
 
-# Set your local timezone (India Standard Time)
-LOCAL_TZ = pytz.timezone('Asia/Kolkata')
+async def count_request_round_trips(request: Request):
+    """Database round trips of one request, reported per route"""
+    counter = start_counting()
+    yield
+    route = request.scope.get("route")
+    metrics.observe("db_round_trips", counter[0], route=route.path if route else request.url.path)
+
+app = FastAPI(dependencies=[Depends(count_request_round_trips)])
 
 # Add CORS middleware to allow ESP8266 requests
 app.add_middleware(
@@ -28,41 +62,68 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-Base = declarative_base()
-
 # MySQL Connection using environment variables
 DB_HOST = os.getenv('DB_HOST', 'localhost')
 DB_USER = os.getenv('DB_USER', 'root')
 DB_PASSWORD = os.getenv('DB_PASSWORD', 'your_password')
 DB_NAME = os.getenv('DB_NAME', 'soil_db')
 
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# DATABASE_URL (e.g. sqlite:///soil_monitor.db) replaces the MySQL settings;
+# STORAGE_BACKEND=sqlite defaults it to SQLITE_PATH
+DATABASE_URL = os.getenv("DATABASE_URL")
+if STORAGE_BACKEND == "sqlite" and not DATABASE_URL:
+    DATABASE_URL = f"sqlite:///{SQLITE_PATH}"
+SQLALCHEMY_DATABASE_URL = DATABASE_URL or f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}/{DB_NAME}"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))  # below MySQL's wait_timeout
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    engine = sqlite_engine(SQLALCHEMY_DATABASE_URL)  # WAL, synchronous=NORMAL, reader pool
+    read_engine = engine  # no server round trips to save; readers never block the writer
+else:
+    pool = {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_recycle": DB_POOL_RECYCLE}
+    if SQLALCHEMY_DATABASE_URL.startswith("mysql"):
+        # Timestamps are stored in UTC; keep CURRENT_TIMESTAMP defaults in UTC too
+        pool["connect_args"] = {"init_command": "SET time_zone = '+00:00'"}
+    engine = create_engine(SQLALCHEMY_DATABASE_URL, **pool)
+    # Reads run on their own autocommit pool: no transaction to end and no
+    # ROLLBACK when a connection goes back to the pool
+    read_engine = create_engine(SQLALCHEMY_DATABASE_URL, isolation_level="AUTOCOMMIT",
+                                pool_reset_on_return=None, **pool)
+count_round_trips(engine)
+if read_engine is not engine:
+    count_round_trips(read_engine)
+# Committed objects keep their loaded state: reading row.id after commit
+# would otherwise cost a SELECT
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+def get_db():
+    """Session for one request, returned to the pool when the request ends"""
+    db = SessionLocal()
+    try:
+        yield db
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def get_reader():
+    """Autocommit connection for a read-only request"""
+    with read_engine.connect() as conn:
+        yield conn
+
+# Readings live in the SQL database (STORAGE_BACKEND=sql), in a SQLite file
+# written by a single batching writer (sqlite) or in the embedded columnar
+# engine under TSDB_PATH (tsdb)
+store = open_store(engine, reader=read_engine)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (format, sampling and async writer come from LOG_* env vars)
+setup_logging()
 logger = logging.getLogger(__name__)
 
-def get_local_time():
-    """Get current time in local timezone"""
-    return datetime.now(LOCAL_TZ).replace(tzinfo=None)  # Remove timezone info for MySQL compatibility
-
-class SoilData(Base):
-    __tablename__ = "soil_data"
-    id = Column(Integer, primary_key=True, index=True)
-    nitrogen = Column(Integer)
-    phosphorus = Column(Integer)
-    potassium = Column(Integer)
-    ph = Column(Float)
-    ec = Column(Integer)
-    humidity = Column(Float)
-    temperature = Column(Float)
-    relay = Column(String(10))  # Added relay status field
-    timestamp = Column(DateTime, default=get_local_time)
-
-# Note: Don't create tables here since they already exist in MySQL
-# Base.metadata.create_all(bind=engine)
+# Note: Don't create tables here since they already exist in MySQL;
+# a SQLite file is set up on first start (see create_sqlite_tables)
 
 class SoilInput(BaseModel):
     nitrogen: int
@@ -73,129 +134,778 @@ class SoilInput(BaseModel):
     humidity: float
     temperature: float
     relay: str  # Added relay field to input model
+    device_id: Optional[str] = None  # Optional: enables idempotent retries together with seq
+    seq: Optional[int] = None
+    client_ts: Optional[float] = None  # Device clock (Unix seconds) when the reading was taken
+
+    @field_validator("relay")
+    @classmethod
+    def normalize_relay(cls, value):
+        # Stored in a two-value ENUM column
+        value = value.strip().upper()
+        if value not in RELAY_STATES:
+            raise ValueError("relay must be 'ON' or 'OFF'")
+        return value
+
+class LegacySoilInput(BaseModel):
+    """First-generation nodes (the former soil_data.py service): no pH, EC or relay"""
+    nitrogen: int
+    phosphorous: int
+    potassium: int
+    moisture: float
+    temperature: float
+
+# Nodes of that generation cannot identify themselves; their readings are
+# stored under this device id so partial readings never mix with full ones
+LEGACY_DEVICE_ID = os.getenv("LEGACY_DEVICE_ID", "legacy")
+
+def adapt_legacy(data):
+    return {
+        "nitrogen": data.nitrogen,
+        "phosphorus": data.phosphorous,
+        "potassium": data.potassium,
+        "ph": None,
+        "ec": None,
+        "humidity": data.moisture,  # the same soil moisture probe
+        "temperature": data.temperature,
+        "relay": None,
+        "device_id": LEGACY_DEVICE_ID,
+        "seq": None,
+        "client_ts": None,
+    }
+
+# POST /soil-data accepts every payload generation; each adapter turns its
+# model into the reading dict the ingest pipeline stores (SoilInput fields)
+PAYLOAD_ADAPTERS = {
+    SoilInput: SoilInput.dict,
+    LegacySoilInput: adapt_legacy,
+}
+SoilPayload = Union[SoilInput, LegacySoilInput]
+
+class SoilBatch(BaseModel):
+    """Readings buffered by a device while offline, sent in one request"""
+    device_id: str
+    readings: List[SoilInput]
+    first_seq: Optional[int] = None  # oldest seq still buffered (default: the lowest in this upload)
 
 class RelayCommand(BaseModel):
     command: str
+    device_id: Optional[str] = None  # None sends the command to every device
+
+class BulkRelayCommand(BaseModel):
+    command: str
+    device_ids: List[str] = []
+    group_ids: List[int] = []
+
+class IrrigationProgramInput(BaseModel):
+    name: str
+    start_time: str  # HH:MM local time
+    duration_minutes: float
+    days: str = "daily"  # or e.g. "mon,wed,fri"
+    timezone: Optional[str] = None  # default DISPLAY_TZ
+    device_id: Optional[str] = None  # target one device,
+    group_id: Optional[int] = None  # or one group; neither waters every device
 
-# Store the latest relay command and mode (in production, use Redis or database)
-latest_relay_command = {"command": "OFF", "mode": "auto", "timestamp": get_local_time()}
+class GroupInput(BaseModel):
+    name: str
+    kind: str  # farm, field or zone
+    parent_id: Optional[int] = None  # the farm of a field, the field of a zone
 
+class DeviceGroupInput(BaseModel):
+    group_id: Optional[int] = None  # None takes the device out of its group
+    name: Optional[str] = None
+
+class AlertRuleInput(BaseModel):
+    device_id: Optional[str] = None  # None applies the rule to every device
+    parameter: str
+    operator: str  # ">" or "<"
+    threshold: float
+    hysteresis: float = 0.0
+    debounce: int = 3
+    channel: str = "log"  # log, webhook or smtp
+    target: Optional[str] = None  # webhook URL or e-mail address
+
+class LatestDataResponse(BaseModel):
+    id: Optional[int]  # None on the tsdb backend
+    nitrogen: int
+    phosphorus: int
+    potassium: int
+    ph: Optional[float]  # None for first-generation nodes
+    ec: Optional[int]
+    humidity: float
+    temperature: float
+    relay: Optional[str]
+    timestamp: datetime
+    device_id: Optional[str] = None
+    mode: str
+    last_command: str
+
+class MessageResponse(BaseModel):
+    message: str
+    status: Optional[str] = None
+
+class ModeResponse(BaseModel):
+    mode: str
+    command: str
+    timestamp: datetime
+
+# Readings are checked for Modbus sentinels, out-of-range and stuck values
+# before they are written. "quarantine" drops faulty readings, "flag" only
+# counts and logs them.
+VALIDATION_MODE = os.getenv("VALIDATION_MODE", "quarantine").lower()
+validator = SensorValidator()
+
+# Recently stored (device_id, seq) keys; retried POSTs are answered from here
+dedupe_cache = RecentKeyCache()
+
+# Dedupe -> validation -> insert + rollup upsert, shared by single and batch ingest
+pipeline = IngestPipeline(store, validator, dedupe_cache, VALIDATION_MODE)
+
+# Encoded /history, /rollups and /report responses; stored readings drop
+# the cached ranges they fall in
+query_cache = QueryCache()
+
+def invalidate_cached_queries(device_id, rows):
+    timestamps = [row["timestamp"] for row in rows]
+    device_ids = {device_id, *(row["device_id"] for row in rows if row.get("device_id") is not None)}
+    query_cache.invalidate(device_ids, min(timestamps), max(timestamps))
+
+pipeline.add_listener(invalidate_cached_queries)
+
+# Live event stream (GET /events) and per-device online anomaly models
+events = EventBus()
+detector = AnomalyDetector()
+
+def detect_anomalies(device_id, rows):
+    for row in rows:
+        for alert in detector.update(device_id, row):
+            logger.warning("Anomaly on %s: %s %s=%s (expected %.2f, z=%s)", device_id, alert["kind"],
+                           alert["parameter"], alert["value"], alert["expected"], alert["score"])
+            events.publish("anomaly", alert)
+
+pipeline.add_listener(detect_anomalies)
+
+# Threshold rules from the alert_rules table, delivered in the background
+rule_engine = RuleEngine()
+alert_rule_writes = threading.Lock()  # one lookup-then-write at a time, so saves never duplicate a rule
+notifier = NotificationDispatcher(default_notifiers())
+
+def evaluate_alert_rules(device_id, rows):
+    for row in rows:
+        for alert in rule_engine.evaluate(device_id, row):
+            notifier.dispatch(alert["channel"], alert["target"], alert)
+            events.publish("alert", alert)
+
+pipeline.add_listener(evaluate_alert_rules)
+
+# Device liveness (readings and relay polls are heartbeats) and gaps in
+# the stored series, both tracked as readings arrive
+liveness = LivenessTracker(notify=events.publish)
+pipeline.add_listener(liveness.observe)
+gap_detector = GapDetector()
+
+def track_gaps(device_id, rows):
+    gaps, late = gap_detector.observe(device_id, rows)
+    if gaps or late:
+        with engine.begin() as conn:
+            gap_detector.record(conn, device_id, gaps, late)
+
+pipeline.add_listener(track_gaps)
+
+# Ring-buffered recent readings per device, served to dashboards by /window
+WINDOW_WARM_SECONDS = int(os.getenv("WINDOW_WARM_SECONDS", "7200"))
+window_store = WindowStore()
+pipeline.add_listener(window_store.append)
+
+# Latest reading per device for the fleet overview
+fleet = FleetTracker()
+pipeline.add_listener(fleet.update)
+
+# Farm/field/zone groups with running totals of their devices' latest
+# readings, and hourly group rollups merged for the groups a reading touches
+groups = GroupRegistry()
+
+def update_groups(device_id, rows):
+    touched = groups.update(device_id, rows)
+    if touched:
+        with engine.begin() as conn:
+            merge_rollups(conn, group_rollup_rows(touched, rows), group_rollup_hourly)
+        # After the write: a group query run in between must not stay cached
+        timestamps = [row["timestamp"] for row in rows]
+        query_cache.invalidate([("group", group_id) for group_id in touched], min(timestamps), max(timestamps))
+
+pipeline.add_listener(update_groups)
+
+# Relay commands per device and the relay event log (issued, delivered, acknowledged)
+relay_tracker = RelayTracker(utc_now())
+
+def track_relay_state(device_id, rows):
+    events, transitions = relay_tracker.observe_readings(device_id, rows)
+    if events or transitions:
+        with engine.begin() as conn:
+            relay_tracker.append(conn, events, transitions)
+
+pipeline.add_listener(track_relay_state)
+
+# Pump slots under the shared water budget, granted at /relay-status polls
+admission = AdmissionController()
+pipeline.add_listener(admission.observe)
+
+# Irrigation programs: relay runs started and ended by one asyncio timer
+scheduler = IrrigationScheduler(engine, relay_tracker)
+
+# Timestamps are stored as naive UTC. Read endpoints take ?tz= (an IANA
+# zone, default DISPLAY_TZ): naive start/end are wall times in that zone and
+# the response is converted to it once, just before it is returned
+def viewer_zone(tz):
+    try:
+        return zone(tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def cached_response(key, devices, start, end, build):
+    """JSON response for a query, served from query_cache when possible"""
+    body, hit = query_cache.get(key, key[0], devices, start, end, lambda: ORJSONResponse(build()).body)
+    return Response(body, media_type="application/json", headers={"X-Cache": "hit" if hit else "miss"})
+
+# Ingest handlers are plain functions so FastAPI runs them on its thread
+# pool: concurrent requests can then share a commit on the SQLite backend
 @app.post("/soil-data")
-async def receive_soil_data(data: SoilInput):
-    db = SessionLocal()
+def receive_soil_data(data: SoilPayload, db: Session = Depends(get_db)):
     try:
         # Log incoming data for debugging
-        logger.info(f"Received data from ESP8266: {data.dict()}")
-        
-        soil = SoilData(**data.dict())
-        db.add(soil)
-        db.commit()
-        db.refresh(soil)
-        
-        logger.info(f"Soil data saved successfully with ID: {soil.id}")
-        return {"status": "success", "id": soil.id, "message": "Data saved successfully"}
+        logger.info("Received data from ESP8266: %s", data, extra={"route": "/soil-data"})
+
+        reading = PAYLOAD_ADAPTERS[type(data)](data)
+        device_id = reading["device_id"] or DEFAULT_DEVICE_ID
+        result = pipeline.ingest(db, device_id, [reading])
+
+        if result.quarantined:
+            faults = result.quarantined[0][1]
+            logger.info("Sensor fault from %s: %s", device_id, faults, extra={"route": "/soil-data"})
+            if not result.stored:
+                return {"status": "quarantined", "faults": faults, "message": "Reading rejected by sensor validation"}
+        if result.duplicates:
+            return {"status": "duplicate", "seq": reading["seq"], "message": "Reading already stored"}
+
+        soil_id = result.ids[0]
+        logger.info("Soil data saved successfully with ID: %s", soil_id, extra={"route": "/soil-data"})
+        return {"status": "success", "id": soil_id, "message": "Data saved successfully"}
     except ValueError as e:
         db.rollback()
-        logger.error(f"Validation error: {str(e)}")
+        logger.error("Validation error: %s", e)
         raise HTTPException(status_code=422, detail=f"Invalid data format: {str(e)}")
     except Exception as e:
         db.rollback()
-        logger.error(f"Database error: {str(e)}")
+        logger.error("Database error: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    finally:
-        db.close()
 
-@app.get("/latest-data")
-def get_latest_data():
-    db = SessionLocal()
+@app.post("/soil-data/batch")
+def receive_soil_batch(batch: SoilBatch, db: Session = Depends(get_db)):
+    """
+    Store-and-forward upload: readings a device buffered while offline.
+
+    Readings may arrive late and out of order; each keeps its `client_ts`
+    and hourly rollups are corrected incrementally. Every seq from
+    `first_seq` up to the response's `acked_seq` has reached the server and
+    can be dropped from the device buffer; `missing` lists the seq ranges
+    above it, up to the upload's highest, that the server does not hold.
+    """
+    if len(batch.readings) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} readings)")
+
+    try:
+        readings = [{**reading.dict(), "device_id": batch.device_id} for reading in batch.readings]
+        result = pipeline.ingest(db, batch.device_id, readings, batch.first_seq)
+        logger.info("Batch from %s: %s", batch.device_id, result.as_dict(), extra={"route": "/soil-data/batch"})
+        return {"status": "success", "device_id": batch.device_id, **result.as_dict()}
+    except Exception as e:
+        db.rollback()
+        logger.error("Database error: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/soil-data/ack/{device_id}")
+def get_acked_seq(device_id: str, from_seq: int, conn=Depends(get_reader)):
+    """
+    The ack of the readings stored from `from_seq` (the oldest seq still
+    buffered) on, for devices that lost the response of their last upload
+    """
+    acked_seq, missing = pipeline.ack(conn, device_id, from_seq)
+    return {"device_id": device_id, "from_seq": from_seq, "acked_seq": acked_seq, "missing": missing}
+
+@app.get("/rollups")
+def get_rollups(device_id: str = DEFAULT_DEVICE_ID, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                tz: Optional[str] = None):
+    """
+    Hourly mean/min/max/std per parameter for a device, in the hours of the
+    viewer's zone
+    """
+    zone = viewer_zone(tz)
+    start, end = to_utc(start, zone), to_utc(end, zone)
+
+    def build():
+        rows = local_hours(store.rollups(device_id, start, end), zone)
+        return localize({"device_id": device_id, "buckets": [summarize(row) for row in rows]}, zone)
+
+    return cached_response(("hour", device_id, start, end, zone.zone), {device_id}, start, end, build)
+
+@app.get("/window", response_class=ORJSONResponse)
+def get_window(device_id: str = DEFAULT_DEVICE_ID, seconds: int = 3600, tz: Optional[str] = None):
+    """
+    Recent readings for a device as column arrays, oldest first; timestamps
+    are wall times in `timezone`
+    """
+    zone = viewer_zone(tz)
+    columns = window_store.window(device_id, seconds, utc_now())
+    if columns is None:
+        return ORJSONResponse({"device_id": device_id, "seconds": seconds, "timezone": zone.zone, "count": 0, "columns": {}})
+    columns["timestamp"] = localize_column(columns["timestamp"], zone)
+    return ORJSONResponse({
+        "device_id": device_id,
+        "seconds": seconds,
+        "timezone": zone.zone,
+        "count": len(columns["timestamp"]),
+        "columns": columns,
+    })
+
+HISTORY_COLUMNS = (*SENSOR_FIELDS, "relay_on")
+
+@app.get("/history", response_class=ORJSONResponse)
+def get_history(device_id: str = DEFAULT_DEVICE_ID, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                fields: Optional[str] = None, tz: Optional[str] = None):
+    """
+    Stored readings for a device over [start, end) as column arrays, oldest
+    first (same shape as /window, for spans longer than the window).
+    `fields` (comma-separated) limits the columns besides the timestamp.
+    """
+    zone = viewer_zone(tz)
+    requested = set(fields.split(",")) if fields else set(HISTORY_COLUMNS)
+    unknown = requested - set(HISTORY_COLUMNS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    selected = tuple(name for name in HISTORY_COLUMNS if name in requested)
+    query_start, query_end = to_utc(start, zone), to_utc(end, zone)
+
+    def build():
+        end = query_end or utc_now()
+        start = query_start or end - timedelta(days=1)
+        history = store.history(device_id, start, end)
+        columns = {"timestamp": localize_column(history["timestamp"], zone)}
+        columns.update((name, history[name]) for name in selected)
+        return {
+            "device_id": device_id,
+            **localize({"start": start, "end": end}, zone),
+            "timezone": zone.zone,
+            "count": len(columns["timestamp"]),
+            "columns": columns,
+        }
+
+    key = ("raw", device_id, query_start, query_end, selected, zone.zone)
+    return cached_response(key, {device_id}, query_start, query_end, build)
+
+@app.get("/fleet", response_class=ORJSONResponse)
+def get_fleet(page: int = 1, page_size: int = 50, sort: str = "staleness", status: Optional[str] = None,
+              tz: Optional[str] = None):
+    """
+    Latest values, health score, relay state and staleness of every device,
+    one page at a time (sort: device_id, health, staleness; status: online, stale)
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Sort must be one of {', '.join(SORT_KEYS)}")
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), FLEET_MAX_PAGE_SIZE)
+    zone = viewer_zone(tz)
+    return ORJSONResponse(localize(fleet.overview(utc_now(), page, page_size, sort, status), zone))
+
+@app.get("/liveness", response_class=ORJSONResponse)
+def get_liveness(device_id: Optional[str] = None, status: Optional[str] = None, tz: Optional[str] = None):
+    """
+    Online/offline state, last heartbeat and last reading age of one device,
+    or of every device (status: online, offline), longest silent first
+    """
+    zone = viewer_zone(tz)
+    if status is not None and status not in LIVENESS_STATES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(LIVENESS_STATES)}")
+    if device_id is not None:
+        entry = liveness.device(device_id, utc_now())
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Device has not been seen")
+        return ORJSONResponse(localize(entry, zone))
+    return ORJSONResponse(localize(liveness.overview(utc_now(), status), zone))
+
+@app.get("/gaps", response_class=ORJSONResponse)
+def get_gaps(device_id: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+             limit: int = 100, tz: Optional[str] = None, conn=Depends(get_reader)):
+    """
+    Stretches without readings longer than GAP_MIN_SECONDS, newest first;
+    offline devices also show the gap still running (`open`)
+    """
+    zone = viewer_zone(tz)
+    gaps = query_gaps(conn, device_id, to_utc(start, zone), to_utc(end, zone), min(limit, 1000))
+    now = utc_now()
+    offline = [device_id] if device_id is not None else list(liveness.offline())
+    running = [gap for gap in (gap_detector.open_gap(device, now) for device in offline) if gap is not None]
+    return ORJSONResponse(localize({"open": running, "gaps": gaps}, zone))
+
+@app.get("/export")
+def export_readings(
+    format: str = "csv",
+    device_id: Optional[List[str]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tz: Optional[str] = None,
+):
+    """
+    Stream raw readings for a time range and device set (repeat ?device_id=)
+    as CSV, NDJSON or Parquet; exported timestamps are UTC
+    """
+    zone = viewer_zone(tz)
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of {', '.join(FORMATS)}")
+    if format == "parquet" and not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires the pyarrow package")
+    media_type, extension = FORMATS[format]
+    filename = f"soil_data_{utc_now():%Y%m%d_%H%M%S}.{extension}"
+    logger.info("Export started: format=%s devices=%s", format, device_id or "all", extra={"route": "/export"})
+    return StreamingResponse(
+        stream_export(store, format, device_id, to_utc(start, zone), to_utc(end, zone)),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/report")
+def get_report(
+    device_id: Optional[List[str]] = Query(None),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    tz: Optional[str] = None,
+):
+    """
+    Summary statistics and daily series (days in the viewer's zone) per
+    device, computed from the rollups
+    """
+    zone = viewer_zone(tz)
+    start, end = to_utc(start, zone), to_utc(end, zone)
+    devices = tuple(sorted(set(device_id))) if device_id else None
+
+    def build():
+        return localize(generate_report(store, devices, start, end, zone), zone)
+
+    key = ("day", devices, start, end, zone.zone)
+    return cached_response(key, set(devices) if devices else None, start, end, build)
+
+@app.get("/analytics", response_class=ORJSONResponse)
+def get_analytics(
+    device_id: str = DEFAULT_DEVICE_ID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolution: str = "hour",
+    x: str = "relay_on",
+    y: str = "humidity",
+    max_lag: int = 24,
+    bins: int = 20,
+    tz: Optional[str] = None,
+):
+    """
+    Correlation matrix, lagged x -> y cross-correlation (hours) and
+    per-parameter distributions for a device (default: last 30 days).
+    `resolution=hour` uses the hourly rollups, `raw` every reading.
+    """
+    if resolution not in RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    if x not in ANALYTICS_FIELDS or y not in ANALYTICS_FIELDS:
+        raise HTTPException(status_code=400, detail=f"x and y must be one of {', '.join(ANALYTICS_FIELDS)}")
+    if not 0 <= max_lag <= ANALYTICS_MAX_LAG_HOURS or not 1 <= bins <= 200:
+        raise HTTPException(status_code=400, detail=f"max_lag must be 0-{ANALYTICS_MAX_LAG_HOURS} and bins 1-200")
+    zone = viewer_zone(tz)
+    query_start, query_end = to_utc(start, zone), to_utc(end, zone)
+
+    def build():
+        end = query_end or utc_now()
+        start = query_start or end - timedelta(days=30)
+        return localize(analyze(store, device_id, start, end, resolution, x, y, max_lag, bins), zone)
+
+    key = ("analytics", device_id, query_start, query_end, resolution, x, y, max_lag, bins, zone.zone)
+    return cached_response(key, {device_id}, query_start, query_end, build)
+
+@app.get(
+    "/latest-data",
+    response_model=Union[LatestDataResponse, MessageResponse],
+    response_class=ORJSONResponse,
+)
+def get_latest_data(device_id: Optional[str] = None, tz: Optional[str] = None):
+    # Responses are built directly, so FastAPI's jsonable_encoder pass is
+    # skipped and orjson serializes the row (including the datetime) natively.
+    zone = viewer_zone(tz)
     try:
-        data = db.query(SoilData).order_by(SoilData.timestamp.desc()).first()
+        data = store.latest(device_id)
         if data:
-            return {
-                "id": data.id,
-                "nitrogen": data.nitrogen,
-                "phosphorus": data.phosphorus,
-                "potassium": data.potassium,
-                "ph": data.ph,
-                "ec": data.ec,
-                "humidity": data.humidity,
-                "temperature": data.temperature,
-                "relay": data.relay,  # Added relay status to response
-                "timestamp": data.timestamp,
-                "mode": latest_relay_command.get("mode", "auto"),  # Add current mode to response
-                "last_command": latest_relay_command.get("command", "OFF")  # Add last command
-            }
-        return {"message": "No data found"}
+            device = data["device_id"] or DEFAULT_DEVICE_ID
+            command = relay_tracker.effective(device, groups.ancestors(device))
+            data["mode"] = command["mode"]  # Add current mode to response
+            data["last_command"] = command["command"]  # Add last command
+            return ORJSONResponse(localize(data, zone))
+        return ORJSONResponse({"message": "No data found"})
     except Exception as e:
-        logger.error(f"Error retrieving data: {str(e)}")
-        return {"status": "error", "message": str(e)}
-    finally:
-        db.close()
+        logger.error("Error retrieving data: %s", e)
+        return ORJSONResponse({"status": "error", "message": str(e)})
+
+@app.get("/sensor-faults")
+def get_sensor_faults(limit: int = 50, tz: Optional[str] = None):
+    """
+    Per-device fault counters and the most recently quarantined readings
+    """
+    return {
+        "mode": VALIDATION_MODE,
+        "faults": validator.fault_counts(),
+        "quarantined": localize(validator.recent_quarantine(limit), viewer_zone(tz)),
+    }
+
+@app.get("/anomalies")
+def get_anomalies(device_id: Optional[str] = None, limit: int = 100, tz: Optional[str] = None):
+    """
+    Most recent anomaly alerts, optionally for one device
+    """
+    return ORJSONResponse({
+        "devices_tracked": detector.device_count(),
+        "alerts": localize(detector.recent_alerts(device_id, limit), viewer_zone(tz)),
+    })
+
+@app.get("/events")
+async def stream_events(types: Optional[str] = None, tz: Optional[str] = None):
+    """
+    Server-Sent Events stream of live events (e.g. `?types=anomaly`)
+    """
+    event_types = set(types.split(",")) if types else None
+    return StreamingResponse(events.stream(event_types, viewer_zone(tz)), media_type="text/event-stream")
+
+@app.get("/alert-rules")
+def list_alert_rules():
+    """
+    Alert rules currently loaded, and which (rule, device) pairs are firing
+    """
+    return {
+        "rules": [rule.as_dict() for rule in rule_engine.rules()],
+        "firing": [{"rule_id": rule_id, "device_id": device_id} for rule_id, device_id in rule_engine.firing()],
+    }
+
+@app.post("/alert-rules")
+def create_alert_rule(rule_input: AlertRuleInput, db: Session = Depends(get_db)):
+    """
+    Add a persistent alert rule; one for the same device, parameter and
+    operator is replaced, so saving the same thresholds again never
+    duplicates rules
+    """
+    if rule_input.channel in ("webhook", "smtp") and not rule_input.target:
+        raise HTTPException(status_code=400, detail=f"A target is required for {rule_input.channel} rules")
+    try:
+        Rule(None, **rule_input.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        with alert_rule_writes:
+            # Every enabled rule is in memory, so finding the one to replace costs no query
+            existing = rule_engine.matching(rule_input.device_id, rule_input.parameter, rule_input.operator)
+            if existing:
+                rule_id, stale = existing[0], existing[1:]
+                db.execute(update(AlertRule).where(AlertRule.id == rule_id).values(**rule_input.dict()))
+                if stale:
+                    # Duplicates saved before rules were replaced
+                    db.execute(delete(AlertRule).where(AlertRule.id.in_(stale)))
+                db.commit()
+                rule = Rule(rule_id, **rule_input.dict())
+                rule_engine.replace(rule, stale)
+                logger.info("Alert rule %s replaced: %s %s %s", rule.id, rule.parameter, rule.operator, rule.threshold)
+            else:
+                row = AlertRule(**rule_input.dict())
+                db.add(row)
+                db.commit()
+                rule = Rule.from_row(row)  # the id came back with the INSERT
+                rule_engine.add(rule)
+                logger.info("Alert rule %s added: %s %s %s", rule.id, rule.parameter, rule.operator, rule.threshold)
+        return {"status": "success", "rule": rule.as_dict(), "replaced": bool(existing)}
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving alert rule: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.delete("/alert-rules/{rule_id}")
+def delete_alert_rule(rule_id: int, db: Session = Depends(get_db)):
+    """
+    Remove an alert rule
+    """
+    # One DELETE; its row count says whether the rule existed
+    deleted = db.execute(delete(AlertRule).where(AlertRule.id == rule_id)).rowcount
+    db.commit()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    rule_engine.remove(rule_id)
+    return {"status": "success", "rule_id": rule_id}
 
 # Add a health check endpoint
 @app.get("/health")
-def health_check():
-    return {"status": "healthy", "timestamp": get_local_time()}
+def health_check(tz: Optional[str] = None):
+    return {"status": "healthy", "timestamp": localize(utc_now(), viewer_zone(tz))}
 
 @app.post("/control-relay")
-async def control_relay(command: RelayCommand):
+def control_relay(command: RelayCommand):
     """
-    Endpoint to control the relay from dashboard
+    Endpoint to control the relay from dashboard (one device, or all without device_id)
     """
-    global latest_relay_command
-    
     try:
         if command.command.upper() not in ["OFF", "ON"]:
             raise HTTPException(status_code=400, detail="Command must be 'ON' or 'OFF'")
-        
-        latest_relay_command = {
-            "command": command.command.upper(),
-            "mode": "manual",  # When dashboard controls, switch to manual mode
-            "timestamp": get_local_time()
-        }
-        
-        logger.info(f"Relay command received: {command.command.upper()}")
+
+        # When dashboard controls, switch to manual mode
+        pending = []
+        with engine.begin() as conn:
+            issued = relay_tracker.issue(conn, command.command.upper(), "manual", utc_now(), pending, command.device_id)
+        relay_tracker.apply(pending)
+
+        logger.info("Relay command received: %s (device %s)", issued["command"], command.device_id or "all")
         return {
             "status": "success", 
-            "command": command.command.upper(),
+            "command": issued["command"],
             "mode": "manual",
-            "message": f"Relay turned {command.command.upper()}",
-            "timestamp": latest_relay_command["timestamp"]
+            "device_id": command.device_id,
+            "command_id": issued["id"],
+            "message": f"Relay turned {issued['command']}",
+            "timestamp": localize(issued["timestamp"], zone())
         }
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error controlling relay: {str(e)}")
+        logger.error("Error controlling relay: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@app.get("/relay-command")
-async def get_relay_command():
+@app.post("/control-relay/bulk")
+def control_relay_bulk(bulk: BulkRelayCommand):
+    """
+    One manual relay command for many devices and groups, in one transaction
+    """
+    command = bulk.command.upper()
+    if command not in RELAY_STATES:
+        raise HTTPException(status_code=400, detail="Command must be 'ON' or 'OFF'")
+    if not bulk.device_ids and not bulk.group_ids:
+        raise HTTPException(status_code=400, detail="device_ids or group_ids is required")
+    for group_id in bulk.group_ids:
+        known_group(group_id)
+    pending = []
+    with engine.begin() as conn:
+        issued = relay_tracker.issue_many(conn, command, "manual", utc_now(), pending, bulk.device_ids, bulk.group_ids)
+    relay_tracker.apply(pending)
+    logger.info("Relay command %s sent to %d devices and %d groups", command, len(bulk.device_ids), len(bulk.group_ids))
+    return {"status": "success", "command": command, "mode": "manual", "command_ids": [row["id"] for row in issued]}
+
+@app.get("/irrigation-programs", response_class=ORJSONResponse)
+def list_irrigation_programs(tz: Optional[str] = None):
+    """
+    Scheduled irrigation programs with their next start and any run in progress
+    """
+    return ORJSONResponse(localize({"programs": scheduler.programs()}, viewer_zone(tz)))
+
+@app.post("/irrigation-programs", response_class=ORJSONResponse)
+def create_irrigation_program(program_input: IrrigationProgramInput, db: Session = Depends(get_db)):
+    """
+    Water a device, a group or every device at a local time of day, daily
+    or on the given weekdays
+    """
+    if program_input.device_id is not None and program_input.group_id is not None:
+        raise HTTPException(status_code=400, detail="Target either a device_id or a group_id")
+    if program_input.group_id is not None:
+        known_group(program_input.group_id)
+    if not 0 < program_input.duration_minutes <= 24 * 60:
+        raise HTTPException(status_code=400, detail="duration_minutes must be between 0 and 1440")
+    try:
+        parse_days(program_input.days)
+        start_time = parse_start_time(program_input.start_time).isoformat()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    values = {
+        **program_input.dict(exclude={"duration_minutes"}),
+        "start_time": start_time,
+        "duration_seconds": round(program_input.duration_minutes * 60),
+        "timezone": viewer_zone(program_input.timezone).zone,
+        "enabled": True,
+        "run_until": None,
+        "run_command_id": None,
+    }
+    values["next_run"] = next_start(values, utc_now())
+    row = IrrigationProgram(**values)
+    db.add(row)
+    db.commit()
+    program = {name: getattr(row, name) for name in IrrigationProgram.__table__.c.keys()}
+    scheduler.add(program)
+    logger.info("Irrigation program %s added: %s", row.id, program_input.name)
+    return ORJSONResponse({"status": "success", "program": localize(program, zone(program["timezone"]))})
+
+@app.delete("/irrigation-programs/{program_id}")
+def delete_irrigation_program(program_id: int):
+    """
+    Remove an irrigation program; a run in progress ends now
+    """
+    pending = []
+    with engine.begin() as conn:
+        deleted = conn.execute(delete(IrrigationProgram).where(IrrigationProgram.id == program_id)).rowcount
+        if deleted:
+            scheduler.remove(conn, program_id, utc_now(), pending)
+    relay_tracker.apply(pending)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Irrigation program not found")
+    return {"status": "success", "program_id": program_id}
+
+@app.get("/relay-command", response_model=ModeResponse, response_class=ORJSONResponse)
+async def get_relay_command(tz: Optional[str] = None):
     """
     Endpoint for NodeMCU to check for relay commands (legacy endpoint)
     """
-    return latest_relay_command
+    return ORJSONResponse(localize(relay_tracker.broadcast, viewer_zone(tz)))
 
-@app.get("/relay-status")
-async def get_relay_status():
+@app.get("/relay-status", response_class=PlainTextResponse)
+def get_relay_status(device_id: str = DEFAULT_DEVICE_ID):
     """
     Endpoint for NodeMCU to check for relay commands (matches your NodeMCU code)
     """
-    global latest_relay_command
-    
-    # Return response in format expected by NodeMCU
-    response = f"{latest_relay_command['mode']} {latest_relay_command['command'].lower()}"
+    now = utc_now()
+    liveness.heartbeat(device_id, now)
+    command, delivered = relay_tracker.poll(device_id, now, groups.ancestors(device_id))
+    if delivered:
+        try:
+            with engine.begin() as conn:
+                relay_tracker.append(conn, delivered)
+        except Exception as e:
+            logger.error("Could not record relay delivery: %s", e)
+
+    # Return response in format expected by NodeMCU; under a water budget
+    # the pump waits for a free slot
+    response = device_response(admission.decide(device_id, command, now))
     
-    logger.info(f"NodeMCU requested relay status: {response}")
-    return response
+    logger.info("NodeMCU requested relay status: %s", response, extra={"route": "/relay-status"})
+    # Plain text body ("auto off"); the sketch only looks for substrings
+    return PlainTextResponse(response)
+
+@app.get("/admission", response_class=ORJSONResponse)
+async def get_admission(tz: Optional[str] = None):
+    """
+    Water budget: pump slots, devices granted one and how many are waiting
+    """
+    return ORJSONResponse(localize(admission.status(), viewer_zone(tz)))
 
 @app.post("/set-auto-mode")
-async def set_auto_mode():
+def set_auto_mode():
     """
     Endpoint to switch back to auto mode
     """
-    global latest_relay_command
-    
-    latest_relay_command["mode"] = "auto"
-    latest_relay_command["timestamp"] = get_local_time()
-    
+    try:
+        pending = []
+        with engine.begin() as conn:
+            relay_tracker.issue(conn, relay_tracker.broadcast["command"], "auto", utc_now(), pending)
+        relay_tracker.apply(pending)
+    except Exception as e:
+        logger.error("Error switching to auto mode: %s", e)
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
     logger.info("Switched to auto mode")
     return {
         "status": "success",
@@ -203,17 +913,246 @@ async def set_auto_mode():
         "message": "Switched to automatic irrigation mode"
     }
 
-@app.get("/current-mode")
-async def get_current_mode():
+@app.get("/current-mode", response_model=ModeResponse, response_class=ORJSONResponse)
+async def get_current_mode(tz: Optional[str] = None):
     """
     Endpoint to get current irrigation mode
     """
+    broadcast = relay_tracker.broadcast
+    return ORJSONResponse({
+        "mode": broadcast["mode"],
+        "command": broadcast["command"],
+        "timestamp": localize(broadcast["timestamp"], viewer_zone(tz))
+    })
+
+@app.get("/relay-events", response_class=ORJSONResponse)
+def get_relay_events(
+    device_id: Optional[str] = None,
+    event: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = 100,
+    tz: Optional[str] = None,
+    conn=Depends(get_reader),
+):
+    """
+    Relay audit log, newest first, plus commands still awaiting acknowledgement
+    """
+    zone = viewer_zone(tz)
+    events = query_events(conn, device_id, event, to_utc(start, zone), to_utc(end, zone), min(limit, 1000),
+                          groups.ancestors(device_id))
+    return ORJSONResponse(localize({"events": events, "pending": relay_tracker.pending()}, zone))
+
+@app.get("/relay-usage", response_class=ORJSONResponse)
+def get_relay_usage(device_id: str = DEFAULT_DEVICE_ID, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    tz: Optional[str] = None, conn=Depends(get_reader)):
+    """
+    Pump-on intervals, run time and estimated water use (default: last 24 hours)
+    """
+    zone = viewer_zone(tz)
+    end = to_utc(end, zone) or utc_now()
+    start = to_utc(start, zone) or end - timedelta(days=1)
+    return ORJSONResponse(localize(pump_usage(conn, device_id, start, end), zone))
+
+@app.get("/groups")
+def list_groups():
+    """
+    Every farm, field and zone with its device count
+    """
+    return {"groups": groups.tree()}
+
+@app.post("/groups")
+def create_group(group_input: GroupInput, db: Session = Depends(get_db)):
+    """
+    Add a farm, a field (parent_id: its farm) or a zone (parent_id: its field)
+    """
+    try:
+        groups.check_parent(group_input.kind, group_input.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    row = DeviceGroup(**group_input.dict())
+    db.add(row)
+    db.commit()
+    group = groups.add_group({"id": row.id, **group_input.dict()})
+    logger.info("Device group %s added: %s %s", group["id"], group["kind"], group["name"])
+    return {"status": "success", "group": group}
+
+def known_group(group_id):
+    group = groups.group(group_id)
+    if group is None:
+        raise HTTPException(status_code=404, detail="Device group not found")
+    return group
+
+@app.put("/devices/{device_id}/group")
+def assign_device_group(device_id: str, assignment: DeviceGroupInput, db: Session = Depends(get_db)):
+    """
+    Register a device into a group, or take it out with group_id null
+    """
+    if assignment.group_id is not None:
+        known_group(assignment.group_id)
+    db.merge(Device(device_id=device_id, **assignment.dict()))
+    db.commit()
+    groups.assign(device_id, assignment.group_id)
+    return {"status": "success", "device_id": device_id, "group_id": assignment.group_id,
+            "groups": groups.ancestors(device_id)}
+
+@app.get("/groups/{group_id}/latest", response_class=ORJSONResponse)
+def get_group_latest(group_id: int):
+    """
+    Mean of the latest readings of a group's devices, with relay ON and
+    reporting counts, for the group and each of its child groups
+    """
+    known_group(group_id)
+    return ORJSONResponse(groups.latest(group_id))
+
+@app.get("/groups/{group_id}/history")
+def get_group_history(group_id: int, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                      tz: Optional[str] = None):
+    """
+    Hourly mean/min/max/std per parameter over every reading of a group's
+    devices (default: last 24 hours)
+    """
+    group = known_group(group_id)
+    zone = viewer_zone(tz)
+    query_start, query_end = to_utc(start, zone), to_utc(end, zone)
+
+    def build():
+        end = query_end or utc_now()
+        start = query_start or end - timedelta(days=1)
+        with read_engine.connect() as conn:
+            rows = local_hours(query_rollups(conn, group_id, start, end, group_rollup_hourly), zone)
+        return localize({"group": group, "start": start, "end": end,
+                         "buckets": [summarize(row) for row in rows]}, zone)
+
+    key = ("hour", ("group", group_id), query_start, query_end, zone.zone)
+    return cached_response(key, {("group", group_id)}, query_start, query_end, build)
+
+@app.post("/groups/{group_id}/relay")
+def control_group_relay(group_id: int, command: RelayCommand):
+    """
+    Send a manual relay command to every device in a farm, field or zone
+    """
+    known_group(group_id)
+    if command.command.upper() not in RELAY_STATES:
+        raise HTTPException(status_code=400, detail="Command must be 'ON' or 'OFF'")
+    pending = []
+    with engine.begin() as conn:
+        issued = relay_tracker.issue(conn, command.command.upper(), "manual", utc_now(), pending, group_id=group_id)
+    relay_tracker.apply(pending)
+    logger.info("Relay command %s sent to group %s", issued["command"], group_id)
     return {
-        "mode": latest_relay_command.get("mode", "auto"),
-        "command": latest_relay_command.get("command", "OFF"),
-        "timestamp": latest_relay_command.get("timestamp", get_local_time())
+        "status": "success",
+        "command": issued["command"],
+        "mode": "manual",
+        "group_id": group_id,
+        "command_id": issued["id"],
+        "timestamp": localize(issued["timestamp"], zone()),
     }
 
+@app.get("/metrics")
+def get_metrics():
+    """
+    In-process counters and timings (logging cost, sampled-out records, ...)
+    """
+    return {**metrics.snapshot(), "dedupe": dedupe_cache.stats(), "query_cache": query_cache.stats(),
+            "liveness": liveness.counts()}
+
+@app.on_event("startup")
+def create_sqlite_tables():
+    """A SQLite DATABASE_URL needs no separate setup script"""
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(bind=engine)
+
+@app.on_event("startup")
+def start_store():
+    store.start()
+    logger.info("Reading store: %s", store.name)
+
+@app.on_event("startup")
+def load_alert_rules():
+    notifier.start()
+    db = SessionLocal()
+    try:
+        rows = db.query(AlertRule).filter(AlertRule.enabled.is_(True)).all()
+        rule_engine.load([Rule.from_row(row) for row in rows])
+        logger.info("Loaded %d alert rules", len(rows))
+    except Exception as e:
+        logger.error("Could not load alert rules: %s", e)
+    finally:
+        db.close()
+
+@app.on_event("startup")
+def warm_window():
+    """Fill the dashboard window from the database so it is complete after a restart"""
+    since = utc_now() - timedelta(seconds=WINDOW_WARM_SECONDS)
+    try:
+        by_device = store.recent(since)
+        for device_id, rows in by_device.items():
+            window_store.append(device_id, rows)
+        logger.info("Window warmed with %d devices", len(by_device))
+    except Exception as e:
+        logger.error("Could not warm dashboard window: %s", e)
+
+@app.on_event("startup")
+def seed_fleet():
+    try:
+        latest = store.latest_per_device()
+        fleet.seed(latest)
+        groups.seed(latest)
+        liveness.seed(latest, utc_now())
+        gap_detector.seed(latest)
+        # Readings older than these are late and never open a relay interval
+        relay_tracker.seed_readings(latest)
+        logger.info("Fleet overview seeded with %d devices", fleet.device_count())
+    except Exception as e:
+        logger.error("Could not seed fleet overview: %s", e)
+
+@app.on_event("startup")
+def load_groups():
+    """Groups and memberships; latest readings come with the fleet seed"""
+    try:
+        with engine.connect() as conn:
+            stored = [row._asdict() for row in conn.execute(select(DeviceGroup.__table__))]
+            devices = [row._asdict() for row in conn.execute(select(Device.device_id, Device.group_id))]
+        groups.load(stored, devices)
+        logger.info("Loaded %d device groups", groups.group_count())
+    except Exception as e:
+        logger.error("Could not load device groups: %s", e)
+
+@app.on_event("startup")
+def seed_relay_state():
+    try:
+        with engine.connect() as conn:
+            relay_tracker.seed(conn)
+    except Exception as e:
+        logger.error("Could not restore relay state: %s", e)
+
+@app.on_event("startup")
+async def start_scheduler():
+    """After the relay state: a run that ended while the server was down checks the current command"""
+    try:
+        with engine.connect() as conn:
+            count = scheduler.load(conn, utc_now())
+        logger.info("Loaded %d irrigation programs", count)
+    except Exception as e:
+        logger.error("Could not load irrigation programs: %s", e)
+    scheduler.start()
+
+@app.on_event("startup")
+async def start_liveness_checks():
+    liveness.start()
+
+@app.on_event("shutdown")
+async def stop_timers():
+    await scheduler.stop()
+    await liveness.stop()
+
+@app.on_event("shutdown")
+def flush_logs():
+    notifier.stop()
+    store.close()
+    shutdown_logging()
+
 if __name__ == "__main__":
     import uvicorn
     # Make server accessible from network (not just localhost)
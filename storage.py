@@ -0,0 +1,384 @@
+# storage.py
+"""
+Storage backends for sensor readings.
+
+server.py reads and writes readings through a ReadingStore chosen with
+STORAGE_BACKEND:
+
+- sql:  the soil_data table (MySQL unless DATABASE_URL says otherwise),
+        with quarter-hour rollups kept in soil_rollup_hourly on ingest
+- sqlite: the same tables in a SQLite file, written by one batching
+        writer connection (db.py)
+- tsdb: the embedded columnar engine in tsdb.py, files under TSDB_PATH;
+        rollups are computed from the columns when asked for
+
+Alert rules, relay events and relay intervals stay in the SQL database
+with either backend; a SQLite DATABASE_URL runs the whole server without
+a database service.
+
+History is returned as column arrays in the same shape as `GET /window`
+(datetime64 `timestamp`, one array per sensor field, 0/1 `relay_on`, where
+a reading without a relay state counts as 0).
+"""
+import os
+import threading
+from datetime import timedelta
+
+import numpy as np
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+
+from export import EXPORT_CHUNK_ROWS, device_filter, export_query, iter_partitions
+from fleet import latest_rows_query
+from metrics import metrics
+from models import SoilData, DEFAULT_DEVICE_ID, SENSOR_FIELDS, SENSOR_SCALES
+from rollups import (BUCKET_MINUTES, aggregate, aggregate_columns, bucket_start, merge_rollups, query_rollups,
+                     soil_rollup_hourly)
+from tsdb import (NO_SEQ, RECORD, RELAY_CODES, RELAY_MISSING, RELAY_STATES_BY_CODE, TSDB_COMPACT_SECONDS, ColumnarStore,
+                  to_micros)
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sql").lower()
+
+# Fields without a register scale are whole numbers (INT columns in MySQL)
+INTEGER_FIELDS = tuple(field for field in SENSOR_FIELDS if SENSOR_SCALES[field] == 1)
+
+# Rows are passed as parameters, so the compiled INSERT is cached
+INSERT = insert(SoilData)
+INSERT_IGNORE = INSERT.prefix_with("IGNORE", dialect="mysql").prefix_with("OR IGNORE", dialect="sqlite")
+
+
+def insert_readings(conn, rows):
+    """
+    INSERT readings into soil_data and return their ids (None for batch
+    rows); a single keyed row that is already stored returns []
+    """
+    if len(rows) == 1:
+        row = rows[0]
+        keyed = row.get("device_id") is not None and row.get("seq") is not None
+        outcome = conn.execute(INSERT_IGNORE if keyed else INSERT, row)
+        if outcome.rowcount == 0:
+            return []
+        return [outcome.inserted_primary_key[0]]
+    conn.execute(INSERT_IGNORE, rows)
+    return [None] * len(rows)
+
+
+READING_COLUMNS = (
+    SoilData.id, *[SoilData.__table__.c[field] for field in SENSOR_FIELDS],
+    SoilData.relay, SoilData.timestamp, SoilData.device_id,
+)
+
+
+class ReadingStore:
+    """Where readings are stored; `db` arguments are the ingest request's Session"""
+
+    name = None
+
+    def stored_seqs(self, db, device_id, low, high):
+        """Sequence numbers in [low, high] already stored for a device"""
+        raise NotImplementedError
+
+    def insert(self, db, device_id, rows):
+        """
+        Store rows and return their ids (None where the backend has none);
+        a single keyed row that is already stored returns []
+        """
+        raise NotImplementedError
+
+    def max_seq(self, db, device_id):
+        raise NotImplementedError
+
+    def latest(self, device_id=None):
+        """Newest reading of a device (or of any device) as a dict, or None"""
+        raise NotImplementedError
+
+    def latest_per_device(self):
+        """Newest reading of every device"""
+        raise NotImplementedError
+
+    def history(self, device_id, start=None, end=None):
+        """Readings in [start, end) as column arrays, oldest first"""
+        raise NotImplementedError
+
+    def recent(self, since):
+        """Readings since a time as row dicts, per device"""
+        raise NotImplementedError
+
+    def rollups(self, device_id, start=None, end=None):
+        """Quarter-hour rollup rows, oldest first (same rows as rollups.query_rollups)"""
+        raise NotImplementedError
+
+    def devices(self):
+        raise NotImplementedError
+
+    def partitions(self, device_ids=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        """Export rows (export.EXPORT_COLUMNS order) in lists of at most chunk_rows"""
+        raise NotImplementedError
+
+    def start(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SqlReadingStore(ReadingStore):
+    """soil_data and soil_rollup_hourly in the SQL database"""
+
+    name = "sql"
+
+    def __init__(self, engine, reader=None):
+        self.engine = engine
+        self.reader = reader or engine  # reads may use a separate autocommit pool
+
+    def stored_seqs(self, db, device_id, low, high):
+        return set(db.execute(
+            select(SoilData.seq).where(SoilData.device_id == device_id, SoilData.seq.between(low, high))
+        ).scalars())
+
+    def insert(self, db, device_id, rows):
+        # Core execution on the session's connection: no ORM bulk-insert path
+        conn = db.connection() if isinstance(db, Session) else db
+        ids = insert_readings(conn, rows)
+        if ids:
+            merge_rollups(conn, aggregate(device_id, rows))
+        return ids
+
+    def max_seq(self, db, device_id):
+        return db.execute(select(func.max(SoilData.seq)).where(SoilData.device_id == device_id)).scalar()
+
+    def latest(self, device_id=None):
+        # Plain Core rows: no ORM objects or identity map on every dashboard poll
+        query = select(*READING_COLUMNS).order_by(SoilData.timestamp.desc()).limit(1)
+        if device_id is not None:
+            query = query.where(self._device_filter(device_id))
+        with self.reader.connect() as conn:
+            row = conn.execute(query).first()
+        return row._asdict() if row else None
+
+    def latest_per_device(self):
+        with self.reader.connect() as conn:
+            rows = [row._asdict() for row in conn.execute(latest_rows_query())]
+        for row in rows:
+            row["device_id"] = row["device_id"] or DEFAULT_DEVICE_ID
+        return rows
+
+    def _device_filter(self, device_id):
+        return device_filter([device_id])
+
+    def history(self, device_id, start=None, end=None):
+        query = (
+            select(SoilData.timestamp, *[SoilData.__table__.c[field] for field in SENSOR_FIELDS], SoilData.relay)
+            .where(self._device_filter(device_id))
+            .order_by(SoilData.timestamp)
+        )
+        if start is not None:
+            query = query.where(SoilData.timestamp >= start)
+        if end is not None:
+            query = query.where(SoilData.timestamp < end)
+        with self.reader.connect() as conn:
+            rows = conn.execute(query).all()
+        columns = list(zip(*rows)) or [()] * (len(SENSOR_FIELDS) + 2)
+        history = {"timestamp": np.array(columns[0], dtype="datetime64[ms]")}
+        for field, values in zip(SENSOR_FIELDS, columns[1:]):
+            history[field] = np.array(values, dtype=np.float64)
+        history["relay_on"] = np.array([relay == "ON" for relay in columns[-1]], dtype=np.int8)
+        return history
+
+    def recent(self, since):
+        query = (
+            select(SoilData.device_id, SoilData.timestamp, SoilData.relay,
+                   *[SoilData.__table__.c[field] for field in SENSOR_FIELDS])
+            .where(SoilData.timestamp >= since)
+            .order_by(SoilData.timestamp)
+        )
+        by_device = {}
+        with self.reader.connect() as conn:
+            for row in conn.execute(query):
+                by_device.setdefault(row.device_id or DEFAULT_DEVICE_ID, []).append(row._asdict())
+        return by_device
+
+    def rollups(self, device_id, start=None, end=None):
+        with self.reader.connect() as conn:
+            return query_rollups(conn, device_id, start, end)
+
+    def devices(self):
+        table = soil_rollup_hourly
+        with self.reader.connect() as conn:
+            return list(conn.execute(select(table.c.device_id).distinct().order_by(table.c.device_id)).scalars())
+
+    def partitions(self, device_ids=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        return iter_partitions(self.reader, export_query(device_ids, start, end), chunk_rows)
+
+
+class ColumnarReadingStore(ReadingStore):
+    """Readings in the embedded columnar engine (tsdb.py)"""
+
+    name = "tsdb"
+
+    def __init__(self, columnar, compact_seconds=TSDB_COMPACT_SECONDS):
+        self.columnar = columnar
+        self.compact_seconds = compact_seconds
+        self._stop = None
+
+    @staticmethod
+    def _micros(ts):
+        return None if ts is None else to_micros(ts)
+
+    def stored_seqs(self, db, device_id, low, high):
+        series = self.columnar.series(device_id)
+        return series.stored_seqs(low, high) if series is not None else set()
+
+    def insert(self, db, device_id, rows):
+        records = np.empty(len(rows), RECORD)
+        records["ts"] = np.array([row["timestamp"] for row in rows], dtype="datetime64[us]").astype(np.int64)
+        records["seq"] = [NO_SEQ if row.get("seq") is None else row["seq"] for row in rows]
+        for field in SENSOR_FIELDS:
+            records[field] = [row[field] for row in rows]
+        records["relay"] = [RELAY_CODES.get(str(row.get("relay")).upper(), RELAY_MISSING) for row in rows]
+        # Like INSERT IGNORE: keyed rows already stored are skipped, atomically
+        appended = self.columnar.series(device_id, create=True).append_new(records)
+        if not appended and len(rows) == 1:
+            return []
+        return [None] * len(rows)
+
+    def max_seq(self, db, device_id):
+        series = self.columnar.series(device_id)
+        return series.max_seq if series is not None else None
+
+    @staticmethod
+    def _values(field, column):
+        """Python values of one sensor column: ints for integer registers, None where missing"""
+        missing = np.isnan(column)
+        if field in INTEGER_FIELDS:
+            column = np.where(missing, 0, column).astype(np.int64)
+        values = column.tolist()
+        if missing.any():
+            for i in np.flatnonzero(missing).tolist():
+                values[i] = None
+        return values
+
+    @staticmethod
+    def _relays(column):
+        """Relay states of one relay column: "ON", "OFF" or None where missing"""
+        return [RELAY_STATES_BY_CODE.get(code) for code in column.tolist()]
+
+    def _rows(self, device_id, columns):
+        """Reading dicts (as the SQL backend returns them) from engine columns"""
+        timestamps = columns["ts"].astype("datetime64[us]").tolist()
+        values = {field: self._values(field, columns[field]) for field in SENSOR_FIELDS}
+        relay = self._relays(columns["relay"])
+        return [
+            {"id": None, **{field: values[field][i] for field in SENSOR_FIELDS},
+             "relay": relay[i], "timestamp": timestamps[i], "device_id": device_id}
+            for i in range(len(timestamps))
+        ]
+
+    def latest(self, device_id=None):
+        candidates = self.columnar.devices() if device_id is None else [device_id]
+        newest = None
+        for candidate in candidates:
+            series = self.columnar.series(candidate)
+            if series is None or series.latest is None:
+                continue
+            if newest is None or series.latest["ts"][0] > newest[1]["ts"][0]:
+                newest = (candidate, series.latest)
+        return self._rows(*newest)[0] if newest else None
+
+    def latest_per_device(self):
+        rows = []
+        for device_id in self.columnar.devices():
+            series = self.columnar.series(device_id)
+            if series.latest is not None:
+                rows.extend(self._rows(device_id, series.latest))
+        return rows
+
+    def _columns(self, device_id, start, end, names):
+        series = self.columnar.series(device_id)
+        if series is None:
+            return {name: np.empty(0, RECORD[name]) for name in names}
+        return series.read(start, end, names)
+
+    def history(self, device_id, start=None, end=None):
+        columns = self._columns(device_id, self._micros(start), self._micros(end), ("ts", *SENSOR_FIELDS, "relay"))
+        history = {"timestamp": columns["ts"].astype("datetime64[us]").astype("datetime64[ms]")}
+        for field in SENSOR_FIELDS:
+            history[field] = columns[field]
+        history["relay_on"] = (columns["relay"] == RELAY_CODES["ON"]).astype(np.int8)
+        return history
+
+    def recent(self, since):
+        by_device = {}
+        for device_id in self.columnar.devices():
+            columns = self._columns(device_id, self._micros(since), None, ("ts", *SENSOR_FIELDS, "relay"))
+            if len(columns["ts"]):
+                by_device[device_id] = self._rows(device_id, columns)
+        return by_device
+
+    def rollups(self, device_id, start=None, end=None):
+        # Same buckets as query_rollups: from start's hour to the last bucket beginning before end
+        low = self._micros(bucket_start(start)) if start is not None else None
+        high = None
+        if end is not None:
+            high = self._micros(end if end == bucket_start(end) else bucket_start(end) + timedelta(minutes=BUCKET_MINUTES))
+        columns = self._columns(device_id, low, high, ("ts", *SENSOR_FIELDS, "relay"))
+        values = np.column_stack([columns[field] for field in SENSOR_FIELDS])
+        return aggregate_columns(
+            device_id, columns["ts"].astype("datetime64[us]"), values,
+            (columns["relay"] == RELAY_CODES["ON"]).astype(int)
+        )
+
+    def devices(self):
+        return self.columnar.devices()
+
+    def partitions(self, device_ids=None, start=None, end=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        """One device after another, read one chunk period at a time to bound memory"""
+        names = ("ts", "seq", *SENSOR_FIELDS, "relay")
+        for device_id in device_ids or self.columnar.devices():
+            series = self.columnar.series(device_id)
+            if series is None:
+                continue
+            for low, high in series.chunk_ranges(self._micros(start), self._micros(end)):
+                columns = series.read(low, high, names)
+                for offset in range(0, len(columns["ts"]), chunk_rows):
+                    part = {name: values[offset:offset + chunk_rows] for name, values in columns.items()}
+                    seqs = part["seq"].tolist()
+                    yield list(zip(
+                        part["ts"].astype("datetime64[us]").tolist(),
+                        [device_id] * len(seqs),
+                        [None if seq < 0 else seq for seq in seqs],
+                        *[self._values(field, part[field]) for field in SENSOR_FIELDS],
+                        self._relays(part["relay"]),
+                    ))
+
+    def start(self):
+        """Compact fragmented chunks in the background"""
+        if not self.compact_seconds or self._stop is not None:
+            return
+        self._stop = threading.Event()
+
+        def run():
+            while not self._stop.wait(self.compact_seconds):
+                rewritten = self.columnar.compact()
+                if rewritten:
+                    metrics.inc("tsdb_chunks_compacted", rewritten)
+
+        threading.Thread(target=run, name="tsdb-compaction", daemon=True).start()
+
+    def close(self):
+        if self._stop is not None:
+            self._stop.set()
+        self.columnar.close()
+
+
+def open_store(engine, backend=STORAGE_BACKEND, reader=None):
+    """The ReadingStore for a STORAGE_BACKEND name (`reader`: engine for reads)"""
+    if backend == "sql":
+        return SqlReadingStore(engine, reader)
+    if backend == "sqlite":
+        from db import SqliteReadingStore  # db.py builds on SqlReadingStore
+
+        return SqliteReadingStore(engine)
+    if backend == "tsdb":
+        return ColumnarReadingStore(ColumnarStore())
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r} (expected 'sql', 'sqlite' or 'tsdb')")
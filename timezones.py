@@ -0,0 +1,104 @@
+# timezones.py
+"""
+Stored in UTC, shown in the viewer's time zone.
+
+Every timestamp column (readings, rollup buckets, relay events and
+intervals, alert rules) holds naive UTC (models.utc_now), so range queries
+mean the same on every deployment and DST never makes a stored time
+ambiguous.
+
+Responses are converted to the viewer's zone (`?tz=`, default DISPLAY_TZ)
+once, on the way out: `localize` walks a scalar payload, `localize_column`
+shifts a whole timestamp array with one offset lookup per day (per quarter
+hour only on days with a DST change). Naive query parameters are wall
+times in the viewer's zone (`to_utc`; `utc_column` for whole arrays).
+"""
+import os
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pytz
+
+DISPLAY_TZ = os.getenv("DISPLAY_TZ", "Asia/Kolkata")
+
+_EPOCH = np.datetime64(0, "m")
+_DAY = np.timedelta64(1, "D")
+_QUARTER = np.timedelta64(15, "m")  # every zone's offset changes on a quarter hour
+
+
+@lru_cache(maxsize=64)
+def zone(name=None):
+    """tzinfo for an IANA zone name (default DISPLAY_TZ)"""
+    try:
+        return pytz.timezone(name or DISPLAY_TZ)
+    except pytz.UnknownTimeZoneError:
+        raise ValueError(f"Unknown time zone: {name}")
+
+
+def to_utc(value, tz):
+    """Naive UTC for a query parameter: naive values are wall time in `tz`"""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = tz.localize(value)
+    return value.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def localize(value, tz):
+    """Copy of a payload with every stored (naive UTC) datetime made aware in `tz`"""
+    if isinstance(value, datetime):
+        return pytz.utc.localize(value).astimezone(tz) if value.tzinfo is None else value.astimezone(tz)
+    if isinstance(value, dict):
+        return {key: localize(item, tz) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [localize(item, tz) for item in value]
+    return value
+
+
+def _offset(instant, tz):
+    """UTC offset of `tz` at a datetime64 instant, as timedelta64[s]"""
+    moment = pytz.utc.localize(instant.astype("datetime64[us]").item())
+    return np.timedelta64(int(moment.astimezone(tz).utcoffset().total_seconds()), "s")
+
+
+def _wall_offset(instant, tz):
+    """UTC offset of `tz` at a datetime64 wall time, as timedelta64[s]"""
+    moment = tz.localize(instant.astype("datetime64[us]").item())
+    return np.timedelta64(int(moment.utcoffset().total_seconds()), "s")
+
+
+def _offsets(timestamps, tz, lookup):
+    """Per-row offsets (in the array's unit): one lookup per day, per quarter hour on DST days"""
+    days, inverse = np.unique(timestamps.astype("datetime64[D]"), return_inverse=True)
+    inverse = inverse.ravel()
+    starts = np.array([lookup(day, tz) for day in days])
+    ends = np.array([lookup(day + _DAY - np.timedelta64(1, "s"), tz) for day in days])
+    offsets = starts[inverse]
+    for i in np.flatnonzero(starts != ends):
+        # DST change that day: look the offset up per quarter hour
+        rows = np.flatnonzero(inverse == i)
+        minutes = timestamps[rows].astype("datetime64[m]")
+        quarters, where = np.unique(minutes - (minutes - _EPOCH) % _QUARTER, return_inverse=True)
+        offsets[rows] = np.array([lookup(quarter, tz) for quarter in quarters])[where.ravel()]
+    unit = np.datetime_data(timestamps.dtype)[0]
+    return offsets.astype(f"timedelta64[{unit}]")
+
+
+def localize_column(timestamps, tz):
+    """Naive-UTC datetime64 array as wall time in `tz` (same unit), vectorized"""
+    if not len(timestamps):
+        return timestamps
+    return timestamps + _offsets(timestamps, tz, _offset)
+
+
+def utc_column(timestamps, tz):
+    """Inverse of localize_column: wall times in `tz` as naive UTC (as `to_utc` does)"""
+    if not len(timestamps):
+        return timestamps
+    return timestamps - _offsets(timestamps, tz, _wall_offset)
+
+
+def local_date(value, tz):
+    """Calendar date in `tz` of a naive UTC datetime"""
+    return pytz.utc.localize(value).astimezone(tz).date()
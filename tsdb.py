@@ -0,0 +1,436 @@
+# tsdb.py
+"""
+Embedded append-only columnar time-series engine.
+
+Readings are kept per device under TSDB_PATH, one directory per device:
+
+    head.rec                 newest rows, appended as fixed-size records
+    <chunk>-<gen>.col        sealed blocks for one TSDB_CHUNK_DAYS period
+    <chunk>-<gen>.idx        one entry per block: byte offset, row count,
+                             min/max timestamp and min/max seq
+
+Once a device's head holds TSDB_BLOCK_ROWS rows it is sorted by time and
+sealed into blocks, one column after another (timestamp, seq, each sensor
+field, relay), so a range query reads only the columns and blocks it
+needs. Chunk files are read through memory maps and blocks outside the
+requested time or seq range are skipped using the index alone.
+
+Late store-and-forward readings land in their own (older) chunk as small
+extra blocks. `compact()` rewrites such chunks as sorted, full-size blocks
+under a new generation number; the new index file is renamed into place
+last, so a crash leaves either the old or the new generation, never a mix.
+
+The engine is meant for a single server process.
+"""
+import glob
+import os
+import threading
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from models import SENSOR_FIELDS
+
+TSDB_PATH = os.getenv("TSDB_PATH", "tsdb")
+TSDB_BLOCK_ROWS = int(os.getenv("TSDB_BLOCK_ROWS", "1024"))
+TSDB_CHUNK_DAYS = int(os.getenv("TSDB_CHUNK_DAYS", "7"))
+TSDB_FSYNC = os.getenv("TSDB_FSYNC", "0") == "1"
+TSDB_COMPACT_SECONDS = int(os.getenv("TSDB_COMPACT_SECONDS", "3600"))
+
+NO_SEQ = -1
+# Relay column: 1 ON, 0 OFF, -1 for readings that carry no relay state
+RELAY_CODES = {"ON": 1, "OFF": 0}
+RELAY_MISSING = -1
+RELAY_STATES_BY_CODE = {code: state for state, code in RELAY_CODES.items()}
+
+# Timestamps are naive UTC in microseconds since the epoch
+RECORD = np.dtype(
+    [("ts", "<i8"), ("seq", "<i8")] + [(field, "<f8") for field in SENSOR_FIELDS] + [("relay", "i1")]
+)
+INDEX = np.dtype([
+    ("offset", "<i8"), ("rows", "<i8"),
+    ("ts_min", "<i8"), ("ts_max", "<i8"),
+    ("seq_min", "<i8"), ("seq_max", "<i8"),
+])
+COLUMNS = RECORD.names
+
+# Byte offset of each column inside a block, per row of the block
+_COLUMN_OFFSETS = {}
+_offset = 0
+for _name in COLUMNS:
+    _COLUMN_OFFSETS[_name] = _offset
+    _offset += RECORD[_name].itemsize
+del _offset, _name
+
+DAY_US = 86_400_000_000
+
+
+def block_bytes(rows):
+    """Size of a block on disk, padded so every block starts 8-byte aligned"""
+    return -(-rows * RECORD.itemsize // 8) * 8
+
+
+def to_micros(ts):
+    """Naive datetime to the engine's int64 timestamp"""
+    return int(np.datetime64(ts, "us").astype(np.int64))
+
+
+class Chunk:
+    """Blocks of one device covering one chunk period"""
+
+    def __init__(self, directory, number, generation=0):
+        self.directory = directory
+        self.number = number
+        self.generation = generation
+        self.index = np.empty(0, INDEX)
+        self._map = None
+
+    def path(self, extension, generation=None):
+        generation = self.generation if generation is None else generation
+        return os.path.join(self.directory, f"{self.number:06d}-{generation}.{extension}")
+
+    def load(self):
+        """Read the index; bytes past the last indexed block (a torn append) are cut off"""
+        raw = np.fromfile(self.path("idx"), dtype=np.uint8)
+        usable = len(raw) - len(raw) % INDEX.itemsize
+        self.index = raw[:usable].view(INDEX).copy()
+        end = 0
+        if len(self.index):
+            last = self.index[-1]
+            end = int(last["offset"]) + block_bytes(int(last["rows"]))
+        if os.path.getsize(self.path("col")) > end:
+            with open(self.path("col"), "r+b") as f:
+                f.truncate(end)
+
+    @staticmethod
+    def encode(rows):
+        """Sorted records as one block: each column in turn, padded"""
+        data = b"".join(np.ascontiguousarray(rows[name]).tobytes() for name in COLUMNS)
+        return data + b"\0" * (block_bytes(len(rows)) - len(data))
+
+    @staticmethod
+    def entry(offset, rows):
+        seq = rows["seq"]
+        return np.array(
+            [(offset, len(rows), rows["ts"][0], rows["ts"][-1], seq.min(), seq.max())], dtype=INDEX
+        )
+
+    def append_block(self, rows):
+        """Write sorted records as one block and index it"""
+        with open(self.path("col"), "ab") as f:
+            offset = f.tell()
+            f.write(self.encode(rows))
+            if TSDB_FSYNC:
+                os.fsync(f.fileno())
+        entry = self.entry(offset, rows)
+        with open(self.path("idx"), "ab") as f:
+            f.write(entry.tobytes())
+            if TSDB_FSYNC:
+                os.fsync(f.fileno())
+        self.index = np.concatenate([self.index, entry])
+        self._map = None
+
+    def column(self, block, name):
+        """One column of one block, as a read-only view of the memory map"""
+        if self._map is None:
+            self._map = np.memmap(self.path("col"), dtype=np.uint8, mode="r")
+        entry = self.index[block]
+        rows = int(entry["rows"])
+        start = int(entry["offset"]) + rows * _COLUMN_OFFSETS[name]
+        return np.frombuffer(self._map, dtype=RECORD[name], count=rows, offset=start)
+
+    def records(self, blocks=None):
+        """Blocks reassembled into records"""
+        blocks = range(len(self.index)) if blocks is None else blocks
+        parts = []
+        for block in blocks:
+            part = np.empty(int(self.index[block]["rows"]), RECORD)
+            for name in COLUMNS:
+                part[name] = self.column(block, name)
+            parts.append(part)
+        return np.concatenate(parts) if parts else np.empty(0, RECORD)
+
+    def needs_compaction(self, block_rows):
+        if len(self.index) < 2:
+            return False
+        full = -(-int(self.index["rows"].sum()) // block_rows)
+        overlapping = np.any(self.index["ts_min"][1:] < self.index["ts_max"][:-1])
+        return len(self.index) > full or bool(overlapping)
+
+    def compact(self, block_rows):
+        """Rewrite as sorted full blocks under the next generation"""
+        rows = self.records()
+        rows = rows[np.argsort(rows["ts"], kind="stable")]
+        # Drop keyed rows stored twice (a crash between sealing and clearing the head)
+        keyed = np.flatnonzero(rows["seq"] != NO_SEQ)
+        if len(keyed):
+            pairs = np.stack([rows["ts"][keyed], rows["seq"][keyed]], axis=1)
+            _, first = np.unique(pairs, axis=0, return_index=True)
+            keep = rows["seq"] == NO_SEQ
+            keep[keyed[first]] = True
+            rows = rows[keep]
+
+        compacted = Chunk(self.directory, self.number, self.generation + 1)
+        entries = []
+        with open(compacted.path("col"), "wb") as f:
+            for start in range(0, len(rows), block_rows):
+                block = rows[start:start + block_rows]
+                entries.append(self.entry(f.tell(), block))
+                f.write(self.encode(block))
+            os.fsync(f.fileno())
+        compacted.index = np.concatenate(entries)
+        # Publish by renaming the index into place; a .col without one is ignored
+        with open(compacted.path("idx.tmp"), "wb") as f:
+            f.write(compacted.index.tobytes())
+            os.fsync(f.fileno())
+        os.replace(compacted.path("idx.tmp"), compacted.path("idx"))
+        for extension in ("idx", "col"):
+            os.remove(self.path(extension))
+        return compacted
+
+
+class Series:
+    """One device's head buffer and chunks"""
+
+    def __init__(self, directory, block_rows=TSDB_BLOCK_ROWS, chunk_days=TSDB_CHUNK_DAYS):
+        self.directory = directory
+        self.block_rows = block_rows
+        self.chunk_us = chunk_days * DAY_US
+        self.lock = threading.RLock()
+        self.chunks = {}
+        self.head = np.empty(block_rows, RECORD)
+        self.head_rows = 0
+        self.latest = None   # newest record, as a one-row array
+        self.max_seq = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._head_file = open(os.path.join(directory, "head.rec"), "ab", buffering=0)
+
+    def _load(self):
+        for leftover in glob.glob(os.path.join(self.directory, "*.tmp")):
+            os.remove(leftover)
+        generations = {}
+        for path in glob.glob(os.path.join(self.directory, "*.idx")):
+            number, generation = os.path.basename(path)[:-4].split("-")
+            generations.setdefault(int(number), []).append(int(generation))
+        for number, found in generations.items():
+            found.sort()
+            chunk = Chunk(self.directory, number, found[-1])
+            for stale in found[:-1]:
+                for extension in ("idx", "col"):
+                    os.remove(chunk.path(extension, stale))
+            chunk.load()
+            self.chunks[number] = chunk
+        # A .col without an index is an unpublished compaction
+        for path in glob.glob(os.path.join(self.directory, "*.col")):
+            if not os.path.exists(path[:-4] + ".idx"):
+                os.remove(path)
+
+        for chunk in self.chunks.values():
+            if len(chunk.index):
+                seq_max = int(chunk.index["seq_max"].max())
+                if seq_max != NO_SEQ:
+                    self.max_seq = max(self.max_seq or NO_SEQ, seq_max)
+        if self.chunks:
+            newest = max(
+                ((chunk, block) for chunk in self.chunks.values() for block in range(len(chunk.index))),
+                key=lambda item: item[0].index[item[1]]["ts_max"],
+            )
+            self.latest = newest[0].records([newest[1]])[-1:].copy()
+
+        head_path = os.path.join(self.directory, "head.rec")
+        if os.path.exists(head_path):
+            raw = np.fromfile(head_path, dtype=np.uint8)
+            head = raw[:len(raw) - len(raw) % RECORD.itemsize].view(RECORD)
+            head = self._unsealed(head)
+            # Rewrite to drop a torn last record or rows already sealed
+            with open(head_path, "wb") as f:
+                f.write(head.tobytes())
+            self._fill(head)
+
+    def _unsealed(self, head):
+        """Head rows not already in a block (the head is cleared after sealing)"""
+        if not len(head) or not self.chunks:
+            return head
+        sealed = self.read(int(head["ts"].min()), int(head["ts"].max()) + 1, ("ts", "seq"))
+        if not len(sealed["ts"]):
+            return head
+        stored = set(zip(sealed["ts"].tolist(), sealed["seq"].tolist()))
+        keep = [(ts, seq) not in stored for ts, seq in zip(head["ts"].tolist(), head["seq"].tolist())]
+        return head[np.array(keep, dtype=bool)]
+
+    def _fill(self, records):
+        """Copy records into the head, sealing whenever it fills up; True if it sealed"""
+        start = 0
+        sealed = False
+        while start < len(records):
+            take = min(len(records) - start, self.block_rows - self.head_rows)
+            self.head[self.head_rows:self.head_rows + take] = records[start:start + take]
+            self.head_rows += take
+            start += take
+            if self.head_rows == self.block_rows:
+                self.seal()
+                sealed = True
+        if len(records):
+            newest = int(np.argmax(records["ts"]))
+            if self.latest is None or records["ts"][newest] >= self.latest["ts"][0]:
+                self.latest = records[newest:newest + 1].copy()
+            keyed = records["seq"][records["seq"] != NO_SEQ]
+            if len(keyed):
+                self.max_seq = max(self.max_seq or NO_SEQ, int(keyed.max()))
+        return sealed
+
+    def append(self, records):
+        with self.lock:
+            self._head_file.write(records.tobytes())
+            if TSDB_FSYNC:
+                os.fsync(self._head_file.fileno())
+            if self._fill(records) and self.head_rows:
+                # Sealing emptied the head file, which also held the rows after the seal
+                self._head_file.write(self.head[:self.head_rows].tobytes())
+                if TSDB_FSYNC:
+                    os.fsync(self._head_file.fileno())
+
+    def append_new(self, records):
+        """
+        Append the records whose seq is not stored yet (unkeyed rows always),
+        checked and appended under the lock; returns how many were appended
+        """
+        with self.lock:
+            seq = records["seq"]
+            keyed = seq != NO_SEQ
+            if keyed.any():
+                # First occurrence of each seq in the batch, then drop stored ones
+                keep = ~keyed
+                keep[np.flatnonzero(keyed)[np.unique(seq[keyed], return_index=True)[1]]] = True
+                if self.max_seq is not None and int(seq[keyed].min()) <= self.max_seq:
+                    stored = self.stored_seqs(int(seq[keyed].min()), self.max_seq)
+                    if stored:
+                        keep &= ~np.isin(seq, np.fromiter(stored, np.int64, len(stored)))
+                records = records[keep]
+            if len(records):
+                self.append(records)
+            return len(records)
+
+    def seal(self):
+        """Move the head into blocks, one per chunk period it spans"""
+        if not self.head_rows:
+            return
+        rows = self.head[:self.head_rows]
+        rows = rows[np.argsort(rows["ts"], kind="stable")]
+        numbers = rows["ts"] // self.chunk_us
+        for number in np.unique(numbers):
+            number = int(number)
+            chunk = self.chunks.get(number)
+            if chunk is None:
+                chunk = self.chunks[number] = Chunk(self.directory, number)
+            chunk.append_block(rows[numbers == number])
+        self._head_file.truncate(0)
+        self.head_rows = 0
+
+    def read(self, start=None, end=None, columns=COLUMNS):
+        """Column arrays for rows with start <= ts < end, sorted by time"""
+        start = np.iinfo(np.int64).min if start is None else start
+        end = np.iinfo(np.int64).max if end is None else end
+        parts = {name: [] for name in columns}
+        with self.lock:
+            for number in sorted(self.chunks):
+                if (number + 1) * self.chunk_us <= start or number * self.chunk_us >= end:
+                    continue
+                chunk = self.chunks[number]
+                index = chunk.index
+                for block in np.flatnonzero((index["ts_max"] >= start) & (index["ts_min"] < end)):
+                    ts = chunk.column(block, "ts")
+                    whole = index[block]["ts_min"] >= start and index[block]["ts_max"] < end
+                    mask = slice(None) if whole else (ts >= start) & (ts < end)
+                    for name in columns:
+                        parts[name].append(chunk.column(block, name)[mask])
+            head = self.head[:self.head_rows]
+            mask = (head["ts"] >= start) & (head["ts"] < end)
+            for name in columns:
+                parts[name].append(head[name][mask])
+
+        result = {name: np.concatenate(arrays) for name, arrays in parts.items()}
+        if "ts" in result and len(result["ts"]) > 1 and np.any(result["ts"][1:] < result["ts"][:-1]):
+            order = np.argsort(result["ts"], kind="stable")
+            result = {name: values[order] for name, values in result.items()}
+        return result
+
+    def chunk_ranges(self, start=None, end=None):
+        """(start, end) of every chunk period holding data in the range, oldest first"""
+        numbers = set(self.chunks)
+        with self.lock:
+            if self.head_rows:
+                numbers.update(int(n) for n in np.unique(self.head["ts"][:self.head_rows] // self.chunk_us))
+        ranges = []
+        for number in sorted(numbers):
+            low, high = number * self.chunk_us, (number + 1) * self.chunk_us
+            if (end is None or low < end) and (start is None or high > start):
+                ranges.append((low if start is None else max(low, start), high if end is None else min(high, end)))
+        return ranges
+
+    def stored_seqs(self, low, high):
+        """Sequence numbers in [low, high] already stored"""
+        found = []
+        with self.lock:
+            for chunk in self.chunks.values():
+                index = chunk.index
+                for block in np.flatnonzero((index["seq_max"] >= low) & (index["seq_min"] <= high)):
+                    seq = chunk.column(block, "seq")
+                    found.append(seq[(seq >= low) & (seq <= high)])
+            seq = self.head["seq"][:self.head_rows]
+            found.append(seq[(seq >= low) & (seq <= high)])
+        return set(np.concatenate(found).tolist())
+
+    def compact(self):
+        """Compact fragmented chunks; returns how many were rewritten"""
+        rewritten = 0
+        with self.lock:
+            for number, chunk in list(self.chunks.items()):
+                if chunk.needs_compaction(self.block_rows):
+                    self.chunks[number] = chunk.compact(self.block_rows)
+                    rewritten += 1
+        return rewritten
+
+    def close(self):
+        self._head_file.close()
+
+
+class ColumnarStore:
+    """Series for every device under one directory"""
+
+    def __init__(self, path=TSDB_PATH, block_rows=TSDB_BLOCK_ROWS, chunk_days=TSDB_CHUNK_DAYS):
+        self.path = path
+        self.block_rows = block_rows
+        self.chunk_days = chunk_days
+        self._series = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if os.path.isdir(os.path.join(path, name)):
+                self._open(unquote(name))
+
+    def _open(self, device_id):
+        series = Series(os.path.join(self.path, quote(device_id, safe="")), self.block_rows, self.chunk_days)
+        self._series[device_id] = series
+        return series
+
+    def series(self, device_id, create=False):
+        series = self._series.get(device_id)
+        if series is None and create:
+            with self._lock:
+                series = self._series.get(device_id) or self._open(device_id)
+        return series
+
+    def devices(self):
+        return sorted(self._series)
+
+    def append(self, device_id, records):
+        self.series(device_id, create=True).append(records)
+
+    def compact(self):
+        return sum(series.compact() for series in list(self._series.values()))
+
+    def close(self):
+        for series in self._series.values():
+            series.close()
@@ -0,0 +1,142 @@
+# validation.py
+"""
+Ingest-time validation and sensor-fault detection.
+
+Every reading is checked before it is written to the database:
+
+- sentinel: the sketch initialises every register to 255 and only
+  overwrites it when `readHoldingRegisters` succeeds, so a failed read
+  arrives as 255 (N, P, K, EC) or 255 scaled by the sketch (pH 2.55,
+  humidity 25.5, temperature 25.5). Because 255 / 25.5 are also valid
+  readings on their own, a reading is only treated as a sentinel failure
+  when at least SENTINEL_MIN_FIELDS fields carry their sentinel at once.
+- range: values outside the sensor's measuring range (7-in-1 soil sensor
+  datasheet limits) cannot be real.
+- stuck: a sensor whose Modbus side has frozen repeats the exact same
+  seven values; STUCK_READINGS identical readings in a row is a fault.
+
+Checks run vectorized with NumPy over a batch of readings (a single POST
+is a batch of one) and keep per-device state and fault counters in memory.
+"""
+import os
+import threading
+from collections import Counter, deque
+
+import numpy as np
+
+from metrics import metrics
+from models import SENSOR_FIELDS as FIELDS
+
+# Raw register sentinel (255) after the sketch's scaling of each field
+SENTINELS = np.array([255, 255, 255, 2.55, 255, 25.5, 25.5])
+
+# Sensor measuring ranges (inclusive)
+RANGES = {
+    "nitrogen": (0, 1999),
+    "phosphorus": (0, 1999),
+    "potassium": (0, 1999),
+    "ph": (3.0, 9.0),
+    "ec": (0, 20000),
+    "humidity": (0, 100),
+    "temperature": (-40, 80),
+}
+_LOW = np.array([RANGES[f][0] for f in FIELDS], dtype=float)
+_HIGH = np.array([RANGES[f][1] for f in FIELDS], dtype=float)
+
+SENTINEL_MIN_FIELDS = int(os.getenv("SENTINEL_MIN_FIELDS", "2"))
+STUCK_READINGS = int(os.getenv("STUCK_READINGS", "120"))  # 10 minutes at one reading per 5 s
+QUARANTINE_SIZE = int(os.getenv("QUARANTINE_SIZE", "500"))
+
+
+class ValidationResult:
+    """Outcome of validating a batch: a boolean mask plus reasons per rejected row"""
+
+    def __init__(self, accepted, reasons):
+        self.accepted = accepted    # np.ndarray[bool], one entry per reading
+        self.reasons = reasons      # {row index: [reason, ...]} for faulty rows
+
+    @property
+    def all_accepted(self):
+        return bool(self.accepted.all())
+
+
+class SensorValidator:
+    """Validate readings and keep per-device fault state"""
+
+    def __init__(self, sentinel_min_fields=SENTINEL_MIN_FIELDS, stuck_readings=STUCK_READINGS,
+                 quarantine_size=QUARANTINE_SIZE):
+        self.sentinel_min_fields = sentinel_min_fields
+        self.stuck_readings = stuck_readings
+        self._lock = threading.Lock()
+        self._last = {}          # device -> last raw value vector
+        self._repeats = {}       # device -> length of the current identical run
+        self._faults = {}        # device -> Counter(reason -> count)
+        self.quarantine = deque(maxlen=quarantine_size)
+
+    def validate(self, device_id, readings):
+        """
+        Validate a list of reading dicts from one device, in arrival order.
+        """
+        values = np.array([[r[f] for f in FIELDS] for r in readings], dtype=float).reshape(-1, len(FIELDS))
+        n = len(values)
+
+        sentinel = (np.isclose(values, SENTINELS)).sum(axis=1) >= self.sentinel_min_fields
+        out_of_range = ((values < _LOW) | (values > _HIGH)).any(axis=1)
+
+        with self._lock:
+            stuck = self._stuck_mask(device_id, values)
+
+        faulty = sentinel | out_of_range | stuck
+        reasons = {}
+        for i in np.flatnonzero(faulty):
+            row_reasons = []
+            if sentinel[i]:
+                row_reasons.append("sentinel")
+            if out_of_range[i]:
+                bad = (values[i] < _LOW) | (values[i] > _HIGH)
+                row_reasons.extend(f"out_of_range:{FIELDS[j]}" for j in np.flatnonzero(bad))
+            if stuck[i]:
+                row_reasons.append("stuck")
+            reasons[int(i)] = row_reasons
+
+        if reasons:
+            self._record_faults(device_id, readings, reasons)
+        metrics.inc("readings_validated", n)
+        return ValidationResult(~faulty, reasons)
+
+    def _stuck_mask(self, device_id, values):
+        """Flag rows that extend a run of identical readings past the limit"""
+        n = len(values)
+        previous = self._last.get(device_id)
+        same = np.empty(n, dtype=bool)
+        # NaN (a sensor the node does not have) counts as unchanged
+        same[0] = previous is not None and np.array_equal(values[0], previous, equal_nan=True)
+        if n > 1:
+            same[1:] = ((values[1:] == values[:-1]) | (np.isnan(values[1:]) & np.isnan(values[:-1]))).all(axis=1)
+
+        # Run length at each row: distance to the last row that broke the run
+        positions = np.arange(n)
+        last_break = np.maximum.accumulate(np.where(same, -1, positions))
+        carried = self._repeats.get(device_id, 0)
+        runs = np.where(last_break >= 0, positions - last_break + 1, positions + 1 + carried)
+
+        self._last[device_id] = values[-1].copy()
+        self._repeats[device_id] = int(runs[-1])
+        return runs >= self.stuck_readings
+
+    def _record_faults(self, device_id, readings, reasons):
+        with self._lock:
+            counter = self._faults.setdefault(device_id, Counter())
+            for index, row_reasons in reasons.items():
+                for reason in row_reasons:
+                    counter[reason.split(":")[0]] += 1
+                    metrics.inc("readings_faulty", reason=reason.split(":")[0])
+                self.quarantine.append({"device_id": device_id, "reasons": row_reasons, "reading": readings[index]})
+
+    def fault_counts(self):
+        with self._lock:
+            return {device: dict(counter) for device, counter in self._faults.items()}
+
+    def recent_quarantine(self, limit=50):
+        with self._lock:
+            return list(self.quarantine)[-limit:]
@@ -0,0 +1,91 @@
+# window.py
+"""
+Recent-readings window served to dashboards.
+
+Each device gets a fixed-size ring buffer of preallocated NumPy columns
+(timestamp, one per sensor field, relay). Appending overwrites the oldest
+slot in O(1), memory is fixed at start-up, and `GET /window` returns the
+requested time span as column arrays that the dashboard turns into a
+DataFrame in one step. Because the window lives on the server, every
+browser tab sees the same full history immediately.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from models import SENSOR_FIELDS
+
+WINDOW_CAPACITY = int(os.getenv("WINDOW_CAPACITY", "1440"))  # readings per device (2 h at 5 s)
+WINDOW_MAX_DEVICES = int(os.getenv("WINDOW_MAX_DEVICES", "1000"))
+
+
+class RingBuffer:
+    """Fixed-capacity columnar buffer of one device's readings"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype="datetime64[ms]")
+        self.values = np.zeros((capacity, len(SENSOR_FIELDS)), dtype=np.float64)
+        self.relay = np.zeros(capacity, dtype=np.int8)
+        self.head = 0   # next slot to write
+        self.size = 0
+
+    def append(self, reading):
+        slot = self.head
+        self.timestamps[slot] = np.datetime64(reading["timestamp"], "ms")
+        self.values[slot] = [reading[field] for field in SENSOR_FIELDS]
+        self.relay[slot] = str(reading.get("relay", "")).upper() == "ON"
+        self.head = (slot + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def since(self, cutoff):
+        """Column arrays for readings at or after `cutoff`, oldest first"""
+        if self.size < self.capacity:
+            order = np.arange(self.size)
+        else:
+            order = np.roll(np.arange(self.capacity), -self.head)
+        order = order[self.timestamps[order] >= cutoff]
+        # Late store-and-forward readings can arrive out of order
+        order = order[np.argsort(self.timestamps[order], kind="stable")]
+        columns = {"timestamp": self.timestamps[order]}
+        for i, field in enumerate(SENSOR_FIELDS):
+            columns[field] = self.values[order, i]
+        columns["relay_on"] = self.relay[order]
+        return columns
+
+
+class WindowStore:
+    """Ring buffers for the most recently active devices"""
+
+    def __init__(self, capacity=WINDOW_CAPACITY, max_devices=WINDOW_MAX_DEVICES):
+        self.capacity = capacity
+        self.max_devices = max_devices
+        self._buffers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def append(self, device_id, rows):
+        with self._lock:
+            buffer = self._buffers.get(device_id)
+            if buffer is None:
+                if len(self._buffers) >= self.max_devices:
+                    self._buffers.popitem(last=False)
+                buffer = self._buffers[device_id] = RingBuffer(self.capacity)
+            else:
+                self._buffers.move_to_end(device_id)
+            for row in rows:
+                buffer.append(row)
+
+    def window(self, device_id, seconds, now):
+        """Columns for the last `seconds` before `now`, or None for an unknown device"""
+        cutoff = np.datetime64(now, "ms") - np.timedelta64(int(seconds * 1000), "ms")
+        with self._lock:
+            buffer = self._buffers.get(device_id)
+            if buffer is None:
+                return None
+            return buffer.since(cutoff)
+
+    def devices(self):
+        with self._lock:
+            return list(self._buffers)